@@ -0,0 +1,126 @@
+import datetime
+
+from config import DB_PATH
+from database.connection import get_connection_manager
+from database.migrations import LIBRARY_STATS_DIMENSIONS, rebuild_library_stats
+
+# Верхняя граница дня, если период не ограничен сверху
+_MAX_DAY = "9999-12-31"
+
+
+def _day(value):
+    """
+    День в формате базы (ГГГГ-ММ-ДД) из date, datetime или строки.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+def window_start(days):
+    """
+    Первый день периода «последние days дней» (включая сегодня).
+    """
+    return datetime.date.today() - datetime.timedelta(days=days - 1)
+
+
+class LibraryAnalyzer:
+    """
+    Отчёты по скачанной библиотеке: топ артистов и жанров, распределение по годам выпуска.
+
+    Данные берутся из сводных таблиц library_stats (за всё время) и library_stats_daily
+    (по дням завершения загрузки), которые поддерживаются триггерами базы.
+    Поэтому отчёт читает десятки строк сводки, а не всю таблицу треков.
+    Периоды задаются since/until (date или «ГГГГ-ММ-ДД», оба включительно).
+    Значение None в результатах — артист, жанр или год не указаны.
+    """
+
+    def __init__(self, db_name=DB_PATH):
+        self.pool = get_connection_manager(db_name)
+
+    @property
+    def connection(self):
+        return self.pool.connection()
+
+    def top(self, dimension, limit=10, since=None, until=None):
+        """
+        Самые частые значения измерения (artist, genre, year): список (значение, количество треков).
+        """
+        if dimension not in LIBRARY_STATS_DIMENSIONS:
+            raise ValueError(f"Неизвестное измерение статистики: {dimension}")
+        if since is None and until is None:
+            rows = self.connection.execute("""
+                SELECT value, tracks FROM library_stats
+                WHERE dimension = ?
+                ORDER BY tracks DESC
+                LIMIT ?
+            """, (dimension, limit)).fetchall()
+        else:
+            # Без подсказки SQLite выбирает первичный ключ ради GROUP BY и читает все дни измерения
+            rows = self.connection.execute("""
+                SELECT value, SUM(tracks) AS tracks FROM library_stats_daily INDEXED BY idx_library_stats_daily_day
+                WHERE dimension = ? AND day BETWEEN ? AND ?
+                GROUP BY value
+                ORDER BY tracks DESC
+                LIMIT ?
+            """, (dimension, _day(since) or "", _day(until) or _MAX_DAY, limit)).fetchall()
+        return [(row["value"] or None, row["tracks"]) for row in rows]
+
+    def top_artists(self, limit=10, since=None, until=None):
+        return self.top("artist", limit, since, until)
+
+    def top_genres(self, limit=10, since=None, until=None):
+        return self.top("genre", limit, since, until)
+
+    def by_year(self, since=None, until=None):
+        """
+        Количество треков по годам выпуска, по возрастанию года; треки без года — в конце.
+        """
+        years = self.top("year", -1, since, until)
+        return sorted(
+            ((int(year) if year else None, tracks) for year, tracks in years),
+            key=lambda item: (item[0] is None, item[0] or 0)
+        )
+
+    def total_tracks(self, since=None, until=None):
+        """
+        Количество скачанных треков за период (у каждого трека ровно один артист в сводке).
+        """
+        if since is None and until is None:
+            row = self.connection.execute(
+                "SELECT COALESCE(SUM(tracks), 0) FROM library_stats WHERE dimension = 'artist'"
+            ).fetchone()
+        else:
+            row = self.connection.execute("""
+                SELECT COALESCE(SUM(tracks), 0) FROM library_stats_daily
+                WHERE dimension = 'artist' AND day BETWEEN ? AND ?
+            """, (_day(since) or "", _day(until) or _MAX_DAY)).fetchone()
+        return row[0]
+
+    def daily_counts(self, since=None, until=None):
+        """
+        Сколько треков скачано в каждый день периода: список (день, количество).
+        """
+        rows = self.connection.execute("""
+            SELECT day, SUM(tracks) AS tracks FROM library_stats_daily
+            WHERE dimension = 'artist' AND day BETWEEN ? AND ?
+            GROUP BY day
+            ORDER BY day
+        """, (_day(since) or "", _day(until) or _MAX_DAY)).fetchall()
+        return [(row["day"], row["tracks"]) for row in rows]
+
+    def rebuild(self):
+        """
+        Пересчитывает сводку по всей таблице треков. Нужен только для восстановления
+        после ручной правки базы: в обычной работе сводку обновляют триггеры.
+        """
+        conn = self.connection
+        try:
+            rebuild_library_stats(conn.cursor())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print("Статистика библиотеки пересчитана")
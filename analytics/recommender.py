@@ -0,0 +1,341 @@
+import os
+import sqlite3
+
+import numpy as np
+
+from config import DB_PATH, RECOMMENDER_CACHE_PATH, RECOMMENDER_BATCH, RECOMMENDER_SESSION_WEIGHT
+from database.connection import get_connection_manager
+
+# Версия формата кэша: при изменении старый кэш пересобирается
+CACHE_VERSION = 1
+
+_FULL_BUILD_SQL = """
+    SELECT COALESCE(artist, ''), COALESCE(genre, ''), date(completed_at), 1
+    FROM downloaded_tracks WHERE status = 'complete'
+"""
+
+
+class Vocabulary:
+    """
+    Соответствие строк (артистов, жанров, дней) индексам строк и столбцов матриц.
+    """
+
+    def __init__(self, names=()):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def encode(self, values):
+        """
+        Индексы для массива строк; новые строки добавляются в словарь.
+        Словарь обходится только по уникальным значениям, а не по всем строкам.
+        """
+        unique, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        codes = np.empty(len(unique), dtype=np.int64)
+        for i, name in enumerate(unique.tolist()):
+            code = self.index.get(name)
+            if code is None:
+                code = self.index[name] = len(self.names)
+                self.names.append(name)
+            codes[i] = code
+        return codes[inverse]
+
+    def to_array(self):
+        return np.array(self.names, dtype=str)
+
+
+class SparseCounts:
+    """
+    Разреженная матрица счётчиков в координатном виде (строки, столбцы, значения).
+    Изменения применяются пакетом: тройки дописываются и суммируются по совпадающим ячейкам.
+    """
+
+    def __init__(self, rows=None, cols=None, vals=None):
+        self.rows = np.zeros(0, dtype=np.int64) if rows is None else rows.astype(np.int64)
+        self.cols = np.zeros(0, dtype=np.int64) if cols is None else cols.astype(np.int64)
+        self.vals = np.zeros(0, dtype=np.float64) if vals is None else vals.astype(np.float64)
+
+    def add(self, rows, cols, deltas):
+        rows = np.concatenate([self.rows, rows])
+        cols = np.concatenate([self.cols, cols])
+        vals = np.concatenate([self.vals, deltas])
+        if not len(rows):
+            return
+        width = int(cols.max()) + 1
+        cells, inverse = np.unique(rows * width + cols, return_inverse=True)
+        sums = np.bincount(inverse, weights=vals, minlength=len(cells))
+        keep = sums > 0
+        self.rows = cells[keep] // width
+        self.cols = cells[keep] % width
+        self.vals = sums[keep]
+
+    def row_norms(self, n_rows):
+        return np.sqrt(np.bincount(self.rows, weights=self.vals ** 2, minlength=n_rows))
+
+    def row_sums(self, n_rows):
+        return np.bincount(self.rows, weights=self.vals, minlength=n_rows)
+
+
+def _normalized(matrix, n_rows, weight):
+    """
+    Строки матрицы, приведённые к единичной длине и умноженные на sqrt(weight):
+    скалярное произведение таких строк — взвешенный косинус сходства.
+    """
+    norms = matrix.row_norms(n_rows)
+    scale = np.divide(np.sqrt(weight), norms, out=np.zeros_like(norms), where=norms > 0)
+    return matrix.rows, matrix.cols, matrix.vals * scale[matrix.rows]
+
+
+def _matvec(rows, cols, vals, vector, n_rows):
+    """
+    Произведение разреженной матрицы на вектор.
+    """
+    return np.bincount(rows, weights=vals * vector[cols], minlength=n_rows)
+
+
+def _matmat(rows, cols, vals, dense, n_rows):
+    """
+    Произведение разреженной матрицы на плотную (столбцы — отдельные запросы).
+    """
+    result = np.zeros((n_rows, dense.shape[1]))
+    np.add.at(result, rows, vals[:, None] * dense[cols])
+    return result
+
+
+class Recommender:
+    """
+    Рекомендации по скачанной библиотеке: какие артисты близки к основному вкусу,
+    но пока представлены немногими треками, и что стоит поискать.
+
+    Строятся две разреженные матрицы: артист × жанр (количество треков) и артист × день загрузки
+    (артисты, скачанные в один день, считаются совместно встречающимися). Сходство артистов —
+    взвешенная сумма косинусов по этим матрицам, считается векторно в NumPy без обхода строк.
+
+    Матрицы хранятся в npz-кэше. Изменения библиотеки триггеры пишут в таблицу library_changes,
+    поэтому при обновлении к кэшу применяются только новые записи журнала.
+    """
+
+    def __init__(self, db_name=DB_PATH, cache_path=RECOMMENDER_CACHE_PATH,
+                 session_weight=RECOMMENDER_SESSION_WEIGHT, batch_size=RECOMMENDER_BATCH):
+        self.pool = get_connection_manager(db_name)
+        self.cache_path = cache_path
+        self.session_weight = session_weight
+        self.batch_size = batch_size
+        self.artists = Vocabulary()
+        self.genres = Vocabulary()
+        self.days = Vocabulary()
+        self.artist_genre = SparseCounts()
+        self.artist_day = SparseCounts()
+        self.last_seq = 0
+        self._loaded = False
+        self._features = None  # Нормированные признаки артистов, сбрасываются при изменениях
+
+    @property
+    def connection(self):
+        return self.pool.connection()
+
+    def refresh(self):
+        """
+        Приводит матрицы в соответствие с базой: загружает кэш (или строит матрицы заново)
+        и применяет новые записи журнала изменений. Возвращает количество учтённых треков или записей журнала.
+        """
+        if not self._loaded:
+            self._loaded = self._load_cache()
+            if not self._loaded:
+                applied = self._full_build()
+                self._loaded = True
+                self._save_cache()
+                return applied
+
+        rows = self.connection.execute(
+            "SELECT seq, artist, genre, day, delta FROM library_changes WHERE seq > ? ORDER BY seq",
+            (self.last_seq,)
+        ).fetchall()
+        if not rows:
+            return 0
+        seqs, artists, genres, days, deltas = zip(*rows)
+        self._apply(artists, genres, days, deltas)
+        self.last_seq = max(seqs)
+        self._save_cache()
+        return len(rows)
+
+    def recommend_artists(self, k=10):
+        """
+        Артисты из библиотеки, близкие к общему вкусу, но с небольшим количеством треков:
+        список (артист, оценка) по убыванию оценки.
+        """
+        self.refresh()
+        rows, cols, vals, n_artists, known = self._feature_matrix()
+        if not known.any():
+            return []
+        counts = self.artist_genre.row_sums(n_artists)
+
+        # Вкус — сумма признаков всех артистов с весом log(1 + треков)
+        taste = np.bincount(cols, weights=vals * (np.log1p(counts) * known)[rows], minlength=self._n_features())
+        taste_norm = np.linalg.norm(taste)
+        if not taste_norm:
+            return []
+        similarity = _matvec(rows, cols, vals, taste / taste_norm, n_artists)
+        # Чем меньше треков артиста уже скачано, тем интереснее его предложить
+        scores = np.where(known & (counts > 0), similarity / np.sqrt(np.maximum(counts, 1)), -np.inf)
+        return self._top(scores, k, self.artists)
+
+    def similar_artists(self, names, k=10):
+        """
+        Похожие артисты для каждого из names: словарь имя -> список (артист, сходство).
+        Запросы обрабатываются пакетами по batch_size.
+        """
+        self.refresh()
+        rows, cols, vals, n_artists, known = self._feature_matrix()
+        seeds = [self.artists.index[name] for name in names if name in self.artists.index]
+        result = {name: [] for name in names}
+        if not seeds:
+            return result
+
+        # Транспонированная матрица признаков: столбец запроса = признаки артиста-образца
+        for start in range(0, len(seeds), self.batch_size):
+            batch = np.array(seeds[start:start + self.batch_size])
+            selected = np.zeros((n_artists, len(batch)))
+            selected[batch, np.arange(len(batch))] = 1.0
+            seed_features = _matmat(cols, rows, vals, selected, self._n_features())
+            similarity = _matmat(rows, cols, vals, seed_features, n_artists)
+            similarity[batch, np.arange(len(batch))] = -np.inf
+            similarity[~known] = -np.inf
+            for column, seed in enumerate(batch):
+                result[self.artists.names[seed]] = self._top(similarity[:, column], k, self.artists)
+        return result
+
+    def recommend_queries(self, k=10):
+        """
+        Поисковые запросы для пополнения библиотеки: рекомендованные артисты и любимые жанры.
+        """
+        artists = [artist for artist, _ in self.recommend_artists(k)]
+        n_artists = len(self.artists)
+        weights = np.log1p(self.artist_genre.row_sums(n_artists))
+        genre_scores = np.bincount(
+            self.artist_genre.cols,
+            weights=self.artist_genre.vals * weights[self.artist_genre.rows],
+            minlength=len(self.genres)
+        )
+        if "" in self.genres.index:
+            genre_scores[self.genres.index[""]] = -np.inf
+        genres = [genre for genre, _ in self._top(genre_scores, max(1, k // 3), self.genres)]
+        queries = []
+        for query in genres + artists:
+            if query not in queries:
+                queries.append(query)
+        return queries[:k]
+
+    def _apply(self, artists, genres, days, deltas):
+        artist_codes = self.artists.encode(artists)
+        genre_codes = self.genres.encode(genres)
+        day_codes = self.days.encode(days)
+        deltas = np.asarray(deltas, dtype=np.float64)
+        self.artist_genre.add(artist_codes, genre_codes, deltas)
+        self.artist_day.add(artist_codes, day_codes, deltas)
+        self._features = None
+
+    def _full_build(self):
+        conn = self.connection
+        # Снимок таблицы и номер последней записи журнала читаются в одной транзакции,
+        # иначе изменение между запросами было бы учтено дважды
+        in_transaction = conn.in_transaction
+        if not in_transaction:
+            conn.execute("BEGIN")
+        try:
+            self.last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM library_changes").fetchone()[0]
+            rows = conn.execute(_FULL_BUILD_SQL).fetchall()
+        finally:
+            if not in_transaction:
+                conn.commit()
+        self.artists, self.genres, self.days = Vocabulary(), Vocabulary(), Vocabulary()
+        self.artist_genre, self.artist_day = SparseCounts(), SparseCounts()
+        if rows:
+            self._apply(*zip(*rows))
+        print(f"Матрицы рекомендаций построены: артистов {len(self.artists)}, жанров {len(self.genres)}")
+        return len(rows)
+
+    def _n_features(self):
+        return len(self.genres) + len(self.days)
+
+    def _feature_matrix(self):
+        """
+        Признаки артистов: нормированные строки «артист × жанр» и «артист × день» рядом,
+        так что скалярное произведение — взвешенная сумма двух косинусов.
+        Возвращает (строки, столбцы, значения, число артистов, маска известных артистов).
+        """
+        if self._features is None:
+            n_artists = len(self.artists)
+            genre_part = _normalized(self.artist_genre, n_artists, 1.0 - self.session_weight)
+            day_part = _normalized(self.artist_day, n_artists, self.session_weight)
+            unknown_genre = self.genres.index.get("")
+            if unknown_genre is not None:
+                # Отсутствие жанра не делает артистов похожими
+                keep = genre_part[1] != unknown_genre
+                genre_part = tuple(part[keep] for part in genre_part)
+            known = np.ones(n_artists, dtype=bool)
+            if "" in self.artists.index:
+                known[self.artists.index[""]] = False
+            self._features = (
+                np.concatenate([genre_part[0], day_part[0]]),
+                np.concatenate([genre_part[1], day_part[1] + len(self.genres)]),
+                np.concatenate([genre_part[2], day_part[2]]),
+                n_artists,
+                known
+            )
+        return self._features
+
+    @staticmethod
+    def _top(scores, k, vocabulary):
+        candidates = np.flatnonzero(np.isfinite(scores) & (scores > 0))
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(vocabulary.names[i], float(scores[i])) for i in candidates]
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return False
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                if int(data["version"]) != CACHE_VERSION:
+                    return False
+                self.artists = Vocabulary(data["artists"].tolist())
+                self.genres = Vocabulary(data["genres"].tolist())
+                self.days = Vocabulary(data["days"].tolist())
+                self.artist_genre = SparseCounts(data["ag_rows"], data["ag_cols"], data["ag_vals"])
+                self.artist_day = SparseCounts(data["ad_rows"], data["ad_cols"], data["ad_vals"])
+                self.last_seq = int(data["last_seq"])
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Кэш рекомендаций повреждён, матрицы будут построены заново: {e}")
+            return False
+        self._features = None
+        return True
+
+    def _save_cache(self):
+        temp_path = self.cache_path + ".tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                np.savez_compressed(
+                    file,
+                    version=CACHE_VERSION,
+                    last_seq=self.last_seq,
+                    artists=self.artists.to_array(),
+                    genres=self.genres.to_array(),
+                    days=self.days.to_array(),
+                    ag_rows=self.artist_genre.rows, ag_cols=self.artist_genre.cols, ag_vals=self.artist_genre.vals,
+                    ad_rows=self.artist_day.rows, ad_cols=self.artist_day.cols, ad_vals=self.artist_day.vals,
+                )
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"Не удалось сохранить кэш рекомендаций: {e}")
+            return
+
+        # Применённые записи журнала больше не нужны
+        try:
+            self.connection.execute("DELETE FROM library_changes WHERE seq <= ?", (self.last_seq,))
+            self.connection.commit()
+        except sqlite3.Error as e:
+            print(f"Не удалось очистить журнал изменений библиотеки: {e}")
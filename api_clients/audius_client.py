@@ -0,0 +1,102 @@
+import threading
+
+import requests
+
+from config import AUDIUS_APP_NAME
+from api_clients.http_client import get_api_client
+from api_clients.providers import SearchProvider, ProviderPage
+
+# Список узлов Audius отдаёт сервис обнаружения, запросы идут к одному из узлов
+DISCOVERY_URL = "https://api.audius.co"
+
+_host = None
+_host_lock = threading.Lock()
+
+
+def get_api_host(refresh=False):
+    """
+    Адрес узла Audius API (выбирается один раз, при ошибке — заново).
+    """
+    global _host
+    with _host_lock:
+        if _host is None or refresh:
+            response = get_api_client().get(DISCOVERY_URL)
+            response.raise_for_status()
+            hosts = response.json().get("data") or []
+            if not hosts:
+                raise requests.RequestException("Сервис обнаружения Audius не вернул ни одного узла")
+            _host = hosts[0]
+        return _host
+
+
+def search_tracks(query: str, limit: int = 20):
+    params = {"query": query, "app_name": AUDIUS_APP_NAME, "limit": limit}
+    for refresh in (False, True):
+        try:
+            host = get_api_host(refresh)
+            response = get_api_client().get(f"{host}/v1/tracks/search", params=params)
+            response.raise_for_status()
+            return response.json().get("data", [])
+        except requests.RequestException as e:
+            # Узел мог выйти из строя — пробуем один раз с другим узлом
+            print(f"Ошибка при поиске треков в Audius: {e}")
+    return []
+
+
+def stream_url(host: str, track_id: str):
+    """
+    Ссылка на полный mp3-поток трека (сервер перенаправляет на контент-узел).
+    """
+    return f"{host}/v1/tracks/{track_id}/stream?app_name={AUDIUS_APP_NAME}"
+
+
+def get_track(track_id: str):
+    """
+    Трек по ID в формате ответа поиска или None.
+    """
+    try:
+        host = get_api_host()
+        response = get_api_client().get(f"{host}/v1/tracks/{track_id}", params={"app_name": AUDIUS_APP_NAME})
+        response.raise_for_status()
+        return response.json().get("data")
+    except requests.RequestException as e:
+        print(f"Ошибка получения трека Audius {track_id}: {e}")
+        return None
+
+
+class AudiusProvider(SearchProvider):
+    name = "audius"
+    label = "Audius"
+
+    def search(self, query, limit=20):
+        return ProviderPage(self, self.convert(search_tracks(query, limit)))
+
+    def lookup(self, track_id):
+        track = get_track(track_id)
+        hits = self.convert([track]) if track else []
+        return hits[0] if hits else None
+
+    def convert(self, payload):
+        if not payload:
+            return []
+        host = get_api_host()
+        hits = []
+        for track in payload:
+            if not track.get("is_streamable", True):
+                continue
+            user = track.get("user") or {}
+            artwork = track.get("artwork") or {}
+            date = track.get("release_date") or ""
+            hits.append({
+                "title": track.get("title") or "Без названия",
+                "artist": user.get("name") or user.get("handle") or "Unknown Artist",
+                "album": None,
+                "genre": track.get("genre") or None,
+                "release_year": int(date[:4]) if date[:4].isdigit() else None,
+                "artwork_url": artwork.get("480x480") or artwork.get("1000x1000"),
+                "source": self.name,
+                # Префикс источника: ID разных сервисов не должны совпадать в базе
+                "track_id": f"audius:{track['id']}",
+                "stream_url": stream_url(host, track["id"]),
+            })
+        return hits
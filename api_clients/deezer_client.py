@@ -0,0 +1,55 @@
+import requests
+
+from api_clients.http_client import get_api_client
+from api_clients.providers import SearchProvider, ProviderPage
+
+BASE_URL = "https://api.deezer.com"
+
+
+def search_tracks(query: str, limit: int = 20):
+    try:
+        response = get_api_client().get(f"{BASE_URL}/search", params={"q": query, "limit": limit})
+        response.raise_for_status()
+        data = response.json()
+        if "error" in data:
+            # Deezer сообщает об ошибках в теле ответа с кодом 200
+            print(f"Ошибка при поиске треков в Deezer: {data['error'].get('message')}")
+            return []
+        return data.get("data", [])
+    except requests.RequestException as e:
+        print(f"Ошибка при поиске треков в Deezer: {e}")
+        return []
+
+
+class DeezerProvider(SearchProvider):
+    """
+    Deezer отдаёт только 30-секундные превью: треки можно послушать, но не скачать.
+    Зато у него точные альбомы и обложки — при совпадении с другим источником они дополняют метаданные.
+    """
+
+    name = "deezer"
+    label = "Deezer"
+    downloadable = False
+
+    def search(self, query, limit=20):
+        return ProviderPage(self, self.convert(search_tracks(query, limit)))
+
+    def convert(self, payload):
+        hits = []
+        for track in payload:
+            if not track.get("preview"):
+                continue
+            artist = track.get("artist") or {}
+            album = track.get("album") or {}
+            hits.append({
+                "title": track.get("title") or "Без названия",
+                "artist": artist.get("name") or "Unknown Artist",
+                "album": album.get("title"),
+                "genre": None,
+                "release_year": None,
+                "artwork_url": album.get("cover_big"),
+                "source": self.name,
+                "track_id": f"deezer:{track['id']}",
+                "stream_url": track["preview"],
+            })
+        return hits
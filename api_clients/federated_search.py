@@ -0,0 +1,187 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+from config import SEARCH_PROVIDERS, SEARCH_DEADLINE
+from api_clients.providers import normalize_key
+from api_clients.soundcloud_client import SoundCloudProvider
+from api_clients.audius_client import AudiusProvider
+from api_clients.deezer_client import DeezerProvider
+from monitoring.metrics import get_metrics
+
+PROVIDER_CLASSES = {
+    SoundCloudProvider.name: SoundCloudProvider,
+    AudiusProvider.name: AudiusProvider,
+    DeezerProvider.name: DeezerProvider,
+}
+
+
+def build_providers(names=SEARCH_PROVIDERS):
+    """
+    Включённые источники поиска в порядке приоритета.
+    """
+    return [PROVIDER_CLASSES[name]() for name in names if name in PROVIDER_CLASSES]
+
+
+class SearchRun:
+    """
+    Один федеративный поиск: запросы ко всем источникам уже отправлены параллельно.
+    Ответы забираются по мере готовности — collect() без ожидания (для GUI) или pages() с ожиданием.
+    Источники, не ответившие до общего срока, пропускаются.
+    """
+
+    def __init__(self, query, futures, deadline):
+        self.query = query
+        self._futures = futures  # Future -> провайдер
+        self.deadline = deadline  # time.monotonic(), после которого ответы не ждём
+        self.failed = []  # Названия источников, ответивших ошибкой
+        self.timed_out = []  # Названия источников, не успевших к сроку
+
+    @property
+    def finished(self):
+        return not self._futures
+
+    def collect(self):
+        """
+        Страницы источников, ответивших с прошлого вызова. Не блокирует.
+        """
+        pages = [self._take(future) for future in list(self._futures) if future.done()]
+        if self._futures and time.monotonic() >= self.deadline:
+            self._expire()
+        return [page for page in pages if page is not None]
+
+    def pages(self):
+        """
+        Генератор страниц по мере ответа источников, с ожиданием не дольше общего срока.
+        """
+        try:
+            for future in as_completed(list(self._futures), timeout=max(0, self.deadline - time.monotonic())):
+                page = self._take(future)
+                if page is not None:
+                    yield page
+        except TimeoutError:
+            self._expire()
+
+    def cancel(self):
+        for future in self._futures:
+            future.cancel()
+        self._futures.clear()
+
+    def _take(self, future):
+        provider = self._futures.pop(future)
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"Источник {provider.label} не ответил: {e}")
+            self.failed.append(provider.label)
+            return None
+
+    def _expire(self):
+        for future, provider in list(self._futures.items()):
+            # Запрос доработает в фоне, но его результат уже не нужен
+            future.cancel()
+            self.timed_out.append(provider.label)
+            get_metrics().inc(f"search.{provider.name}.timeouts")
+            print(f"Источник {provider.label} не успел ответить за отведённое время")
+        self._futures.clear()
+
+
+class FederatedSearch:
+    """
+    Параллельный поиск по нескольким источникам под общим сроком.
+    """
+
+    # Общий пул на все поиски: запрос к каждому источнику — одна задача
+    WORKERS = 8
+    _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="federated-search")
+
+    def __init__(self, providers, deadline=SEARCH_DEADLINE):
+        self.providers = list(providers)
+        self.deadline = deadline
+
+    def provider(self, name):
+        return next((provider for provider in self.providers if provider.name == name), None)
+
+    def search(self, query, providers=None, limit=20):
+        futures = {
+            self._executor.submit(self._search_one, provider, query, limit): provider
+            for provider in (providers if providers is not None else self.providers)
+        }
+        return SearchRun(query, futures, time.monotonic() + self.deadline)
+
+    @staticmethod
+    def _search_one(provider, query, limit):
+        with get_metrics().span(f"search.{provider.name}", query=query) as span:
+            page = provider.search(query, limit)
+            span["hits"] = len(page.hits)
+            return page
+
+
+class MergedResults:
+    """
+    Слияние результатов разных источников.
+
+    Один и тот же трек (по нормализованным артисту и названию) показывается один раз:
+    основной становится версия, которую можно скачать, недостающие метаданные берутся из остальных.
+    Порядок — по сумме обратных рангов (reciprocal rank fusion): трек, найденный высоко
+    в нескольких источниках, поднимается выше.
+    """
+
+    # Сглаживание ранга: чем больше, тем меньше разница между первыми позициями
+    RANK_K = 10
+    METADATA_FIELDS = ("album", "genre", "release_year", "artwork_url")
+
+    def __init__(self, providers):
+        self._priority = {provider.name: index for index, provider in enumerate(providers)}
+        self.entries = {}  # ключ -> {"hit", "score", "sources", "order"}
+
+    def add(self, page, rank_offset=0):
+        """
+        Добавляет страницу источника. rank_offset — позиция первого трека страницы в выдаче источника.
+        Возвращает ключи добавленных или изменённых записей.
+        """
+        changed = []
+        for position, hit in enumerate(page.hits):
+            hit = dict(hit, downloadable=page.provider.downloadable)
+            key = normalize_key(hit["artist"], hit["title"])
+            score = 1.0 / (self.RANK_K + rank_offset + position + 1)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.entries[key] = {"hit": hit, "score": score, "sources": [hit["source"]],
+                                     "order": len(self.entries)}
+            else:
+                if hit["source"] in entry["sources"]:
+                    # Повтор внутри одного источника не должен поднимать трек
+                    continue
+                entry["score"] += score
+                entry["sources"].append(hit["source"])
+                entry["hit"] = self._merge(entry["hit"], hit)
+            changed.append(key)
+        return changed
+
+    def ranked(self):
+        """
+        Ключи записей в порядке показа.
+        """
+        return [
+            key for key, entry in sorted(
+                self.entries.items(),
+                key=lambda item: (
+                    -item[1]["score"],
+                    self._priority.get(item[1]["hit"]["source"], len(self._priority)),
+                    item[1]["order"]
+                )
+            )
+        ]
+
+    def _merge(self, current, other):
+        primary, secondary = current, other
+        if other["downloadable"] and not current["downloadable"]:
+            primary, secondary = other, current
+        elif other["downloadable"] == current["downloadable"] and (
+                self._priority.get(other["source"], 99) < self._priority.get(current["source"], 99)):
+            primary, secondary = other, current
+        merged = dict(primary)
+        for field in self.METADATA_FIELDS:
+            if not merged.get(field) and secondary.get(field):
+                merged[field] = secondary[field]
+        return merged
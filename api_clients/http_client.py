@@ -0,0 +1,279 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX,
+    API_RATE_LIMIT,
+    API_RATE_BURST,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    DOWNLOAD_WORKERS,
+    DOWNLOAD_CONNECT_TIMEOUT,
+    DOWNLOAD_READ_TIMEOUT,
+)
+from monitoring.metrics import get_metrics
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    Хост недавно отвечал только ошибками — запрос отклонён без обращения к сети.
+    Наследуется от ConnectionError, поэтому обрабатывается как обычный сбой сети.
+    """
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты: rate токенов в секунду, не больше capacity про запас.
+    acquire() блокирует поток, пока токенов не хватает.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate, capacity=None):
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+            self.capacity = float(capacity if capacity is not None else rate)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def acquire(self, tokens=1):
+        """
+        Забирает tokens токенов, при необходимости ожидая их накопления.
+        Запрос больше capacity выполняется частями, поэтому никогда не зависает.
+        """
+        remaining = float(tokens)
+        while remaining > 0:
+            with self._lock:
+                self._refill()
+                if self.rate <= 0:
+                    # Ограничение отключено
+                    return
+                take = min(remaining, self._tokens)
+                self._tokens -= take
+                remaining -= take
+                wait = min(remaining, self.capacity) / self.rate if remaining > 0 else 0
+            if wait > 0:
+                time.sleep(wait)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты для одного хоста: после failure_threshold ошибок подряд запросы
+    отклоняются сразу, через reset_timeout пропускается один пробный запрос.
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self, host):
+        """
+        Пропускает запрос или отклоняет его CircuitOpenError.
+        Возвращает True, если запрос пробный: после него нужно вызвать release_probe.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probe_in_flight:
+                raise CircuitOpenError(f"Сервер {host} временно недоступен, запрос отклонён")
+            # Полуоткрытое состояние: пропускаем один пробный запрос
+            self._probe_in_flight = True
+            return True
+
+    def release_probe(self):
+        """
+        Снимает отметку пробного запроса, даже если его исход не записан как успех или сбой
+        (ответ 429, прочие ошибки requests) — иначе хост остался бы закрытым навсегда.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class HttpClient:
+    """
+    Общий HTTP-клиент: пул keep-alive соединений, раздельные таймауты соединения и чтения,
+    повторы с экспоненциальной задержкой и случайным разбросом на 429/5xx и сетевые ошибки,
+    ограничение частоты запросов и автомат защиты для каждого хоста.
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 max_retries=HTTP_MAX_RETRIES, rate_limit=None, rate_burst=None, name="http"):
+        self.name = name  # Префикс метрик клиента: http.api, http.download
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst) if rate_limit else None
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self.pool_size = None
+        self._adapter = None
+        self.resize_pool(pool_size)
+
+    def resize_pool(self, pool_size):
+        """
+        Меняет размер пула соединений (например, под количество потоков скачивания).
+        Старый пул закрывается: простаивающие соединения сразу, занятые — после своего запроса.
+        """
+        pool_size = max(1, int(pool_size))
+        previous = self._adapter
+        if previous is not None and pool_size == self.pool_size:
+            return
+        self.pool_size = pool_size
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        if previous is not None:
+            previous.close()
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """
+        Выполняет запрос с повторами. Возвращает последний ответ (в том числе с кодом ошибки)
+        или пробрасывает сетевое исключение, если все попытки исчерпаны.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlparse(url).netloc
+        metrics = get_metrics()
+        with metrics.span(f"http.{self.name}", method=method, host=host) as span:
+            response = self._request_with_retries(method, url, host, metrics, kwargs)
+            span["status"] = response.status_code
+            metrics.inc(f"http.{self.name}.status.{response.status_code // 100}xx")
+            return response
+
+    def _request_with_retries(self, method, url, host, metrics, kwargs):
+        breaker = self._breaker(host)
+
+        attempt = 0
+        while True:
+            try:
+                probe = breaker.before_request(host)
+            except CircuitOpenError:
+                metrics.inc(f"http.{self.name}.circuit_open")
+                raise
+            try:
+                if self.rate_limiter is not None:
+                    # Ожидание ограничителя частоты отдельно от сети: видно, куда уходит время
+                    started = time.perf_counter()
+                    self.rate_limiter.acquire()
+                    metrics.observe(f"http.{self.name}.rate_wait", (time.perf_counter() - started) * 1000)
+
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    breaker.record_failure()
+                    metrics.inc(f"http.{self.name}.network_errors")
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(attempt)
+                    print(f"Сетевая ошибка ({e}), повтор через {delay:.1f} с")
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        breaker.record_success()
+                        return response
+                    # 429 — сервер жив, но просит реже: сбоем хоста не считается
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    if attempt >= self.max_retries:
+                        return response
+                    delay = self._retry_after(response) or self._backoff(attempt)
+                    print(f"Сервер ответил {response.status_code}, повтор через {delay:.1f} с")
+                    response.close()
+            finally:
+                if probe:
+                    breaker.release_probe()
+
+            metrics.inc(f"http.{self.name}.retries")
+            time.sleep(delay)
+            attempt += 1
+
+    def _breaker(self, host):
+        with self._breakers_lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker()
+                self._breakers[host] = breaker
+            return breaker
+
+    @staticmethod
+    def _backoff(attempt):
+        # Экспоненциальная задержка с полным случайным разбросом
+        return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+    @staticmethod
+    def _retry_after(response):
+        value = response.headers.get("Retry-After", "")
+        return min(float(value), HTTP_BACKOFF_MAX) if value.isdigit() else None
+
+
+_api_client = None
+_download_client = None
+_clients_lock = threading.Lock()
+
+
+def get_api_client():
+    """
+    Клиент для запросов к API (поиск, получение ссылок): с ограничением частоты.
+    """
+    global _api_client
+    with _clients_lock:
+        if _api_client is None:
+            _api_client = HttpClient(rate_limit=API_RATE_LIMIT, rate_burst=API_RATE_BURST, name="api")
+        return _api_client
+
+
+def get_download_client():
+    """
+    Клиент для скачивания файлов: пул соединений по числу потоков, без ограничения частоты.
+    """
+    global _download_client
+    with _clients_lock:
+        if _download_client is None:
+            _download_client = HttpClient(
+                pool_size=DOWNLOAD_WORKERS,
+                connect_timeout=DOWNLOAD_CONNECT_TIMEOUT,
+                read_timeout=DOWNLOAD_READ_TIMEOUT,
+                name="download"
+            )
+        return _download_client
@@ -0,0 +1,180 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+from config import (
+    DB_PATH,
+    MUSICBRAINZ_URL,
+    MUSICBRAINZ_USER_AGENT,
+    MUSICBRAINZ_RATE_INTERVAL,
+    MUSICBRAINZ_CACHE_TTL,
+    MUSICBRAINZ_MIN_SCORE,
+)
+from api_clients.http_client import HttpClient
+from database.connection import get_connection_manager
+from database.search_cache import normalize_query
+
+COVER_ART_URL = "https://coverartarchive.org/release/{release_id}/front-500"
+
+
+def _lucene_phrase(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class MusicBrainzClient:
+    """
+    Поиск метаданных записи (альбом, год, жанр, обложка) в MusicBrainz.
+
+    Запросы ставятся в очередь и выполняются одним потоком-планировщиком не чаще
+    одного раза в MUSICBRAINZ_RATE_INTERVAL секунд, как требуют правила MusicBrainz.
+    Одинаковые запросы объединяются, ответы (в том числе «не найдено») хранятся
+    в таблице musicbrainz_cache, поэтому повторный проход по библиотеке почти не ходит в сеть.
+    """
+
+    def __init__(self, db_name=DB_PATH, ttl=MUSICBRAINZ_CACHE_TTL, interval=MUSICBRAINZ_RATE_INTERVAL):
+        self.ttl = ttl
+        self.interval = interval
+        self.pool = get_connection_manager(db_name)
+        # Один запрос за раз: пул из одного соединения, повторы на 503 с учётом Retry-After.
+        # Ограничитель частоты без запаса действует на каждую попытку, в том числе на повторы
+        self.http = HttpClient(
+            pool_size=1,
+            rate_limit=1 / interval if interval > 0 else None,
+            rate_burst=1,
+            name="musicbrainz"
+        )
+        self.http.session.headers["User-Agent"] = MUSICBRAINZ_USER_AGENT
+
+        self._queue = queue.Queue()
+        self._pending = {}  # cache_key -> Future
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def connection(self):
+        return self.pool.connection()
+
+    @staticmethod
+    def make_key(artist, title):
+        return f"recording:{normalize_query(artist or '')}:{normalize_query(title or '')}"
+
+    def cached(self, artist, title):
+        """
+        Метаданные из кэша без обращения к сети: словарь или None (нет в кэше или не найдено).
+        """
+        _, result = self._cache_get(self.make_key(artist, title))
+        return result
+
+    def lookup(self, artist, title) -> Future:
+        """
+        Future с метаданными записи: словарь с ключами album, release_year, genre, artwork_url, mbid
+        или None, если запись не найдена.
+        """
+        key = self.make_key(artist, title)
+        hit, result = self._cache_get(key)
+        if hit:
+            future = Future()
+            future.set_result(result)
+            return future
+
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            self._pending[key] = future
+            self._queue.put((key, artist, title, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="musicbrainz", daemon=True)
+                self._thread.start()
+        return future
+
+    def _run(self):
+        while True:
+            key, artist, title, future = self._queue.get()
+            result = None
+            try:
+                # Другой поток мог положить ответ в кэш, пока запрос ждал в очереди
+                hit, result = self._cache_get(key)
+                if not hit:
+                    result = self._search_recording(artist, title)
+                    self._cache_put(key, result)
+            except requests.RequestException as e:
+                # Сетевые ошибки не кэшируются — запрос повторится при следующем проходе
+                print(f"Ошибка запроса к MusicBrainz ({artist} — {title}): {e}")
+            except Exception as e:
+                print(f"Ошибка обработки ответа MusicBrainz ({artist} — {title}): {e}")
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+                future.set_result(result)
+
+    def _search_recording(self, artist, title):
+        # Паузу между запросами (и повторами) выдерживает ограничитель частоты self.http
+        query = f"recording:{_lucene_phrase(title)}"
+        if artist:
+            query += f" AND artist:{_lucene_phrase(artist)}"
+        response = self.http.get(
+            f"{MUSICBRAINZ_URL}/recording",
+            params={"query": query, "fmt": "json", "limit": 5}
+        )
+        response.raise_for_status()
+        return self._parse_recordings(response.json().get("recordings", []))
+
+    @staticmethod
+    def _parse_recordings(recordings):
+        for recording in recordings:
+            if int(recording.get("score", 0)) < MUSICBRAINZ_MIN_SCORE:
+                continue
+            releases = recording.get("releases", [])
+            # Официальный релиз с датой — источник альбома, года и обложки
+            release = next(
+                (r for r in releases if r.get("status") == "Official" and r.get("date")),
+                releases[0] if releases else {}
+            )
+            date = release.get("date") or recording.get("first-release-date") or ""
+            tags = sorted(recording.get("tags", []), key=lambda tag: tag.get("count", 0), reverse=True)
+            return {
+                "mbid": recording.get("id"),
+                "album": release.get("title"),
+                "release_year": int(date[:4]) if date[:4].isdigit() else None,
+                "genre": tags[0]["name"].title() if tags else None,
+                "artwork_url": COVER_ART_URL.format(release_id=release["id"]) if release.get("id") else None,
+            }
+        return None
+
+    def _cache_get(self, key):
+        row = self.connection.execute(
+            "SELECT response, created_at FROM musicbrainz_cache WHERE cache_key = ?", (key,)
+        ).fetchone()
+        if row is None or time.time() - row["created_at"] > self.ttl:
+            return False, None
+        return True, json.loads(row["response"]) if row["response"] else None
+
+    def _cache_put(self, key, result):
+        payload = json.dumps(result, ensure_ascii=False) if result is not None else None
+        self.connection.execute(
+            "INSERT OR REPLACE INTO musicbrainz_cache (cache_key, response, created_at) VALUES (?, ?, ?)",
+            (key, payload, time.time())
+        )
+        self.connection.commit()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_musicbrainz_client(db_name=DB_PATH):
+    """
+    Общий клиент MusicBrainz: один планировщик запросов на всё приложение.
+    Кэш ответов хранится в базе db_name (учитывается при первом вызове).
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MusicBrainzClient(db_name)
+        return _client
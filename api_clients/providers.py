@@ -0,0 +1,66 @@
+import re
+import unicodedata
+
+
+def normalize_text(value):
+    """
+    Текст для сравнения между источниками: без диакритики, регистра, пунктуации и лишних пробелов.
+    """
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(char for char in value if not unicodedata.combining(char)).lower()
+    # «feat. X» и «ft. X» источники пишут по-разному — для сравнения отбрасываем
+    value = re.sub(r"[\(\[]?\b(feat|ft)\b\.?.*?([\)\]]|$)", " ", value)
+    return " ".join(re.findall(r"\w+", value))
+
+
+def normalize_key(artist, title):
+    """
+    Ключ для схлопывания одного и того же трека из разных источников.
+    Название вида «Артист - Трек» приводится к названию без артиста.
+    """
+    artist = normalize_text(artist)
+    title = normalize_text(title)
+    if artist and title.startswith(artist + " "):
+        title = title[len(artist) + 1:]
+    return f"{artist}|{title}"
+
+
+class ProviderPage:
+    """
+    Страница результатов источника: hits — список найденных треков,
+    more — объект с has_more/ready/take() для следующих страниц или None.
+    """
+
+    def __init__(self, provider, hits, more=None):
+        self.provider = provider
+        self.hits = hits
+        self.more = more
+
+
+class SearchProvider:
+    """
+    Источник поиска треков. Реализация возвращает ProviderPage, где каждый трек — словарь:
+    title, artist, album, genre, release_year, artwork_url, source, track_id
+    и stream_url (готовая ссылка) или transcoding_url (ссылка получается через StreamUrlResolver).
+    """
+
+    name = None
+    label = None
+    # False — источник отдаёт только превью, такие треки можно послушать, но не скачать
+    downloadable = True
+
+    def search(self, query, limit=20):
+        raise NotImplementedError
+
+    def convert(self, payload):
+        """
+        Превращает сырую страницу ответа API (для подгрузки следующих страниц) в список треков.
+        """
+        raise NotImplementedError
+
+    def lookup(self, track_id):
+        """
+        Трек по его ID в источнике (без префикса источника) в том же формате, что и результаты поиска,
+        или None. Источник без поиска по ID всегда возвращает None.
+        """
+        return None
@@ -1,34 +1,453 @@
+import base64
+import itertools
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
 import requests
 
+from config import DB_PATH, STREAM_RESOLVE_WORKERS, STREAM_URL_TTL, STREAM_URL_CACHE_ENTRIES
+from database.search_cache import SearchCache
+from api_clients.http_client import get_api_client
+from api_clients.providers import SearchProvider, ProviderPage
+from monitoring.metrics import get_metrics
+
 SOUNDCLOUD_CLIENT_ID = "JtwkMxXKQNqDFvsQ3pUayFVgt4j9dS87"
 BASE_URL = "https://api-v2.soundcloud.com"
+# Под этим источником в кэше хранится первая страница поиска вместе с курсором next_href
+SEARCH_CACHE_SOURCE = "soundcloud_pages"
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache(db_name=DB_PATH):
+    """
+    Общий кэш результатов поиска (создаётся при первом обращении, в базе db_name).
+    """
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = SearchCache(db_name)
+        return _search_cache
+
+
+def search_tracks(query: str, limit: int = 20, use_cache: bool = True):
+    """
+    Первая страница результатов поиска. Для просмотра следующих страниц — SearchPager.
+    """
+    collection, _ = _search_first_page(query, limit, use_cache)
+    return collection
+
 
+def _search_first_page(query, limit, use_cache):
+    """
+    Первая страница поиска и ссылка next_href на следующую (или None).
+    """
+    cache = get_search_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(SEARCH_CACHE_SOURCE, query, limit)
+        if cached is not None:
+            return cached["collection"], cached["next_href"]
 
-def search_tracks(query: str, limit: int = 20):
     url = f"{BASE_URL}/search/tracks"
     params = {
         "q": query,
         "client_id": SOUNDCLOUD_CLIENT_ID,
         "limit": limit
     }
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-    }
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        # Пул соединений, повторы на 429/5xx и ограничение частоты — в общем клиенте API
+        response = get_api_client().get(url, params=params)
         response.raise_for_status()
-        return response.json().get("collection", [])
+        data = response.json()
+        page = {"collection": data.get("collection", []), "next_href": data.get("next_href")}
+        if cache is not None:
+            cache.put(SEARCH_CACHE_SOURCE, query, limit, page)
+        return page["collection"], page["next_href"]
     except requests.RequestException as e:
         print(f"Ошибка при поиске треков: {e}")
-        return []
+        if cache is not None:
+            # Оффлайн-режим: отдаём сохранённые результаты, даже если они устарели
+            stale = cache.get(SEARCH_CACHE_SOURCE, query, limit, allow_stale=True)
+            if stale is not None:
+                print(f"Нет связи с SoundCloud, результаты для '{query}' взяты из кэша")
+                return stale["collection"], stale["next_href"]
+        return [], None
 
 
-def get_stream_url(transcoding_url: str):
+def _search_next_page(next_href):
+    """
+    Следующая страница поиска по курсору next_href. Ошибка сети завершает листание.
+    """
+    try:
+        # next_href приходит без client_id, requests добавит его к уже имеющимся параметрам
+        response = get_api_client().get(next_href, params={"client_id": SOUNDCLOUD_CLIENT_ID})
+        response.raise_for_status()
+        data = response.json()
+        return data.get("collection", []), data.get("next_href")
+    except requests.RequestException as e:
+        print(f"Ошибка загрузки следующей страницы поиска: {e}")
+        return [], None
+
+
+def get_track(track_id):
+    """
+    Трек по ID в формате ответа поиска или None.
+    """
     params = {"client_id": SOUNDCLOUD_CLIENT_ID}
     try:
-        response = requests.get(transcoding_url, params=params, timeout=10)
+        response = get_api_client().get(f"{BASE_URL}/tracks/{track_id}", params=params)
         response.raise_for_status()
-        return response.json().get("url")
+        return response.json()
     except requests.RequestException as e:
-        print(f"Ошибка получения ссылки на стрим: {e}")
+        print(f"Ошибка получения трека {track_id}: {e}")
         return None
+
+
+class SearchPager:
+    """
+    Постраничный поиск по SoundCloud: страницы загружаются по курсору next_href,
+    следующая страница запрашивается в фоне, пока показывается текущая.
+    В памяти держатся только текущая и следующая страницы.
+
+    Итерация по объекту блокирующая и отдаёт страницы (списки треков);
+    GUI вместо этого проверяет ready и забирает страницу через take(), не блокируя окно.
+    """
+
+    _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-pages")
+
+    def __init__(self, query: str, limit: int = 20, use_cache: bool = True):
+        self.query = query
+        self.limit = limit
+        self.pages_loaded = 0
+        self._future = self._executor.submit(_search_first_page, query, limit, use_cache)
+
+    @property
+    def has_more(self):
+        return self._future is not None
+
+    @property
+    def ready(self):
+        """
+        Следующая страница уже загружена (take() не будет ждать).
+        """
+        return self._future is None or self._future.done()
+
+    def take(self):
+        """
+        Возвращает следующую страницу и сразу запускает фоновую загрузку страницы после неё.
+        Если страниц больше нет, возвращает пустой список.
+        """
+        if self._future is None:
+            return []
+        collection, next_href = self._future.result()
+        self.pages_loaded += 1
+        if next_href and collection:
+            self._future = self._executor.submit(_search_next_page, next_href)
+        else:
+            self._future = None
+        return collection
+
+    def close(self):
+        """
+        Прекращает листание (новый поиск): ещё не начатая загрузка отменяется.
+        """
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    def __iter__(self):
+        while self.has_more:
+            yield self.take()
+
+
+def search_pages(query: str, limit: int = 20, use_cache: bool = True):
+    """
+    Генератор страниц результатов поиска с фоновой подгрузкой следующей страницы.
+    """
+    return iter(SearchPager(query, limit, use_cache))
+
+
+class SoundCloudProvider(SearchProvider):
+    """
+    SoundCloud как источник федеративного поиска; следующие страницы — через SearchPager.
+    """
+
+    name = "soundcloud"
+    label = "SoundCloud"
+
+    def search(self, query, limit=20):
+        pager = SearchPager(query, limit)
+        hits = self.convert(pager.take())
+        return ProviderPage(self, hits, pager if pager.has_more else None)
+
+    def lookup(self, track_id):
+        track = get_track(track_id)
+        hits = self.convert([track]) if track else []
+        return hits[0] if hits else None
+
+    def convert(self, payload):
+        hits = []
+        for track in payload:
+            transcoding_url = find_progressive_transcoding(track)
+            if transcoding_url is None:
+                continue
+            hits.append(dict(
+                track_metadata(track),
+                track_id=str(track.get("id", "")),
+                transcoding_url=transcoding_url
+            ))
+        return hits
+
+
+def get_stream_url(transcoding_url: str):
+    params = {"client_id": SOUNDCLOUD_CLIENT_ID}
+    with get_metrics().span("stream.resolve") as span:
+        try:
+            response = get_api_client().get(transcoding_url, params=params)
+            response.raise_for_status()
+            return response.json().get("url")
+        except requests.RequestException as e:
+            print(f"Ошибка получения ссылки на стрим: {e}")
+            span["error"] = str(e)
+            return None
+
+
+def track_metadata(track: dict):
+    """
+    Метаданные трека из ответа поиска для очереди и ID3-тегов.
+    """
+    publisher = track.get("publisher_metadata") or {}
+    user = track.get("user") or {}
+
+    release_year = None
+    for date in (track.get("release_date"), publisher.get("release_date"), track.get("created_at")):
+        if date and date[:4].isdigit():
+            release_year = int(date[:4])
+            break
+
+    # В ответе ссылка на миниатюру 100x100, та же обложка есть в 500x500
+    artwork_url = track.get("artwork_url") or user.get("avatar_url")
+    if artwork_url:
+        artwork_url = artwork_url.replace("-large.", "-t500x500.")
+
+    return {
+        "title": track.get("title") or "Без названия",
+        "artist": publisher.get("artist") or user.get("username") or "Unknown Artist",
+        "album": publisher.get("album_title") or publisher.get("release_title"),
+        "genre": track.get("genre") or None,
+        "release_year": release_year,
+        "artwork_url": artwork_url,
+        "source": "soundcloud",
+    }
+
+
+def find_progressive_transcoding(track: dict):
+    """
+    Возвращает transcoding URL прогрессивного (mp3) потока из ответа поиска или None.
+    """
+    for transcoding in track.get("media", {}).get("transcodings", []):
+        if "progressive" in transcoding.get("format", {}).get("protocol", ""):
+            return transcoding.get("url")
+    return None
+
+
+def stream_url_expiry(stream_url: str):
+    """
+    Момент истечения подписанной ссылки (unix time) или None, если его нельзя определить.
+    Поддерживаются параметр Expires и CloudFront Policy с AWS:EpochTime.
+    """
+    params = parse_qs(urlparse(stream_url).query)
+    expires = params.get("Expires", [None])[0]
+    if expires and expires.isdigit():
+        return int(expires)
+
+    policy = params.get("Policy", [None])[0]
+    if policy:
+        try:
+            # CloudFront использует URL-безопасный вариант base64
+            raw = policy.replace("-", "+").replace("_", "=").replace("~", "/")
+            statement = json.loads(base64.b64decode(raw))["Statement"][0]
+            return int(statement["Condition"]["DateLessThan"]["AWS:EpochTime"])
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+    return None
+
+
+class _ResolveJob:
+    """
+    Задание резолвера: одно на трек, даже если в очереди оно лежит с двумя приоритетами.
+    """
+
+    def __init__(self, track_id, transcoding_url, priority):
+        self.track_id = track_id
+        self.transcoding_url = transcoding_url
+        self.priority = priority
+        self.future = Future()
+        self.claimed = False
+
+
+class StreamUrlResolver:
+    """
+    Получение ссылок на стрим в ограниченном пуле потоков с кэшем по ID трека.
+    Повторные запросы одного трека объединяются, ссылка живёт в кэше до истечения подписи.
+
+    Задания выполняются по приоритету: ссылки, которые ждёт пользователь или загрузчик (submit, resolve),
+    раньше фоновой предвыборки для результатов поиска (prefetch). Кэш ограничен
+    STREAM_URL_CACHE_ENTRIES ссылками: сначала выбрасываются истёкшие, затем самые старые.
+    """
+
+    # Запас до истечения ссылки, чтобы не отдать ссылку, которая умрёт во время скачивания
+    EXPIRY_MARGIN = 60
+    # Приоритеты заданий: меньше — раньше
+    PRIORITY_NOW = 0
+    PRIORITY_PREFETCH = 1
+
+    def __init__(self, resolve=get_stream_url, max_workers=STREAM_RESOLVE_WORKERS, ttl=STREAM_URL_TTL,
+                 max_entries=STREAM_URL_CACHE_ENTRIES):
+        self._resolve = resolve
+        self._ttl = ttl
+        self._max_workers = max_workers
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache = {}  # track_id -> (stream_url, expires_at), в порядке добавления
+        self._pending = {}  # track_id -> _ResolveJob
+        self._queue = queue.PriorityQueue()  # (приоритет, порядковый номер, задание)
+        self._sequence = itertools.count()
+        self._workers = []
+        self._stopped = False
+
+    def cached(self, track_id):
+        """
+        Ссылка из кэша, если она ещё действительна, иначе None.
+        """
+        with self._lock:
+            return self._cached_locked(track_id)
+
+    def _cached_locked(self, track_id):
+        entry = self._cache.get(track_id)
+        if entry is None:
+            return None
+        stream_url, expires_at = entry
+        if expires_at <= time.time():
+            del self._cache[track_id]
+            return None
+        return stream_url
+
+    def submit(self, track_id, transcoding_url, priority=PRIORITY_NOW) -> Future:
+        """
+        Запускает получение ссылки в фоне и возвращает Future со ссылкой (или None).
+        Задание, уже ждущее в очереди с более низким приоритетом, поднимается.
+        """
+        with self._lock:
+            stream_url = self._cached_locked(track_id)
+            get_metrics().inc("stream.cache_hits" if stream_url is not None else "stream.cache_misses")
+            if stream_url is not None:
+                future = Future()
+                future.set_result(stream_url)
+                return future
+            if self._stopped:
+                future = Future()
+                future.cancel()
+                return future
+
+            job = self._pending.get(track_id)
+            if job is None:
+                job = _ResolveJob(track_id, transcoding_url, priority)
+                self._pending[track_id] = job
+            elif priority < job.priority and not job.claimed:
+                job.priority = priority
+            else:
+                return job.future
+            # Поднятое задание кладётся в очередь второй раз, поток возьмёт его по новому приоритету
+            self._queue.put((priority, next(self._sequence), job))
+            if len(self._workers) < min(self._max_workers, len(self._pending)):
+                worker = threading.Thread(
+                    target=self._run, name=f"stream-resolver-{len(self._workers) + 1}", daemon=True
+                )
+                self._workers.append(worker)
+                worker.start()
+            return job.future
+
+    def resolve(self, track_id, transcoding_url, timeout=None):
+        """
+        Блокирующее получение ссылки на стрим.
+        """
+        return self.submit(track_id, transcoding_url).result(timeout)
+
+    def invalidate(self, track_id):
+        """
+        Убирает ссылку из кэша (например, сервер отклонил её раньше указанного срока).
+        """
+        with self._lock:
+            self._cache.pop(track_id, None)
+
+    def prefetch(self, tracks):
+        """
+        Фоновое получение ссылок для пар (track_id, transcoding_url) с низким приоритетом.
+        """
+        for track_id, transcoding_url in tracks:
+            self.submit(track_id, transcoding_url, self.PRIORITY_PREFETCH)
+
+    def _run(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.claimed:
+                    # Второе место того же задания в очереди после повышения приоритета
+                    continue
+                job.claimed = True
+            job.future.set_result(self._fetch(job.track_id, job.transcoding_url))
+
+    def _fetch(self, track_id, transcoding_url):
+        try:
+            stream_url = self._resolve(transcoding_url)
+        except Exception as e:
+            print(f"Ошибка получения ссылки на стрим: {e}")
+            stream_url = None
+
+        with self._lock:
+            self._pending.pop(track_id, None)
+            if stream_url:
+                expires_at = stream_url_expiry(stream_url)
+                if expires_at is None:
+                    expires_at = time.time() + self._ttl
+                else:
+                    expires_at -= self.EXPIRY_MARGIN
+                self._cache.pop(track_id, None)
+                self._cache[track_id] = (stream_url, expires_at)
+                if len(self._cache) > self._max_entries:
+                    self._trim_cache()
+        return stream_url
+
+    def _trim_cache(self):
+        # Вызывается под self._lock: сначала истёкшие ссылки, затем самые давние
+        now = time.time()
+        for track_id in [key for key, (_, expires_at) in self._cache.items() if expires_at <= now]:
+            del self._cache[track_id]
+        excess = len(self._cache) - self._max_entries
+        for track_id in list(itertools.islice(self._cache, max(0, excess))):
+            del self._cache[track_id]
+
+    def shutdown(self):
+        """
+        Отменяет ждущие задания и останавливает потоки; выполняющиеся запросы завершаются сами.
+        """
+        with self._lock:
+            self._stopped = True
+            for job in self._pending.values():
+                if not job.claimed:
+                    job.claimed = True
+                    job.future.cancel()
+            self._pending.clear()
+            workers = len(self._workers)
+        for _ in range(workers):
+            # Пустое задание с наивысшим приоритетом завершает поток
+            self._queue.put((-1, next(self._sequence), None))
@@ -0,0 +1,70 @@
+import argparse
+import json
+import sys
+
+from benchmarks.run import RESULTS_VERSION
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    if data.get("version") != RESULTS_VERSION:
+        raise ValueError(f"{path}: неподдерживаемая версия формата {data.get('version')}")
+    return data
+
+
+def compare(baseline, current, threshold):
+    """
+    Сравнивает метрики двух прогонов. Возвращает строки отчёта
+    (имя, было, стало, изменение в %, вердикт) и количество регрессий.
+    Изменение считается регрессией, если метрика ухудшилась больше чем на threshold (доля).
+    """
+    rows = []
+    regressions = 0
+    for name in sorted(set(baseline["metrics"]) | set(current["metrics"])):
+        before = baseline["metrics"].get(name)
+        after = current["metrics"].get(name)
+        if before is None or after is None:
+            rows.append((name, before and before["value"], after and after["value"], None, "нет в одном из прогонов"))
+            continue
+        old, new = before["value"], after["value"]
+        change = (new - old) / old if old else 0.0
+        # Для метрик «больше — лучше» ухудшение — это уменьшение
+        worse = -change if after["better"] == "higher" else change
+        if worse > threshold:
+            verdict = "РЕГРЕССИЯ"
+            regressions += 1
+        elif worse < -threshold:
+            verdict = "улучшение"
+        else:
+            verdict = ""
+        rows.append((name, old, new, change * 100, verdict))
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение двух прогонов benchmarks.run")
+    parser.add_argument("baseline", help="результаты до изменения (JSON)")
+    parser.add_argument("current", help="результаты после изменения (JSON)")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="допустимое ухудшение, доля (по умолчанию 0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    baseline = load_results(args.baseline)
+    current = load_results(args.current)
+    rows, regressions = compare(baseline, current, args.threshold)
+
+    print(f"База: {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+    print(f"Сейчас: {current['meta'].get('commit')} ({current['meta'].get('timestamp')})")
+    width = max((len(row[0]) for row in rows), default=10)
+    for name, old, new, change, verdict in rows:
+        change_text = f"{change:+7.1f}%" if change is not None else "       "
+        print(f"{name:<{width}}  {old if old is not None else '-':>12}  {new if new is not None else '-':>12}"
+              f"  {change_text}  {verdict}")
+    print(f"Регрессий: {regressions}")
+    # Ненулевой код возврата позволяет остановить сборку при регрессии
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+import json
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FakeSoundCloudSettings:
+    """
+    Поведение локального сервера, имитирующего SoundCloud.
+
+    latency — задержка перед каждым ответом (секунды), bandwidth — скорость отдачи файла
+    на одно соединение (байт/с, 0 — без ограничения), error_rate — доля ответов 503,
+    stall_rate — доля загрузок, которые замирают посередине на stall_seconds,
+    drop_rate — доля загрузок, соединение которых сервер обрывает посередине файла,
+    url_ttl — срок действия подписанных ссылок на стрим (секунды), track_size — размер mp3 (байт), total_tracks — сколько треков находит поиск.
+    """
+
+    def __init__(self, latency=0.0, bandwidth=0, error_rate=0.0, stall_rate=0.0, stall_seconds=60.0,
+                 track_size=512 * 1024, total_tracks=200, seed=1, drop_rate=0.0, url_ttl=3600):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.drop_rate = drop_rate
+        self.url_ttl = url_ttl
+        self.track_size = track_size
+        self.total_tracks = total_tracks
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def chance(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего API
+    CHUNK = 16 * 1024
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        settings = self.settings
+        self.server.count_request()
+        if settings.latency:
+            time.sleep(settings.latency)
+        if settings.error_rate and settings.chance(settings.error_rate):
+            self._send_json({"error": "Service Unavailable"}, status=503)
+            return
+
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == "/search/tracks":
+            self._search(params)
+            return
+        match = re.fullmatch(r"/media/(\d+)/stream/progressive", url.path)
+        if match:
+            self._send_json({"url": self.server.signed_audio_url(int(match.group(1)))})
+            return
+        match = re.fullmatch(r"/audio/(\d+)\.mp3", url.path)
+        if match:
+            # Подписанная ссылка: истёкшие и отозванные подписи отклоняются, как на CDN SoundCloud
+            expires = params.get("Expires", [None])[0]
+            signature = params.get("Signature", [None])[0]
+            if (expires and int(expires) <= time.time()) or signature in self.server.revoked_signatures:
+                self._send_json({"error": "Forbidden"}, status=403)
+                return
+            self._audio(int(match.group(1)))
+            return
+        self._send_json({"error": "Not Found"}, status=404)
+
+    def _search(self, params):
+        query = params.get("q", [""])[0]
+        limit = int(params.get("limit", ["20"])[0])
+        offset = int(params.get("offset", ["0"])[0])
+        end = min(offset + limit, self.settings.total_tracks)
+        collection = [self.server.track(track_id, query) for track_id in range(offset, end)]
+        next_href = None
+        if end < self.settings.total_tracks:
+            next_href = f"{self.server.base_url}/search/tracks?q={query}&limit={limit}&offset={end}"
+        self._send_json({"collection": collection, "next_href": next_href})
+
+    def _audio(self, track_id):
+        settings = self.settings
+        size = settings.track_size
+        start = 0
+        self.server.range_headers.append(self.headers.get("Range"))
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(size - start))
+        self.end_headers()
+
+        stall_at = size // 2 if settings.stall_rate and settings.chance(settings.stall_rate) else None
+        drop_at = (start + size) // 2 if settings.drop_rate and settings.chance(settings.drop_rate) else None
+        body = self.server.audio_bytes(track_id, size)
+        position = start
+        sent_at = time.monotonic()
+        try:
+            while position < size:
+                if stall_at is not None and position >= stall_at:
+                    time.sleep(settings.stall_seconds)
+                    stall_at = None
+                if drop_at is not None and position >= drop_at:
+                    # Обрыв посреди тела: клиент получит меньше байт, чем в Content-Length
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                chunk = body[position:position + self.CHUNK]
+                self.wfile.write(chunk)
+                position += len(chunk)
+                if settings.bandwidth:
+                    # Отдаём не быстрее bandwidth байт/с на соединение
+                    sent_at += len(chunk) / settings.bandwidth
+                    delay = sent_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент прервал загрузку (остановка, сторожевой таймер)
+            self.close_connection = True
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeSoundCloudServer(ThreadingHTTPServer):
+    """
+    Локальный HTTP-сервер с эндпоинтами /search/tracks, /media/<id>/stream/progressive
+    (получение ссылки на стрим) и /audio/<id>.mp3 (прогрессивная загрузка с поддержкой Range).
+    Запускается в фоновом потоке: with FakeSoundCloudServer(settings) as server: ... server.base_url
+    """
+
+    daemon_threads = True
+
+    def __init__(self, settings=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.settings = settings or FakeSoundCloudSettings()
+        self.base_url = f"http://{host}:{self.server_address[1]}"
+        self.requests = 0
+        self.range_headers = []  # Заголовок Range каждого запроса файла (None — без Range)
+        self.revoked_signatures = set()  # Подписи ссылок на стрим, которые сервер отклоняет до срока
+        self._signatures = 0
+        self._requests_lock = threading.Lock()
+        self._audio = {}
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-soundcloud", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    def count_request(self):
+        with self._requests_lock:
+            self.requests += 1
+
+    def signed_audio_url(self, track_id):
+        """
+        Ссылка на файл трека с подписью и сроком действия (параметры Expires и Signature).
+        """
+        with self._requests_lock:
+            self._signatures += 1
+            signature = self._signatures
+        expires = int(time.time() + self.settings.url_ttl)
+        return f"{self.base_url}/audio/{track_id}.mp3?Expires={expires}&Signature={signature}"
+
+    def track(self, track_id, query=""):
+        """
+        Трек в формате ответа api-v2 /search/tracks.
+        """
+        return {
+            "id": track_id,
+            "title": f"{query or 'Track'} {track_id}",
+            "genre": ("Rock", "Jazz", "Techno", "Pop")[track_id % 4],
+            "created_at": f"20{10 + track_id % 15}-01-01T00:00:00Z",
+            "artwork_url": None,
+            "user": {"username": f"Artist {track_id % 50}", "avatar_url": None},
+            "publisher_metadata": {},
+            "media": {"transcodings": [
+                {"url": f"{self.base_url}/media/{track_id}/stream/hls", "format": {"protocol": "hls"}},
+                {"url": f"{self.base_url}/media/{track_id}/stream/progressive", "format": {"protocol": "progressive"}},
+            ]},
+        }
+
+    def audio_bytes(self, track_id, size):
+        """
+        Содержимое «mp3»: у каждого трека своё, чтобы не срабатывала проверка дубликатов.
+        """
+        key = (track_id, size)
+        data = self._audio.get(key)
+        if data is None:
+            block = random.Random(track_id).randbytes(64 * 1024)
+            data = (block * (size // len(block) + 1))[:size]
+            self._audio[key] = data
+        return data
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Локальный сервер, имитирующий SoundCloud")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeSoundCloudServer(
+        FakeSoundCloudSettings(args.latency, args.bandwidth, args.error_rate, args.stall_rate),
+        port=args.port
+    )
+    print(f"Сервер запущен: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,284 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from api_clients import soundcloud_client
+from api_clients.http_client import get_api_client
+from benchmarks.fake_soundcloud import FakeSoundCloudServer, FakeSoundCloudSettings
+from benchmarks.synthetic_library import LIBRARY_SIZES, ensure_library
+from database.base_init import initialize_database
+from database.connection import close_all_connections
+from database.db_manager import DatabaseManager
+from download.downloader import TrackDownloader
+
+# Формат файла результатов: при несовместимых изменениях compare.py откажется сравнивать
+RESULTS_VERSION = 1
+DEFAULT_DATA_DIR = os.path.join("benchmarks", "data")
+DEFAULT_RESULTS_DIR = os.path.join("benchmarks", "results")
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Диагностика приложения идёт в print: во время замера она только искажала бы время.
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Results:
+    """
+    Метрики прогона: имя -> значение, единица измерения и что лучше (lower/higher).
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, better="lower"):
+        self.metrics[name] = {"value": round(value, 4), "unit": unit, "better": better}
+        print(f"  {name}: {value:.3f} {unit}")
+
+    def add_latencies(self, name, seconds):
+        self.add(f"{name}.p50_ms", percentile(seconds, 0.5) * 1000, "ms")
+        self.add(f"{name}.p95_ms", percentile(seconds, 0.95) * 1000, "ms")
+
+    def save(self, path, meta):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"version": RESULTS_VERSION, "meta": meta, "metrics": self.metrics},
+                      file, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены: {path}")
+
+
+def bench_search(results, server, queries):
+    """
+    Задержка поиска (первая и следующая страница) и получения ссылки на стрим.
+    Кэш поиска отключён, ограничение частоты запросов тоже — меряется сам запрос.
+    """
+    print("Поиск")
+    soundcloud_client.BASE_URL = server.base_url
+    get_api_client().rate_limiter.set_rate(0)
+
+    first, following, resolve = [], [], []
+    with quiet():
+        for i in range(queries):
+            started = time.perf_counter()
+            tracks, next_href = soundcloud_client._search_first_page(f"query {i}", 20, use_cache=False)
+            first.append(time.perf_counter() - started)
+
+            if next_href:
+                started = time.perf_counter()
+                soundcloud_client._search_next_page(next_href)
+                following.append(time.perf_counter() - started)
+
+            transcoding_url = soundcloud_client.find_progressive_transcoding(tracks[0])
+            started = time.perf_counter()
+            soundcloud_client.get_stream_url(transcoding_url)
+            resolve.append(time.perf_counter() - started)
+
+    results.add_latencies("search.first_page", first)
+    if following:
+        results.add_latencies("search.next_page", following)
+    results.add_latencies("search.resolve_stream", resolve)
+
+
+def _enqueue_items(prefix, count):
+    return [
+        {"title": f"Bench {prefix} {i}", "artist": f"Bench Artist {i % 100}",
+         "download_url": f"https://example.invalid/{prefix}/{i}.mp3", "track_id": f"bench:{prefix}:{i}"}
+        for i in range(count)
+    ]
+
+
+def bench_enqueue(results, library, size_name, count):
+    """
+    Добавление в очередь по одному треку (add_track) и пакетом (add_tracks) в копию библиотеки.
+    """
+    print(f"Добавление в очередь ({size_name})")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "library.db")
+        shutil.copyfile(library, path)
+        db = DatabaseManager(path)
+        with quiet():
+            single = _enqueue_items("single", count // 10)
+            started = time.perf_counter()
+            for item in single:
+                db.add_track(item["title"], item["artist"], item["download_url"], item["track_id"])
+            single_elapsed = time.perf_counter() - started
+
+            batch = _enqueue_items("batch", count)
+            started = time.perf_counter()
+            db.add_tracks(batch)
+            batch_elapsed = time.perf_counter() - started
+        close_all_connections()
+
+    results.add(f"enqueue.{size_name}.single_per_s", len(single) / single_elapsed, "tracks/s", "higher")
+    results.add(f"enqueue.{size_name}.batch_per_s", len(batch) / batch_elapsed, "tracks/s", "higher")
+
+
+def _timed(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_queue(results, library, size_name, repeats):
+    """
+    Запросы очереди загрузки: первая страница, страница из середины и подсчёт строк.
+    """
+    print(f"Очередь загрузки ({size_name})")
+    db = DatabaseManager(library)
+    with quiet():
+        total = db.count_download_queue()
+        middle = max(0, total // 2)
+        first_page = _timed(lambda: db.get_download_queue(limit=200, offset=0), repeats)
+        middle_page = _timed(lambda: db.get_download_queue(limit=200, offset=middle), repeats)
+        count = _timed(db.count_download_queue, repeats)
+    results.add_latencies(f"queue.{size_name}.first_page", first_page)
+    results.add_latencies(f"queue.{size_name}.middle_page", middle_page)
+    results.add_latencies(f"queue.{size_name}.count", count)
+
+
+def bench_gui_refresh(results, library, size_name, repeats, visible_rows=20):
+    """
+    Стоимость обновления списка очереди в GUI: создание QueueRows и чтение видимых строк
+    сверху и из середины списка (то, что делает VirtualList.render). Отрисовка виджетов
+    не входит — для неё нужен дисплей, а её стоимость не зависит от размера библиотеки.
+    """
+    try:
+        from gui.gui import QueueRows
+    except ImportError as e:
+        print(f"Замер обновления GUI пропущен: {e}")
+        return
+
+    print(f"Обновление GUI ({size_name})")
+    db = DatabaseManager(library)
+
+    def refresh():
+        rows = QueueRows(db)
+        for start in (0, len(rows) // 2):
+            for index in range(start, min(len(rows), start + visible_rows)):
+                rows[index]
+
+    with quiet():
+        timings = _timed(refresh, repeats)
+    results.add_latencies(f"gui.{size_name}.queue_refresh", timings)
+
+
+def bench_download(results, server, worker_counts, tracks):
+    """
+    Пропускная способность загрузчика для разного числа потоков (МБ/с на всю очередь).
+    Лимит соединений на хост поднимается до числа потоков: все треки идут с одного сервера.
+    """
+    for workers in worker_counts:
+        print(f"Скачивание, потоков: {workers}")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "library.db")
+            with quiet():
+                initialize_database(path)
+                db = DatabaseManager(path)
+                db.add_tracks([
+                    {"title": f"Download {i}", "artist": "Bench", "track_id": f"dl:{i}",
+                     "download_url": f"{server.base_url}/audio/{i}.mp3"}
+                    for i in range(tracks)
+                ])
+                downloader = TrackDownloader(db, os.path.join(temp_dir, "downloads"), workers=workers)
+                downloader.scheduler.set_per_host_limit(workers)
+                started = time.perf_counter()
+                downloader.process_downloads()
+                elapsed = time.perf_counter() - started
+                complete = db.connection.execute(
+                    "SELECT COUNT(*) FROM downloaded_tracks WHERE status = 'complete'"
+                ).fetchone()[0]
+            close_all_connections()
+
+        megabytes = complete * server.settings.track_size / (1024 * 1024)
+        results.add(f"download.workers_{workers}.mb_per_s", megabytes / elapsed, "MB/s", "higher")
+        results.add(f"download.workers_{workers}.completed", complete, "tracks", "higher")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности DriveBeats без сети")
+    parser.add_argument("--sizes", default="1k,100k,1M",
+                        help="размеры синтетических библиотек через запятую: " + ", ".join(LIBRARY_SIZES))
+    parser.add_argument("--workers", default="1,2,4", help="количество потоков скачивания для замера")
+    parser.add_argument("--output", help="файл результатов JSON (по умолчанию benchmarks/results/<время>.json)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="папка для синтетических баз")
+    parser.add_argument("--regenerate", action="store_true", help="пересоздать синтетические базы")
+    parser.add_argument("--repeats", type=int, default=20, help="повторов для замеров запросов")
+    parser.add_argument("--queries", type=int, default=30, help="количество поисковых запросов")
+    parser.add_argument("--enqueue", type=int, default=5000, help="треков для замера пакетного добавления")
+    parser.add_argument("--download-tracks", type=int, default=16, help="треков для замера скачивания")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа сервера, с")
+    parser.add_argument("--bandwidth", type=int, default=2 * 1024 * 1024,
+                        help="скорость отдачи файла на соединение, байт/с (0 — без ограничения)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="доля загрузок с зависанием")
+    parser.add_argument("--track-size", type=int, default=512 * 1024, help="размер mp3, байт")
+    args = parser.parse_args(argv)
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in LIBRARY_SIZES]
+    if unknown:
+        parser.error(f"неизвестные размеры библиотеки: {', '.join(unknown)}")
+    worker_counts = [int(count) for count in args.workers.split(",") if count.strip()]
+
+    settings = FakeSoundCloudSettings(
+        latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate,
+        stall_rate=args.stall_rate, track_size=args.track_size
+    )
+    results = Results()
+    with FakeSoundCloudServer(settings) as server:
+        bench_search(results, server, args.queries)
+        bench_download(results, server, worker_counts, args.download_tracks)
+
+    for size_name in sizes:
+        with quiet():
+            library = ensure_library(args.data_dir, size_name, args.regenerate)
+        bench_queue(results, library, size_name, args.repeats)
+        bench_gui_refresh(results, library, size_name, args.repeats)
+        bench_enqueue(results, library, size_name, args.enqueue)
+        close_all_connections()
+
+    meta = {
+        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "data_dir")},
+    }
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    results.save(output, meta)
+
+
+if __name__ == "__main__":
+    main()
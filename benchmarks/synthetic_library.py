@@ -0,0 +1,76 @@
+import datetime
+import os
+import random
+import sqlite3
+import time
+
+from database.base_init import initialize_database
+from database.migrations import rebuild_library_stats
+
+# Размеры библиотек для замеров: название -> количество строк downloaded_tracks
+LIBRARY_SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+
+_GENRES = ("Rock", "Jazz", "Techno", "Pop", "House", "Metal", "Folk", "Hip-Hop", None)
+# Доли статусов: большая часть библиотеки скачана, остальное — очередь и ошибки
+_STATUSES = ("complete",) * 85 + ("pending",) * 10 + ("error",) * 5
+_INSERT_BATCH = 10_000
+
+
+def _rows(count, seed):
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        artist = f"Artist {int(rng.paretovariate(1.1)) % 20_000}"
+        status = rng.choice(_STATUSES)
+        added = (start + datetime.timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S")
+        file_path = f"downloads/{artist} - Track {i}.mp3" if status == "complete" else ""
+        yield (
+            f"Track {i}", artist, f"Album {i // 12}", rng.choice(_GENRES), rng.randint(1970, 2026),
+            added, file_path, f"https://example.invalid/{i}.mp3", f"synthetic:{i}", "soundcloud", status,
+            int(status == "complete"), added if status == "complete" else None
+        )
+
+
+def generate_library(path, count, seed=1):
+    """
+    Создаёт базу с актуальной схемой и count синтетическими треками.
+    Строки вставляются пакетами из генератора, поэтому память не зависит от размера.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    initialize_database(path)
+
+    conn = sqlite3.connect(path)
+    try:
+        rows = _rows(count, seed)
+        while True:
+            batch = [row for _, row in zip(range(_INSERT_BATCH), rows)]
+            if not batch:
+                break
+            conn.executemany("""
+                INSERT INTO downloaded_tracks
+                (track_title, artist, album, genre, release_year, download_date, file_path, url, track_id,
+                 source, status, file_present, completed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch)
+            conn.commit()
+        # Сводные таблицы заполняются триггерами только при смене статуса, а строки вставлены сразу готовыми
+        rebuild_library_stats(conn.cursor())
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def ensure_library(directory, name, regenerate=False):
+    """
+    Путь к синтетической базе размера name (см. LIBRARY_SIZES); база создаётся один раз и переиспользуется.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"music_library_{name}.db")
+    if regenerate or not os.path.exists(path):
+        print(f"Создание синтетической библиотеки {name}...")
+        started = time.perf_counter()
+        generate_library(path, LIBRARY_SIZES[name])
+        print(f"Библиотека {name} создана за {time.perf_counter() - started:.1f} с")
+    return path
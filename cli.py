@@ -0,0 +1,376 @@
+"""
+Консольный режим DriveBeats без окна: поиск, добавление в очередь из файла,
+фоновое скачивание (демон) и состояние очереди. Не импортирует Tk и PIL,
+поэтому работает на сервере без графического окружения.
+
+    python cli.py search "daft punk" --limit 10
+    python cli.py enqueue batch.txt
+    python cli.py run --workers 4
+    python cli.py status
+"""
+import argparse
+import re
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    DB_PATH,
+    DOWNLOAD_WORKERS,
+    SEARCH_PROVIDERS,
+    DAEMON_POLL_INTERVAL,
+    DAEMON_STATUS_INTERVAL,
+    CLI_RESULTS_PER_QUERY,
+    CLI_ENQUEUE_BATCH,
+    SHUTDOWN_JOIN_TIMEOUT,
+)
+from database.base_init import initialize_database
+from database.db_manager import DatabaseManager
+from database.connection import close_all_connections
+from api_clients.federated_search import FederatedSearch, MergedResults, PROVIDER_CLASSES, build_providers
+from api_clients.soundcloud_client import get_search_cache
+from download.downloader import TrackDownloader
+from download.events import STARTED, PROGRESS, FINISHED, FAILED
+from download.library_scanner import LibraryScanner
+from tagging.id3_editor import TaggingPipeline
+from api_clients.musicbrainz_client import get_musicbrainz_client
+from monitoring.metrics import configure_metrics, get_metrics
+from monitoring.profiler import profiler_from_env
+
+# Строка файла — ID трека: "soundcloud:123", "audius:AbC1" или просто число (ID SoundCloud)
+TRACK_ID_PATTERN = re.compile(
+    r"^(?:(?P<source>" + "|".join(PROVIDER_CLASSES) + r"):(?P<id>\S+)|(?P<number>\d+))$"
+)
+STATUS_LABELS = {
+    "pending": "В очереди",
+    "downloading": "Скачивается",
+    "complete": "Скачано",
+    "error": "Ошибка",
+}
+
+
+def search_batch(federated, queries, limit):
+    """
+    Блокирующий поиск по нескольким запросам: ответы источников ждутся не дольше общего срока.
+    Возвращает {запрос: объединённые треки в порядке ранжирования}.
+    Запросы выполняются одновременно группами, которые целиком помещаются в пул федеративного поиска:
+    иначе задачи ждали бы в очереди пула и истекал бы их срок.
+    """
+    group = max(1, FederatedSearch.WORKERS // max(1, len(federated.providers)))
+    results = {}
+    for start in range(0, len(queries), group):
+        runs = [(query, federated.search(query, limit=limit)) for query in queries[start:start + group]]
+        for query, run in runs:
+            merged = MergedResults(federated.providers)
+            for page in run.pages():
+                merged.add(page)
+            if run.failed or run.timed_out:
+                print(f"'{query}': без ответа от {', '.join(run.failed + run.timed_out)}")
+            results[query] = [merged.entries[key]["hit"] for key in merged.ranked()]
+    return results
+
+
+def parse_line(line):
+    """
+    ("id", источник, ID) для строки с ID трека, ("query", None, запрос) для поискового запроса
+    или None для пустой строки и комментария (#).
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    match = TRACK_ID_PATTERN.match(line)
+    if match and match.group("number"):
+        return "id", "soundcloud", match.group("number")
+    if match:
+        return "id", match.group("source"), match.group("id")
+    return "query", None, line
+
+
+def read_batches(file, size):
+    batch = []
+    for line in file:
+        parsed = parse_line(line)
+        if parsed is None:
+            continue
+        batch.append(parsed)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def to_queue_item(hit):
+    return {
+        "title": hit["title"],
+        "artist": hit["artist"] or "Unknown Artist",
+        "download_url": hit.get("stream_url"),
+        "transcoding_url": hit.get("transcoding_url"),
+        "track_id": hit["track_id"],
+        "album": hit.get("album"),
+        "genre": hit.get("genre"),
+        "release_year": hit.get("release_year"),
+        "artwork_url": hit.get("artwork_url"),
+        "source": hit.get("source"),
+    }
+
+
+def enqueue_hits(db, hits):
+    """
+    Добавляет треки в очередь одной транзакцией. Подписанная ссылка на стрим истекает,
+    пока трек ждёт в очереди, поэтому сохраняется transcoding URL — свежую ссылку
+    загрузчик получает перед скачиванием.
+    Возвращает список статусов add_tracks и количество треков без ссылки.
+    """
+    items = []
+    missing = 0
+    for hit in hits:
+        if not (hit.get("stream_url") or hit.get("transcoding_url")):
+            print(f"Нет ссылки на поток для трека: {hit['artist']} — {hit['title']}")
+            missing += 1
+            continue
+        items.append(to_queue_item(hit))
+    return db.add_tracks(items), missing
+
+
+def print_hits(federated, hits):
+    for number, hit in enumerate(hits, 1):
+        provider = federated.provider(hit["source"])
+        label = provider.label if provider else hit["source"]
+        if not hit["downloadable"]:
+            label += ", превью"
+        print(f"{number:>3}. {hit['artist']} — {hit['title']} [{label}]  {hit['track_id']}")
+
+
+def command_search(args):
+    federated = FederatedSearch(build_providers(args.providers))
+    hits = search_batch(federated, [args.query], args.limit)[args.query]
+    if not hits:
+        print("Ничего не найдено")
+        return 1
+    print_hits(federated, hits)
+    if args.enqueue:
+        downloadable = [hit for hit in hits if hit["downloadable"]][:args.enqueue]
+        enqueue_hits(DatabaseManager(args.db), downloadable)
+    return 0
+
+
+def command_enqueue(args):
+    """
+    Добавление в очередь из файла: строки с ID треков ищутся напрямую, остальные — как запросы,
+    из результатов запроса берутся первые per_query треков, которые можно скачать.
+    Файл читается порциями по CLI_ENQUEUE_BATCH строк, каждая порция — одна транзакция.
+    """
+    db = DatabaseManager(args.db)
+    federated = FederatedSearch(build_providers(args.providers))
+    # Треки по ID ищутся в своём источнике, даже если он не включён в поиск
+    lookup_providers = {provider.name: provider for provider in build_providers(PROVIDER_CLASSES)}
+    totals = {"added": 0, "requeued": 0, "duplicate": 0, "not_found": 0, "error": 0}
+
+    file = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    try:
+        with ThreadPoolExecutor(max_workers=4, thread_name_prefix="lookup") as lookups:
+            for batch in read_batches(file, CLI_ENQUEUE_BATCH):
+                hits = []
+                id_futures = []
+                for kind, source, value in batch:
+                    if kind == "id":
+                        id_futures.append((value, lookups.submit(lookup_providers[source].lookup, value)))
+
+                queries = [value for kind, _, value in batch if kind == "query"]
+                for query, found in search_batch(federated, queries, args.limit).items():
+                    downloadable = [hit for hit in found if hit["downloadable"]][:args.per_query]
+                    if not downloadable:
+                        print(f"'{query}': нечего скачать")
+                        totals["not_found"] += 1
+                    hits.extend(downloadable)
+
+                for value, future in id_futures:
+                    hit = future.result()
+                    if hit is None:
+                        print(f"Трек {value} не найден")
+                        totals["not_found"] += 1
+                    else:
+                        hits.append(dict(hit, downloadable=True))
+
+                statuses, missing = enqueue_hits(db, hits)
+                totals["not_found"] += missing
+                for success, status in statuses:
+                    totals[status if status in totals else "error"] += 1
+    finally:
+        if file is not sys.stdin:
+            file.close()
+        close_all_connections()
+
+    print(f"Добавлено: {totals['added']}, восстановлено: {totals['requeued']}, "
+          f"уже в библиотеке: {totals['duplicate']}, не найдено: {totals['not_found']}, "
+          f"ошибок: {totals['error']}")
+    return 1 if totals["error"] else 0
+
+
+def print_status(db, errors=0):
+    counts = db.count_by_status()
+    parts = [f"{STATUS_LABELS.get(status, status)}: {count}" for status, count in sorted(counts.items())]
+    print(", ".join(parts) if parts else "Очередь пуста")
+    if errors:
+        for row in db.get_recent_errors(errors):
+            state = "ждёт повтора" if row["status"] == "pending" else "ошибка"
+            print(f"  [{row['last_error_at']}] {row['artist']} — {row['track_title']} "
+                  f"({state}, попыток {row['retry_count']}): {row['error_message']}")
+
+
+def command_status(args):
+    db = DatabaseManager(args.db)
+    print_status(db, args.errors)
+    close_all_connections()
+    return 0
+
+
+def command_run(args):
+    """
+    Демон скачивания: обрабатывает очередь и ждёт новых треков (их можно добавлять
+    из другого процесса через enqueue). SIGTERM и Ctrl+C останавливают его штатно:
+    текущие загрузки возвращаются в очередь, .part файлы остаются для докачки.
+    """
+    configure_metrics()
+    profiler = profiler_from_env()
+    db = DatabaseManager(args.db)
+    db.requeue_interrupted()
+
+    downloader = TrackDownloader(db, args.download_dir, workers=args.workers)
+    if args.per_host:
+        downloader.scheduler.set_per_host_limit(args.per_host)
+    if args.bandwidth is not None:
+        downloader.scheduler.set_bandwidth_limit(args.bandwidth * 1024)
+    tagger = None
+    if not args.no_tags:
+        tagger = TaggingPipeline(db, metadata=get_musicbrainz_client(args.db))
+        downloader.add_completion_listener(tagger.on_download_finished)
+        # Теги, не записанные прошлым запуском (задания отменены при выходе), дописываются в фоне
+        tagger.retag_library(only_untagged=True)
+    scanner = LibraryScanner(db, directories=[downloader.download_dir])
+    scanner.start()
+
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        if not stopping.is_set():
+            print(f"Получен сигнал {signal.Signals(signum).name}, останавливаем скачивание...")
+            stopping.set()
+            downloader.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    def report():
+        # Периодическая сводка по событиям загрузчика. Канал событий нужно вычитывать
+        # и без окна: иначе события прогресса копились бы в памяти всё время работы демона
+        speeds = {}  # id трека -> последняя скорость, байт/с
+        while not stopping.wait(args.status_interval):
+            finished = failed = 0
+            while True:
+                events = downloader.events.drain()
+                if not events:
+                    break
+                for event in events:
+                    if event.kind in (STARTED, PROGRESS):
+                        speeds[event.track_id] = event.speed
+                    else:
+                        speeds.pop(event.track_id, None)
+                        finished += event.kind == FINISHED
+                        failed += event.kind == FAILED
+            print_status(db)
+            print(f"За {args.status_interval:.0f} с скачано: {finished}, ошибок: {failed}; "
+                  f"активных: {len(speeds)}, {sum(speeds.values()) / 1024:.0f} КБ/с")
+        db.release_connection()
+
+    reporter = threading.Thread(target=report, name="status", daemon=True)
+    reporter.start()
+
+    print(f"Демон скачивания запущен, потоков: {downloader.worker_count}")
+    try:
+        if args.exit_when_empty:
+            downloader.process_downloads()
+            # Очередь скачана — дожидаемся записи тегов (MusicBrainz отвечает не чаще раза в секунду);
+            # сигнал остановки прерывает ожидание
+            while tagger is not None and not stopping.is_set() and not tagger.join(1):
+                pass
+        else:
+            downloader.run_forever(args.poll_interval)
+    finally:
+        stopping.set()
+        reporter.join(5)
+        scanner.stop()
+        # Подключения к базе закрываются только после того, как сканер закончит проход
+        if not scanner.join(SHUTDOWN_JOIN_TIMEOUT):
+            print(f"Сканер библиотеки не завершился за {SHUTDOWN_JOIN_TIMEOUT} с")
+        if tagger is not None:
+            tagger.shutdown()
+        print_status(db)
+        close_all_connections()
+        if profiler is not None:
+            profiler.stop()
+        get_metrics().shutdown()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="DriveBeats без окна: поиск и пакетное скачивание")
+    parser.add_argument("--db", default=DB_PATH, help="файл базы данных (по умолчанию %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    providers = dict(
+        type=lambda value: tuple(name.strip() for name in value.split(",") if name.strip()),
+        default=SEARCH_PROVIDERS,
+        help="источники поиска через запятую (по умолчанию " + ",".join(SEARCH_PROVIDERS) + ")"
+    )
+
+    search_parser = commands.add_parser("search", help="найти треки во всех источниках")
+    search_parser.add_argument("query", help="поисковый запрос")
+    search_parser.add_argument("--limit", type=int, default=20, help="треков с каждого источника")
+    search_parser.add_argument("--providers", **providers)
+    search_parser.add_argument("--enqueue", type=int, default=0, metavar="N",
+                               help="добавить в очередь первые N найденных треков")
+    search_parser.set_defaults(handler=command_search)
+
+    enqueue_parser = commands.add_parser(
+        "enqueue", help="добавить в очередь треки из файла (строка — запрос или ID вида soundcloud:123)"
+    )
+    enqueue_parser.add_argument("file", help="файл со строками запросов или ID, '-' — стандартный ввод")
+    enqueue_parser.add_argument("--per-query", type=int, default=CLI_RESULTS_PER_QUERY,
+                                help="сколько треков добавлять на каждый запрос")
+    enqueue_parser.add_argument("--limit", type=int, default=10, help="треков с каждого источника на запрос")
+    enqueue_parser.add_argument("--providers", **providers)
+    enqueue_parser.set_defaults(handler=command_enqueue)
+
+    run_parser = commands.add_parser("run", help="скачивать очередь в фоне до остановки (SIGTERM, Ctrl+C)")
+    run_parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS, help="потоков скачивания")
+    run_parser.add_argument("--per-host", type=int, help="одновременных загрузок с одного сервера")
+    run_parser.add_argument("--bandwidth", type=int, help="общий предел скорости, КБ/с (0 — без ограничения)")
+    run_parser.add_argument("--download-dir", default="downloads", help="папка для файлов")
+    run_parser.add_argument("--no-tags", action="store_true", help="не записывать ID3-теги")
+    run_parser.add_argument("--exit-when-empty", action="store_true",
+                            help="завершиться, когда очередь опустеет и теги будут записаны")
+    run_parser.add_argument("--poll-interval", type=float, default=DAEMON_POLL_INTERVAL,
+                            help="проверка пустой очереди на новые треки, с")
+    run_parser.add_argument("--status-interval", type=float, default=DAEMON_STATUS_INTERVAL,
+                            help="период вывода сводки, с")
+    run_parser.set_defaults(handler=command_run)
+
+    status_parser = commands.add_parser("status", help="состояние очереди и последние ошибки")
+    status_parser.add_argument("--errors", type=int, default=10, help="сколько последних ошибок показать")
+    status_parser.set_defaults(handler=command_status)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    initialize_database(args.db)
+    # Кэш поиска — в той же базе, что и очередь
+    get_search_cache(args.db)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# Общие настройки приложения
+
+# Путь к базе данных
+DB_PATH = "database/music_library.db"
+
+# Количество параллельных потоков скачивания по умолчанию
+DOWNLOAD_WORKERS = 1
+
+# Варианты, доступные в переключателе потоков в GUI
+DOWNLOAD_WORKER_CHOICES = (1, 2, 4)
+
+# Таймауты скачивания (секунды): на установку соединения и на ожидание данных.
+# Таймаут чтения длиннее окна сторожа (DOWNLOAD_STALL_WINDOW): зависание определяет сторож,
+# а таймаут сокета — только последняя страховка
+DOWNLOAD_CONNECT_TIMEOUT = 10
+DOWNLOAD_READ_TIMEOUT = 90
+
+# Размер буфера, через который данные пишутся на диск (переиспользуется каждым потоком)
+DOWNLOAD_BUFFER_SIZE = 256 * 1024
+
+# Расширение недокачанных файлов
+PARTIAL_SUFFIX = ".part"
+
+# Получение ссылок на стрим: размер пула потоков и время жизни ссылки в кэше (секунды),
+# если срок действия нельзя определить по самой ссылке; сколько ссылок держать в кэше
+STREAM_RESOLVE_WORKERS = 4
+STREAM_URL_TTL = 600
+STREAM_URL_CACHE_ENTRIES = 2000
+
+# Кэш результатов поиска: время актуальности (секунды), размер LRU в памяти (запросов)
+# и предельный объём таблицы в базе (байт). Устаревшие записи отдаются при отсутствии сети.
+SEARCH_CACHE_TTL = 60 * 60
+SEARCH_CACHE_MEMORY_ENTRIES = 64
+SEARCH_CACHE_MAX_BYTES = 20 * 1024 * 1024
+
+# SQLite: сколько ждать освобождения блокировки (мс) и сколько подготовленных запросов
+# держать в кэше каждого подключения
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHED_STATEMENTS = 256
+
+# Как часто поток скачивания публикует прогресс (секунды) и как часто GUI
+# забирает события из канала (миллисекунды)
+PROGRESS_EVENT_INTERVAL = 0.25
+GUI_EVENT_POLL_MS = 100
+
+# HTTP-клиент API: таймауты (секунды), повторы с экспоненциальной задержкой на 429/5xx,
+# ограничение частоты запросов (запросов в секунду и размер «пачки»)
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 15
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 10
+API_RATE_LIMIT = 5
+API_RATE_BURST = 10
+
+# Автомат защиты: после стольких ошибок подряд запросы к хосту сразу отклоняются
+# на CIRCUIT_RESET_TIMEOUT секунд
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30
+
+# Планировщик загрузок: одновременных соединений к одному хосту
+# и общий предел скорости всех потоков (байт/с, 0 — без ограничения)
+DOWNLOAD_PER_HOST_LIMIT = 2
+DOWNLOAD_PER_HOST_CHOICES = (1, 2, 4)
+DOWNLOAD_BANDWIDTH_LIMIT = 0
+DOWNLOAD_BANDWIDTH_CHOICES = (0, 256 * 1024, 1024 * 1024, 5 * 1024 * 1024)
+
+# Сторож зависших загрузок: если за окно (секунды) средняя скорость ниже минимальной (байт/с),
+# загрузка прерывается и уходит на повтор
+DOWNLOAD_STALL_MIN_RATE = 4 * 1024
+DOWNLOAD_STALL_WINDOW = 30
+
+# Повторы неудачных загрузок: задержка растёт экспоненциально от BASE до MAX секунд,
+# после DOWNLOAD_MAX_RETRIES повторов трек получает статус error
+DOWNLOAD_MAX_RETRIES = 5
+DOWNLOAD_RETRY_BASE = 30
+DOWNLOAD_RETRY_MAX = 30 * 60
+
+# Фоновый сканер библиотеки: пауза между проходами (секунды) и расширения аудиофайлов
+LIBRARY_SCAN_INTERVAL = 300
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".ogg", ".opus", ".flac", ".wav")
+
+# Запись ID3-тегов: потоков (отдельно от потоков скачивания), обложек в памяти и папка кэша обложек
+TAGGING_WORKERS = 2
+COVER_CACHE_ENTRIES = 32
+COVER_CACHE_DIR = "database/covers"
+
+# MusicBrainz: не больше одного запроса в секунду, ответы хранятся в базе MUSICBRAINZ_CACHE_TTL секунд.
+# Совпадения с оценкой ниже MUSICBRAINZ_MIN_SCORE (из 100) не используются
+MUSICBRAINZ_URL = "https://musicbrainz.org/ws/2"
+MUSICBRAINZ_USER_AGENT = "DriveBeats/1.0 (https://github.com/Vuzy007/DriveBeats)"
+MUSICBRAINZ_RATE_INTERVAL = 1.0
+MUSICBRAINZ_CACHE_TTL = 30 * 24 * 3600
+MUSICBRAINZ_MIN_SCORE = 90
+
+# Федеративный поиск: включённые источники (в порядке приоритета при совпадениях)
+# и общий срок ожидания ответов (секунды) — опоздавшие источники пропускаются
+SEARCH_PROVIDERS = ("soundcloud", "audius", "deezer")
+SEARCH_DEADLINE = 8
+# Имя приложения, которое Audius просит передавать в параметре app_name
+AUDIUS_APP_NAME = "DriveBeats"
+
+# Рекомендации: файл кэша матриц совместной встречаемости, размер пакета при расчёте сходства
+# и вес совместных загрузок (артисты, скачанные в один день) относительно общих жанров
+RECOMMENDER_CACHE_PATH = "database/recommender_cache.npz"
+RECOMMENDER_BATCH = 64
+RECOMMENDER_SESSION_WEIGHT = 0.5
+
+# Метрики производительности: сбор включён, интервал сброса сводки в журналы (секунды),
+# порог медленной операции (мс) — такие операции записываются по отдельности
+METRICS_ENABLED = True
+METRICS_FLUSH_INTERVAL = 30
+METRICS_SLOW_SPAN_MS = 500
+# Журнал с ротацией (размер файла, байт, и количество старых копий) и файл метрик в формате JSON lines
+METRICS_LOG_PATH = "logs/drivebeats.log"
+METRICS_LOG_MAX_BYTES = 5 * 1024 * 1024
+METRICS_LOG_BACKUPS = 3
+METRICS_JSONL_PATH = "logs/metrics.jsonl"
+
+# Профилировщик (включается вручную или переменной окружения DRIVEBEATS_PROFILE=1):
+# интервал между снимками стеков (секунды) и файл результата в формате collapsed stacks
+PROFILER_INTERVAL = 0.01
+PROFILER_OUTPUT_PATH = "logs/profile.folded"
+
+# Консольный режим (cli.py): как часто демон проверяет пустую очередь на новые треки и
+# печатает сводку (секунды), сколько найденных треков добавлять на каждый запрос из файла
+DAEMON_POLL_INTERVAL = 5
+DAEMON_STATUS_INTERVAL = 60
+CLI_RESULTS_PER_QUERY = 1
+# Строк файла, обрабатываемых за один проход при добавлении в очередь из файла (cli.py enqueue):
+# каждый проход — одна транзакция; в очередь пишется transcoding URL, ссылку на стрим получает загрузчик
+CLI_ENQUEUE_BATCH = 50
+
+# Сколько секунд при выходе ждать завершения потоков скачивания и сканера,
+# прежде чем закрыть подключения к базе: прерванная загрузка успевает вернуть трек в очередь
+SHUTDOWN_JOIN_TIMEOUT = 10
@@ -0,0 +1,163 @@
+import sqlite3
+import threading
+
+from config import DB_PATH, DB_BUSY_TIMEOUT_MS, DB_CACHED_STATEMENTS
+from monitoring.metrics import get_metrics
+
+# Длина текста запроса в журнале медленных операций
+SQL_PREVIEW_LENGTH = 200
+
+
+def _statement_kind(sql):
+    words = sql.split(None, 1)
+    return words[0].lower() if words else "empty"
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Курсор с замером запросов: гистограмма db.<select|insert|update|...> на каждый вид запроса.
+    Для SELECT замеряется выполнение до первой строки, чтение остальных строк идёт уже у вызывающего.
+    """
+
+    def execute(self, sql, parameters=()):
+        with get_metrics().span(f"db.{_statement_kind(sql)}", sql=sql.strip()[:SQL_PREVIEW_LENGTH]):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with get_metrics().span(f"db.{_statement_kind(sql)}_many", sql=sql.strip()[:SQL_PREVIEW_LENGTH]):
+            return super().executemany(sql, seq_of_parameters)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Подключение, все запросы которого идут через InstrumentedCursor; фиксация транзакции замеряется отдельно (db.commit).
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        with get_metrics().span("db.commit"):
+            super().commit()
+
+
+class ConnectionManager:
+    """
+    Пул подключений к одной базе SQLite: каждый поток получает собственное подключение.
+    Подключения открываются в режиме WAL, поэтому чтение в GUI не ждёт записи из потоков скачивания.
+    Подключение завершившегося потока возвращается в пул и переиспользуется.
+    """
+
+    def __init__(self, db_path=DB_PATH, busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+                 cached_statements=DB_CACHED_STATEMENTS):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []  # Все открытые подключения — для закрытия при выходе
+        self._idle = []  # Свободные подключения, которые можно отдать новому потоку
+        self._closed = False
+
+    def connection(self):
+        """
+        Подключение текущего потока (создаётся или берётся из пула при первом обращении).
+        """
+        conn = getattr(self._local, "connection", None)
+        if conn is not None:
+            return conn
+
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Пул подключений закрыт")
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open()
+            with self._lock:
+                self._all.append(conn)
+        self._local.connection = conn
+        return conn
+
+    def release(self):
+        """
+        Возвращает подключение текущего потока в пул (вызывается при завершении рабочего потока).
+        """
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            return
+        self._local.connection = None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.ProgrammingError:
+            # Пул уже закрыт при выходе, подключение закрыто вместе с остальными
+            return
+        with self._lock:
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.append(conn)
+
+    def close_all(self):
+        """
+        Закрывает все подключения пула (при завершении приложения).
+        """
+        with self._lock:
+            self._closed = True
+            connections, self._all, self._idle = self._all, [], []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Ошибка закрытия подключения к базе: {e}")
+        self._local = threading.local()
+
+    def _open(self):
+        # check_same_thread=False: подключение может перейти к другому потоку через пул,
+        # но одновременно им всегда пользуется только один поток
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            factory=InstrumentedConnection
+        )
+        conn.row_factory = sqlite3.Row  # Позволяет обращаться к полям по имени
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        return conn
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path=DB_PATH):
+    """
+    Общий пул подключений для файла базы данных.
+    """
+    with _managers_lock:
+        manager = _managers.get(db_path)
+        if manager is None or manager._closed:
+            manager = ConnectionManager(db_path)
+            _managers[db_path] = manager
+            print(f"Подключение к базе данных: {db_path}")
+        return manager
+
+
+def close_all_connections():
+    """
+    Закрывает подключения всех пулов (вызывается при завершении приложения).
+    """
+    with _managers_lock:
+        managers = list(_managers.values())
+        _managers.clear()
+    for manager in managers:
+        manager.close_all()
@@ -1,10 +1,65 @@
+import datetime
+import re
 import sqlite3
+import time
+
+from config import DB_PATH
+from database.connection import get_connection_manager
+from database.migrations import QUEUE_ORDER_SQL, CLAIM_ORDER_SQL
+
+# Запросы горячих путей — фиксированный текст, поэтому sqlite3 переиспользует
+# подготовленные выражения из своего кэша. Схему гарантируют миграции (database/migrations.py).
+_UPDATE_STATUS_SQL = """
+    UPDATE downloaded_tracks
+    SET status = ?, file_path = COALESCE(?, file_path), content_hash = COALESCE(?, content_hash),
+        file_present = ?
+    WHERE id = ?
+"""
+_MARK_ERROR_SQL = """
+    UPDATE downloaded_tracks
+    SET status = 'error', error_message = ?, last_error_at = ?, next_attempt_at = NULL
+    WHERE id = ?
+"""
+_SCHEDULE_RETRY_SQL = """
+    UPDATE downloaded_tracks
+    SET status = 'pending', retry_count = retry_count + 1, error_message = ?, last_error_at = ?,
+        next_attempt_at = ?
+    WHERE id = ?
+"""
+_REQUEUE_SQL = """
+    UPDATE downloaded_tracks
+    SET status = 'pending', url = ?, transcoding_url = ?, download_date = ?, retry_count = 0,
+        next_attempt_at = NULL
+    WHERE id = ?
+"""
+_CLAIM_CANDIDATES_SQL = f"""
+    SELECT id, url, transcoding_url, source FROM downloaded_tracks
+    WHERE status = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= ?)
+    ORDER BY {CLAIM_ORDER_SQL}
+    LIMIT ?
+"""
+_INSERT_TRACK_SQL = """
+    INSERT INTO downloaded_tracks
+    (track_title, artist, url, transcoding_url, status, download_date, file_path, track_id,
+     album, genre, release_year, artwork_url, source)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Ограничение на количество параметров в одном запросе (SQLITE_MAX_VARIABLE_NUMBER в старых сборках — 999)
+_MAX_SQL_PARAMS = 900
+
 
 class DatabaseManager:
-    def __init__(self, db_name="database/music_library.db"):
-        self.connection = sqlite3.connect(db_name)
-        self.connection.row_factory = sqlite3.Row # Позволяет обращаться к полям по имени
-        print(f"Подключение к базе данных: {db_name}")
+    def __init__(self, db_name=DB_PATH):
+        self.db_name = db_name
+        self.pool = get_connection_manager(db_name)
+
+    @property
+    def connection(self):
+        """
+        Подключение текущего потока: один объект DatabaseManager можно использовать из GUI и из воркеров.
+        """
+        return self.pool.connection()
 
     def get_pending_tracks(self):
         """
@@ -13,24 +68,251 @@ class DatabaseManager:
         query = "SELECT * FROM downloaded_tracks WHERE status = 'pending'"
         return self.connection.execute(query).fetchall()
 
-    def update_track_status(self, track_id, status, filepath=None):
+    def claim_next_track(self, accept=None, lookahead=64):
+        """
+        Атомарно забирает следующий трек из очереди: pending → downloading.
+        Треки выдаются по убыванию приоритета, внутри приоритета — в порядке добавления;
+        треки, ожидающие повтора, пропускаются до наступления next_attempt_at.
+        Условный UPDATE гарантирует, что два потока не получат один и тот же трек.
+
+        accept(row) -> bool позволяет пропустить трек (например, хост уже занят);
+        просматриваются первые lookahead треков очереди.
+
+        Возвращает строку трека или None, если подходящих треков нет.
         """
-        Обновить статус трека и путь к файлу (если скачивается).
+        while True:
+            candidates = self.connection.execute(_CLAIM_CANDIDATES_SQL, (time.time(), lookahead)).fetchall()
+            if not candidates:
+                return None
+
+            raced = False
+            for row in candidates:
+                if accept is not None and not accept(row):
+                    continue
+                cursor = self.connection.execute(
+                    "UPDATE downloaded_tracks SET status = 'downloading' WHERE id = ? AND status = 'pending'",
+                    (row["id"],)
+                )
+                self.connection.commit()
+                if cursor.rowcount == 1:
+                    return self.connection.execute(
+                        "SELECT * FROM downloaded_tracks WHERE id = ?", (row["id"],)
+                    ).fetchone()
+                # Трек успел забрать другой поток — пробуем следующий
+                raced = True
+
+            if not raced:
+                return None
+
+    def has_pending_tracks(self):
+        row = self.connection.execute(
+            "SELECT 1 FROM downloaded_tracks WHERE status = 'pending' LIMIT 1"
+        ).fetchone()
+        return row is not None
+
+    def prioritize_track(self, db_id):
         """
-        query = "UPDATE downloaded_tracks SET status = ?, filepath = ? WHERE id = ?"
-        self.connection.execute(query, (status, filepath, track_id))
+        «Скачать следующим»: поднимает приоритет трека выше всех ожидающих.
+        """
+        self.connection.execute(
+            """
+            UPDATE downloaded_tracks
+            SET priority = (SELECT COALESCE(MAX(priority), 0) + 1 FROM downloaded_tracks WHERE status = 'pending')
+            WHERE id = ?
+            """,
+            (db_id,)
+        )
+        self.connection.commit()
+
+    def set_track_priority(self, db_id, priority):
+        self.connection.execute("UPDATE downloaded_tracks SET priority = ? WHERE id = ?", (priority, db_id))
+        self.connection.commit()
+
+    def update_stream_url(self, track_id, url):
+        """
+        Сохраняет свежую ссылку на поток, полученную по transcoding_url перед скачиванием.
+        """
+        self.connection.execute("UPDATE downloaded_tracks SET url = ? WHERE id = ?", (url, track_id))
+        self.connection.commit()
+
+    def requeue_track(self, track_id):
+        """
+        Возвращает трек в очередь (например, если скачивание прервали остановкой).
+        """
+        self.connection.execute(
+            "UPDATE downloaded_tracks SET status = 'pending' WHERE id = ? AND status = 'downloading'",
+            (track_id,)
+        )
+        self.connection.commit()
+
+    def requeue_interrupted(self):
+        """
+        Возвращает в очередь треки, оставшиеся в статусе 'downloading' после аварийного завершения.
+        Скачивание продолжится с места остановки по .part файлу.
+
+        Возвращает количество восстановленных треков.
+        """
+        cursor = self.connection.execute(
+            "UPDATE downloaded_tracks SET status = 'pending' WHERE status = 'downloading'"
+        )
+        self.connection.commit()
+        if cursor.rowcount:
+            print(f"Возвращено в очередь прерванных загрузок: {cursor.rowcount}")
+        return cursor.rowcount
+
+    def update_track_status(self, track_id, status, filepath=None, content_hash=None):
+        """
+        Обновить статус трека, путь к файлу и хэш содержимого (если скачан).
+        """
+        file_present = int(status == "complete")
+        self.connection.execute(_UPDATE_STATUS_SQL, (status, filepath, content_hash, file_present, track_id))
         self.connection.commit()
         print(f"Обновлён статус трека ID {track_id}: {status}")
 
+    def find_by_content_hash(self, content_hash, exclude_id=None):
+        """
+        Скачанный трек с таким же содержимым (для пропуска дубликатов) или None.
+        """
+        return self.connection.execute(
+            """
+            SELECT id, track_title, artist, file_path FROM downloaded_tracks
+            WHERE content_hash = ? AND status = 'complete' AND file_present = 1 AND id != ?
+            ORDER BY id
+            LIMIT 1
+            """,
+            (content_hash, exclude_id if exclude_id is not None else -1)
+        ).fetchone()
+
+    def get_library_files(self):
+        """
+        Скачанные треки с путями к файлам — для сверки с диском фоновым сканером.
+        """
+        return self.connection.execute(
+            """
+            SELECT id, file_path, file_present, content_hash FROM downloaded_tracks
+            WHERE status = 'complete' AND file_path != ''
+            """
+        ).fetchall()
+
+    def update_file_presence(self, flags, relinks):
+        """
+        Пакетно обновляет наличие файлов: flags — пары (file_present, id),
+        relinks — пары (новый путь, id) для файлов, найденных на новом месте.
+        """
+        with self.connection:
+            self.connection.executemany("UPDATE downloaded_tracks SET file_present = ? WHERE id = ?", flags)
+            self.connection.executemany(
+                "UPDATE downloaded_tracks SET file_path = ?, file_present = 1 WHERE id = ?", relinks
+            )
+
+    def get_tag_metadata(self, track_id):
+        """
+        Метаданные трека для записи ID3-тегов.
+        """
+        return self.connection.execute(
+            """
+            SELECT id, track_title, artist, album, genre, release_year, artwork_url, file_path, tagged_at
+            FROM downloaded_tracks WHERE id = ?
+            """,
+            (track_id,)
+        ).fetchone()
+
+    def get_tracks_for_tagging(self, only_untagged=True):
+        """
+        ID скачанных треков с файлами на месте — для массовой записи тегов.
+        """
+        sql = "SELECT id FROM downloaded_tracks WHERE status = 'complete' AND file_present = 1"
+        if only_untagged:
+            sql += " AND tagged_at IS NULL"
+        return [row["id"] for row in self.connection.execute(sql + " ORDER BY id")]
+
+    def update_track_metadata(self, track_id, album=None, genre=None, release_year=None, artwork_url=None):
+        """
+        Дополняет метаданные трека: уже заполненные поля не перезаписываются.
+        """
+        self.connection.execute(
+            """
+            UPDATE downloaded_tracks
+            SET album = COALESCE(album, ?), genre = COALESCE(genre, ?),
+                release_year = COALESCE(release_year, ?), artwork_url = COALESCE(artwork_url, ?)
+            WHERE id = ?
+            """,
+            (album, genre, release_year, artwork_url, track_id)
+        )
+        self.connection.commit()
+
+    def mark_tagged(self, track_ids):
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE downloaded_tracks SET tagged_at = ? WHERE id = ?", [(now, track_id) for track_id in track_ids]
+            )
+
+    def count_tracks_with_file(self, file_path):
+        """
+        Сколько треков ссылается на файл (после дедупликации файл может быть общим).
+        """
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM downloaded_tracks WHERE file_path = ?", (file_path,)
+        ).fetchone()[0]
+
+    def get_tracks_without_hash(self):
+        return self.connection.execute(
+            "SELECT id, file_path FROM downloaded_tracks WHERE status = 'complete' AND content_hash IS NULL"
+        ).fetchall()
+
+    def set_content_hashes(self, hashes):
+        """
+        Сохраняет хэши пакетом: hashes — пары (content_hash, id).
+        """
+        with self.connection:
+            self.connection.executemany("UPDATE downloaded_tracks SET content_hash = ? WHERE id = ?", hashes)
+
+    def get_duplicate_hash_groups(self):
+        """
+        Хэши, которые встречаются у нескольких скачанных треков, и пути их файлов.
+        """
+        rows = self.connection.execute(
+            """
+            SELECT content_hash, file_path FROM downloaded_tracks
+            WHERE status = 'complete' AND content_hash IN (
+                SELECT content_hash FROM downloaded_tracks
+                WHERE status = 'complete' AND content_hash IS NOT NULL
+                GROUP BY content_hash
+                HAVING COUNT(*) > 1
+            )
+            ORDER BY content_hash
+            """
+        ).fetchall()
+        groups = {}
+        for row in rows:
+            groups.setdefault(row["content_hash"], []).append(row["file_path"])
+        return list(groups.items())
+
     def mark_error(self, track_id, error_message):
         """
         Устанавливает статус ошибки для трека.
         """
-        query = "UPDATE downloaded_tracks SET status = 'error', filepath = ? WHERE id = ?"
-        self.connection.execute(query, (error_message, track_id))
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.connection.execute(_MARK_ERROR_SQL, (error_message, now, track_id))
         self.connection.commit()
         print(f"Ошибка для трека ID {track_id}: {error_message}")
 
+    def schedule_retry(self, track_id, error_message, delay):
+        """
+        Возвращает трек в очередь после ошибки: он будет взят снова не раньше чем через delay секунд.
+        """
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.connection.execute(_SCHEDULE_RETRY_SQL, (error_message, now, time.time() + delay, track_id))
+        self.connection.commit()
+        print(f"Трек ID {track_id} будет повторён через {delay:.0f} с: {error_message}")
+
+    def get_retry_count(self, track_id):
+        row = self.connection.execute(
+            "SELECT retry_count FROM downloaded_tracks WHERE id = ?", (track_id,)
+        ).fetchone()
+        return row["retry_count"] if row else 0
+
     def add_track(self, title, artist, download_url, track_id=None):
         """
         Добавляет трек в очередь на скачивание или обновляет существующий
@@ -45,127 +327,244 @@ class DatabaseManager:
         Возвращает:
         - (успех, статус): bool, str
         """
-        import datetime
-        import os
+        return self.add_tracks([{
+            "title": title,
+            "artist": artist,
+            "download_url": download_url,
+            "track_id": track_id,
+        }])[0]
+
+    def add_tracks(self, tracks):
+        """
+        Пакетное добавление треков в очередь одной транзакцией.
+        Дубликаты ищутся набором запросов IN (...) на весь пакет, новые строки вставляются executemany.
+
+        Параметры:
+        - tracks: итерируемый набор словарей с ключами title, artist, download_url, track_id;
+          transcoding_url — ссылка для получения свежей ссылки на поток (download_url тогда может быть пустым);
+          необязательные метаданные для тегов: album, genre, release_year, artwork_url, source
+
+        Возвращает:
+        - список (успех, статус) в порядке входных треков; статус: added, requeued, duplicate или error: ...
+        """
+        items = list(tracks)
+        if not items:
+            return []
+
         current_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        by_track_id, by_url, by_title = self._find_existing(items)
 
-        # Проверим наличие нужных полей в таблице
-        cursor = self.connection.cursor()
-        cursor.execute("PRAGMA table_info(downloaded_tracks)")
-        columns = cursor.fetchall()
-        column_names = [column[1] for column in columns]
-
-        # Добавляем нужные колонки, если их нет
-        for column, column_type in [("url", "TEXT"), ("track_id", "TEXT")]:
-            if column not in column_names:
-                try:
-                    cursor.execute(f"ALTER TABLE downloaded_tracks ADD COLUMN {column} {column_type}")
-                    self.connection.commit()
-                    print(f"Добавлена колонка {column} в таблицу downloaded_tracks")
-                except Exception as e:
-                    print(f"Ошибка добавления колонки {column}: {e}")
-
-        # Определяем, какое имя колонки использовать для URL
-        url_column = "url" if "url" in column_names else "download_url"
-
-        # Сначала проверяем по track_id (если он есть)
-        if track_id:
-            cursor.execute(f"SELECT id, file_path, status FROM downloaded_tracks WHERE track_id = ?", (track_id,))
-            existing = cursor.fetchone()
-            if existing:
-                db_id, file_path, status = existing
-
-                # Проверяем, существует ли файл физически
-                file_exists = file_path and os.path.exists(file_path)
-
-                if not file_exists and status != "pending":
-                    # Файл удален или путь неверный - обновляем статус
-                    self.connection.execute(
-                        f"UPDATE downloaded_tracks SET status = 'pending', {url_column} = ?, download_date = ? WHERE id = ?",
-                        (download_url, current_date, db_id)
-                    )
-                    self.connection.commit()
-                    print(f"Трек '{title}' переведен в статус 'pending' для повторной загрузки")
-                    return True, "requeued"
-                else:
-                    print(f"Трек '{title}' уже существует в базе (ID: {db_id})")
-                    return False, "duplicate"
-
-        # Проверка по URL и названию (если track_id не предоставлен или не найден)
-        cursor.execute(f"SELECT id, file_path, status FROM downloaded_tracks WHERE {url_column} = ? OR (track_title = ? AND artist = ?)",
-                   (download_url, title, artist))
-        existing = cursor.fetchone()
-
-        if existing:
-            db_id, file_path, status = existing
-
-            # Проверяем, существует ли файл физически
-            file_exists = file_path and os.path.exists(file_path)
-
-            if not file_exists and status != "pending":
-                # Файл удален или путь неверный - обновляем статус
-                self.connection.execute(
-                    f"UPDATE downloaded_tracks SET status = 'pending', {url_column} = ?, download_date = ? WHERE id = ?",
-                    (download_url, current_date, db_id)
-                )
-                self.connection.commit()
-                print(f"Трек '{title}' переведен в статус 'pending' для повторной загрузки")
-                return True, "requeued"
+        results = []
+        inserts = []
+        requeues = []
+        for item in items:
+            title = item["title"]
+            artist = item["artist"]
+            download_url = item["download_url"]
+            transcoding_url = item.get("transcoding_url")
+            track_id = item.get("track_id")
+
+            # Сначала проверяем по track_id (если он есть), затем по URL и названию
+            existing = by_track_id.get(track_id) if track_id else None
+            if existing is None:
+                existing = (by_url.get(download_url) if download_url else None) or by_title.get((title, artist))
+
+            if existing is None:
+                inserts.append((
+                    title, artist, download_url, transcoding_url, "pending", current_date, "", track_id,
+                    item.get("album"), item.get("genre"), item.get("release_year"), item.get("artwork_url"),
+                    item.get("source")
+                ))
+                results.append((True, "added"))
+                # Повтор того же трека внутри пакета будет считаться дубликатом
+                existing = {"id": None, "file_path": "", "status": "pending", "file_present": 0}
+            elif existing["status"] not in ("pending", "downloading") and not existing["file_present"]:
+                # Файл удален или путь неверный - возвращаем в очередь
+                requeues.append((download_url, transcoding_url, current_date, existing["id"]))
+                results.append((True, "requeued"))
+                existing = dict(existing, status="pending")
             else:
-                print(f"Трек '{title}' уже существует в базе (ID: {db_id})")
-                return False, "duplicate"
+                results.append((False, "duplicate"))
+                continue
 
-        # Если трек не найден в базе, добавляем новый
-        query = f"""
-        INSERT INTO downloaded_tracks 
-        (track_title, artist, {url_column}, status, download_date, file_path, track_id) 
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """
+            if track_id:
+                by_track_id[track_id] = existing
+            if download_url:
+                by_url[download_url] = existing
+            by_title[(title, artist)] = existing
 
         try:
-            self.connection.execute(query, (
-                title,
-                artist,
-                download_url,
-                "pending",
-                current_date,
-                "",  # Пустой путь, будет заполнен после скачивания
-                track_id
-            ))
-            self.connection.commit()
-            print(f"Трек '{title}' добавлен в базу данных")
-            return True, "added"
+            with self.connection:
+                self.connection.executemany(_REQUEUE_SQL, requeues)
+                self.connection.executemany(_INSERT_TRACK_SQL, inserts)
         except Exception as e:
-            print(f"Ошибка добавления трека в базу: {e}")
-            return False, f"error: {str(e)}"
+            print(f"Ошибка добавления треков в базу: {e}")
+            error = (False, f"error: {str(e)}")
+            return [error if success else (success, status) for success, status in results]
+
+        print(f"Очередь: добавлено {len(inserts)}, восстановлено {len(requeues)}, "
+              f"пропущено {len(items) - len(inserts) - len(requeues)}")
+        return results
 
-    def get_new_connection(self):
+    def _find_existing(self, items):
         """
-        Создаёт новое подключение для использования в другом потоке.
+        Находит уже известные треки пакета: по track_id, по URL и по паре (название, артист).
         """
-        return sqlite3.connect("database/music_library.db")
+        columns = "id, file_path, status, file_present, track_id, url, track_title, artist"
+        track_ids = list({item["track_id"] for item in items if item.get("track_id")})
+        urls = list({item["download_url"] for item in items if item["download_url"]})
+        titles = list({(item["title"], item["artist"]) for item in items})
+
+        by_track_id = {}
+        by_url = {}
+        by_title = {}
+
+        for chunk in _chunks(track_ids, _MAX_SQL_PARAMS):
+            placeholders = ",".join("?" * len(chunk))
+            sql = f"SELECT {columns} FROM downloaded_tracks WHERE track_id IN ({placeholders}) ORDER BY id DESC"
+            for row in self.connection.execute(sql, chunk):
+                by_track_id[row["track_id"]] = row
 
-    def get_download_queue(self):
+        for chunk in _chunks(urls, _MAX_SQL_PARAMS):
+            placeholders = ",".join("?" * len(chunk))
+            sql = f"SELECT {columns} FROM downloaded_tracks WHERE url IN ({placeholders}) ORDER BY id DESC"
+            for row in self.connection.execute(sql, chunk):
+                by_url[row["url"]] = row
+
+        for chunk in _chunks(titles, _MAX_SQL_PARAMS // 2):
+            placeholders = ",".join("(?, ?)" for _ in chunk)
+            sql = (f"SELECT {columns} FROM downloaded_tracks "
+                   f"WHERE (track_title, artist) IN (VALUES {placeholders}) ORDER BY id DESC")
+            params = [value for pair in chunk for value in pair]
+            for row in self.connection.execute(sql, params):
+                by_title[(row["track_title"], row["artist"])] = row
+
+        return by_track_id, by_url, by_title
+
+    def release_connection(self):
+        """
+        Возвращает подключение текущего потока в пул (при завершении рабочего потока).
         """
-        Получает все треки из очереди загрузки с их статусами
+        self.pool.release()
+
+    def retry_track(self, db_id):
+        """
+        Возвращает трек с ошибкой в очередь загрузки с новым запасом повторов.
         """
-        query = """
-            SELECT id, track_title, artist, status, file_path, url, download_date, track_id
+        self.connection.execute(
+            "UPDATE downloaded_tracks SET status = 'pending', retry_count = 0, next_attempt_at = NULL WHERE id = ?",
+            (db_id,)
+        )
+        self.connection.commit()
+
+    def delete_track(self, db_id):
+        """
+        Удаляет трек из базы.
+        """
+        self.connection.execute("DELETE FROM downloaded_tracks WHERE id = ?", (db_id,))
+        self.connection.commit()
+
+    def clear_queue(self):
+        """
+        Удаляет из базы все нескачанные треки.
+        """
+        self.connection.execute("DELETE FROM downloaded_tracks WHERE status != 'complete'")
+        self.connection.commit()
+
+    def get_download_queue(self, limit=-1, offset=0):
+        """
+        Получает треки из очереди загрузки с их статусами.
+        limit/offset позволяют читать очередь страницами (по умолчанию — целиком);
+        порядок сортировки совпадает с индексом idx_tracks_queue_order.
+        """
+        query = f"""
+            SELECT id, track_title, artist, status, file_path, url, download_date, track_id, priority,
+                   retry_count, next_attempt_at, file_present
             FROM downloaded_tracks
-            ORDER BY
-                CASE
-                    WHEN status = 'pending' THEN 1
-                    WHEN status = 'downloading' THEN 2
-                    WHEN status = 'complete' THEN 3
-                    WHEN status = 'error' THEN 4
-                    ELSE 5
-                    END,
-                download_date DESC \
+            ORDER BY {QUEUE_ORDER_SQL}
+            LIMIT ? OFFSET ?
             """
         try:
             cursor = self.connection.cursor()
-            cursor.execute(query)
+            cursor.execute(query, (limit, offset))
             return cursor.fetchall()
         except Exception as e:
             print(f"Ошибка при получении очереди загрузки: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    def count_by_status(self):
+        """
+        Количество треков по статусам: {'complete': ..., 'pending': ..., ...}.
+        """
+        rows = self.connection.execute(
+            "SELECT status, COUNT(*) AS tracks FROM downloaded_tracks GROUP BY status"
+        ).fetchall()
+        return {row["status"]: row["tracks"] for row in rows}
+
+    def get_recent_errors(self, limit=10):
+        """
+        Последние треки с ошибкой скачивания (в том числе ожидающие повтора).
+        """
+        return self.connection.execute(
+            """
+            SELECT id, track_title, artist, status, retry_count, error_message, last_error_at
+            FROM downloaded_tracks
+            WHERE last_error_at IS NOT NULL AND status IN ('error', 'pending')
+            ORDER BY last_error_at DESC
+            LIMIT ?
+            """,
+            (limit,)
+        ).fetchall()
+
+    def count_download_queue(self):
+        """
+        Количество треков в очереди загрузки.
+        """
+        return self.connection.execute("SELECT COUNT(*) FROM downloaded_tracks").fetchone()[0]
+
+    @staticmethod
+    def build_fts_query(query):
+        """
+        Превращает пользовательский запрос в выражение FTS5: каждое слово ищется по префиксу,
+        все слова должны встретиться (AND).
+        """
+        words = re.findall(r"\w+", query)
+        return " ".join(f'"{word}"*' for word in words)
+
+    def search_library(self, query, limit=50, offset=0):
+        """
+        Оффлайн-поиск по скачанным трекам через полнотекстовый индекс.
+        Результаты отсортированы по релевантности (bm25).
+        """
+        fts_query = self.build_fts_query(query)
+        if not fts_query:
+            return []
+
+        sql = """
+            SELECT t.id, t.track_title, t.artist, t.album, t.genre, t.file_path, t.track_id
+            FROM library_fts
+            JOIN downloaded_tracks t ON t.id = library_fts.rowid
+            WHERE library_fts MATCH ? AND t.status = 'complete' AND t.file_present = 1
+            ORDER BY library_fts.rank
+            LIMIT ? OFFSET ?
+        """
+        try:
+            return self.connection.execute(sql, (fts_query, limit, offset)).fetchall()
+        except sqlite3.OperationalError as e:
+            # Нет индекса FTS5 — запасной вариант с полным просмотром таблицы
+            print(f"Полнотекстовый поиск недоступен ({e}), используется LIKE")
+            pattern = f"%{query}%"
+            sql = """
+                SELECT id, track_title, artist, album, genre, file_path, track_id
+                FROM downloaded_tracks
+                WHERE status = 'complete' AND file_present = 1
+                  AND (track_title LIKE ? OR artist LIKE ? OR album LIKE ? OR genre LIKE ?)
+                ORDER BY track_title
+                LIMIT ? OFFSET ?
+            """
+            return self.connection.execute(sql, (pattern, pattern, pattern, pattern, limit, offset)).fetchall()
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
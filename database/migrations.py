@@ -0,0 +1,539 @@
+import sqlite3
+
+# Версионированные миграции схемы.
+# Текущая версия хранится в PRAGMA user_version, при запуске применяются только новые миграции.
+# Миграции 1–2 идемпотентны, чтобы корректно подхватить базы, созданные до появления версий.
+
+_STATUS_ORDER_SQL = """
+    CASE
+        WHEN status = 'pending' THEN 1
+        WHEN status = 'downloading' THEN 2
+        WHEN status = 'complete' THEN 3
+        WHEN status = 'error' THEN 4
+        ELSE 5
+    END"""
+
+# Порядок строк очереди загрузки. Один и тот же текст используется в индексе и в запросе,
+# иначе SQLite не сможет взять сортировку из индекса.
+QUEUE_ORDER_SQL = f"""{_STATUS_ORDER_SQL},
+    priority DESC,
+    download_date DESC
+"""
+
+# Порядок выдачи треков загрузчику: сначала приоритетные, внутри приоритета — в порядке добавления
+CLAIM_ORDER_SQL = "priority DESC, id"
+
+
+def _create_base_schema(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS downloaded_tracks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        track_title TEXT NOT NULL,
+        artist TEXT,
+        album TEXT,
+        genre TEXT,
+        release_year INTEGER,
+        download_date TEXT NOT NULL,
+        license_type TEXT,
+        file_path TEXT NOT NULL,
+        duration INTEGER,
+        source TEXT,
+        url TEXT,
+        download_url,
+        track_id,
+        status TEXT NOT NULL DEFAULT 'pending'
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        created_at TEXT NOT NULL
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS settings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        setting_key TEXT NOT NULL UNIQUE,
+        setting_value TEXT
+    )
+    ''')
+
+    cursor.execute('''
+    INSERT OR IGNORE INTO settings (setting_key, setting_value)
+    VALUES
+    ('default_download_path', 'downloads/'),
+    ('license_filter', 'none'),
+    ('sort_mode', 'flat')
+    ''')
+
+
+def _unify_track_columns(cursor):
+    """
+    Приводит старые базы к единой схеме: ссылка хранится в url, ошибка — в error_message.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(downloaded_tracks)")}
+    for column, column_type in [("url", "TEXT"), ("download_url", "TEXT"), ("track_id", "TEXT"),
+                                ("error_message", "TEXT")]:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE downloaded_tracks ADD COLUMN {column} {column_type}")
+
+    cursor.execute("UPDATE downloaded_tracks SET url = download_url WHERE url IS NULL AND download_url IS NOT NULL")
+
+
+def _create_track_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_status ON downloaded_tracks (status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_track_id ON downloaded_tracks (track_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_url ON downloaded_tracks (url)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_title_artist ON downloaded_tracks (track_title, artist)")
+
+
+def _create_search_cache(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS search_cache (
+        cache_key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_accessed ON search_cache (accessed_at)")
+
+
+def _create_library_index(cursor):
+    """
+    Полнотекстовый индекс FTS5 по библиотеке (название, артист, альбом, жанр).
+    Индекс синхронизируется с downloaded_tracks триггерами; поиск нечувствителен к регистру и диакритике.
+    """
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS library_fts USING fts5(
+            track_title, artist, album, genre,
+            content='downloaded_tracks',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        # Сборка SQLite без FTS5 — поиск по библиотеке будет работать через LIKE
+        print(f"Полнотекстовый индекс недоступен: {e}")
+        return
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS library_fts_insert AFTER INSERT ON downloaded_tracks BEGIN
+        INSERT INTO library_fts (rowid, track_title, artist, album, genre)
+        VALUES (new.id, new.track_title, new.artist, new.album, new.genre);
+    END
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS library_fts_delete AFTER DELETE ON downloaded_tracks BEGIN
+        INSERT INTO library_fts (library_fts, rowid, track_title, artist, album, genre)
+        VALUES ('delete', old.id, old.track_title, old.artist, old.album, old.genre);
+    END
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS library_fts_update
+    AFTER UPDATE OF track_title, artist, album, genre ON downloaded_tracks BEGIN
+        INSERT INTO library_fts (library_fts, rowid, track_title, artist, album, genre)
+        VALUES ('delete', old.id, old.track_title, old.artist, old.album, old.genre);
+        INSERT INTO library_fts (rowid, track_title, artist, album, genre)
+        VALUES (new.id, new.track_title, new.artist, new.album, new.genre);
+    END
+    ''')
+
+    # Заполняем индекс уже существующими треками
+    cursor.execute("INSERT INTO library_fts (library_fts) VALUES ('rebuild')")
+
+
+def _create_queue_order_index(cursor):
+    # Порядок версии 6 (до появления приоритетов); миграция 7 пересоздаёт индекс
+    cursor.execute(f"""
+    CREATE INDEX IF NOT EXISTS idx_tracks_queue_order
+    ON downloaded_tracks ({_STATUS_ORDER_SQL}, download_date DESC)
+    """)
+
+
+def _add_track_priority(cursor):
+    """
+    Приоритет трека в очереди: больше — раньше. «Скачать следующим» поднимает приоритет выше всех.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(downloaded_tracks)")}
+    if "priority" not in columns:
+        cursor.execute("ALTER TABLE downloaded_tracks ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tracks_claim ON downloaded_tracks (status, {CLAIM_ORDER_SQL})")
+    cursor.execute("DROP INDEX IF EXISTS idx_tracks_queue_order")
+    cursor.execute(f"CREATE INDEX idx_tracks_queue_order ON downloaded_tracks ({QUEUE_ORDER_SQL})")
+
+
+def _add_retry_columns(cursor):
+    """
+    Счётчик повторов, время последней ошибки и момент, раньше которого трек не берётся в работу.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(downloaded_tracks)")}
+    for column, column_type in [("retry_count", "INTEGER NOT NULL DEFAULT 0"), ("last_error_at", "TEXT"),
+                                ("next_attempt_at", "REAL")]:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE downloaded_tracks ADD COLUMN {column} {column_type}")
+
+
+def _add_content_hash(cursor):
+    """
+    Хэш содержимого скачанного файла — для поиска перезаливов одной и той же записи.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(downloaded_tracks)")}
+    if "content_hash" not in columns:
+        cursor.execute("ALTER TABLE downloaded_tracks ADD COLUMN content_hash TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_content_hash ON downloaded_tracks (content_hash)")
+
+
+def _create_file_index(cursor):
+    """
+    Индекс файлов в папках загрузок (размер и время изменения) и флаг наличия файла у трека.
+    Флаг обновляет фоновый сканер библиотеки, поэтому GUI не обращается к диску.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS file_index (
+        path TEXT PRIMARY KEY,
+        directory TEXT NOT NULL,
+        mtime REAL NOT NULL,
+        size INTEGER NOT NULL,
+        content_hash TEXT
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_index_directory ON file_index (directory)")
+
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(downloaded_tracks)")}
+    if "file_present" not in columns:
+        cursor.execute("ALTER TABLE downloaded_tracks ADD COLUMN file_present INTEGER NOT NULL DEFAULT 0")
+        # До первого прохода сканера считаем скачанные файлы на месте
+        cursor.execute(
+            "UPDATE downloaded_tracks SET file_present = 1 WHERE status = 'complete' AND file_path != ''"
+        )
+
+
+def _add_tagging_columns(cursor):
+    """
+    Ссылка на обложку из ответа поиска и время записи ID3-тегов в файл.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(downloaded_tracks)")}
+    for column in ("artwork_url", "tagged_at"):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE downloaded_tracks ADD COLUMN {column} TEXT")
+
+
+def _create_musicbrainz_cache(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS musicbrainz_cache (
+        cache_key TEXT PRIMARY KEY,
+        response TEXT,
+        created_at REAL NOT NULL
+    )
+    ''')
+
+
+# Измерения сводной статистики библиотеки: имя -> выражение для строки триггера (old/new)
+LIBRARY_STATS_DIMENSIONS = {
+    "artist": "COALESCE({row}.artist, '')",
+    "genre": "COALESCE({row}.genre, '')",
+    "year": "COALESCE(CAST({row}.release_year AS TEXT), '')",
+}
+
+
+def _stats_change_sql(row, day, delta):
+    """
+    Операторы триггера, прибавляющие delta к счётчикам всех измерений строки row за день day.
+    """
+    statements = []
+    for dimension, expression in LIBRARY_STATS_DIMENSIONS.items():
+        value = expression.format(row=row)
+        statements.append(f"""
+        INSERT INTO library_stats (dimension, value, tracks) VALUES ('{dimension}', {value}, {delta})
+        ON CONFLICT (dimension, value) DO UPDATE SET tracks = tracks + excluded.tracks;
+        INSERT INTO library_stats_daily (dimension, value, day, tracks) VALUES ('{dimension}', {value}, {day}, {delta})
+        ON CONFLICT (dimension, value, day) DO UPDATE SET tracks = tracks + excluded.tracks;""")
+        if delta < 0:
+            # Обнулившиеся строки удаляются, чтобы в сводке не копились удалённые артисты
+            statements.append(f"""
+        DELETE FROM library_stats WHERE dimension = '{dimension}' AND value = {value} AND tracks <= 0;
+        DELETE FROM library_stats_daily
+        WHERE dimension = '{dimension}' AND value = {value} AND day = {day} AND tracks <= 0;""")
+    return "".join(statements)
+
+
+def rebuild_library_stats(cursor):
+    """
+    Полный пересчёт сводной статистики по скачанным трекам (первое заполнение и восстановление).
+    """
+    cursor.execute("DELETE FROM library_stats")
+    cursor.execute("DELETE FROM library_stats_daily")
+    for dimension, expression in LIBRARY_STATS_DIMENSIONS.items():
+        value = expression.format(row="downloaded_tracks")
+        cursor.execute(f"""
+        INSERT INTO library_stats_daily (dimension, value, day, tracks)
+        SELECT '{dimension}', {value}, date(completed_at), COUNT(*)
+        FROM downloaded_tracks WHERE status = 'complete'
+        GROUP BY 2, 3
+        """)
+    cursor.execute("""
+    INSERT INTO library_stats (dimension, value, tracks)
+    SELECT dimension, value, SUM(tracks) FROM library_stats_daily
+    GROUP BY dimension, value
+    """)
+
+
+def _create_library_stats(cursor):
+    """
+    Сводная статистика библиотеки по артистам, жанрам и годам выпуска: общие счётчики
+    и счётчики по дням завершения загрузки (для выборок за период).
+    Счётчики меняют триггеры при завершении, удалении и смене метаданных трека,
+    поэтому отчёты не пересчитывают всю таблицу треков.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(downloaded_tracks)")}
+    if "completed_at" not in columns:
+        cursor.execute("ALTER TABLE downloaded_tracks ADD COLUMN completed_at TEXT")
+        # Для уже скачанных треков точное время неизвестно — берём время добавления
+        cursor.execute("UPDATE downloaded_tracks SET completed_at = download_date WHERE status = 'complete'")
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS library_stats (
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        tracks INTEGER NOT NULL,
+        PRIMARY KEY (dimension, value)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_library_stats_top ON library_stats (dimension, tracks DESC)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS library_stats_daily (
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        day TEXT NOT NULL,
+        tracks INTEGER NOT NULL,
+        PRIMARY KEY (dimension, value, day)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_library_stats_daily_day ON library_stats_daily (dimension, day, value, tracks)"
+    )
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_stats_complete
+    AFTER UPDATE OF status ON downloaded_tracks
+    WHEN new.status = 'complete' AND old.status != 'complete' BEGIN
+        UPDATE downloaded_tracks SET completed_at = datetime('now', 'localtime') WHERE id = new.id;
+        {_stats_change_sql("new", "date('now', 'localtime')", 1)}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_stats_uncomplete
+    AFTER UPDATE OF status ON downloaded_tracks
+    WHEN old.status = 'complete' AND new.status != 'complete' BEGIN
+        {_stats_change_sql("old", "date(old.completed_at)", -1)}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_stats_delete
+    AFTER DELETE ON downloaded_tracks
+    WHEN old.status = 'complete' BEGIN
+        {_stats_change_sql("old", "date(old.completed_at)", -1)}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_stats_metadata
+    AFTER UPDATE OF artist, genre, release_year ON downloaded_tracks
+    WHEN old.status = 'complete' AND new.status = 'complete' BEGIN
+        {_stats_change_sql("old", "date(old.completed_at)", -1)}
+        {_stats_change_sql("new", "date(old.completed_at)", 1)}
+    END
+    ''')
+
+    rebuild_library_stats(cursor)
+
+
+def _create_library_changes(cursor):
+    """
+    Журнал изменений библиотеки для рекомендаций: каждая строка — трек (артист, жанр, день загрузки),
+    добавленный в библиотеку (delta = 1) или убранный из неё (delta = -1).
+    Рекомендатель применяет к своему кэшу только новые записи и затем удаляет их.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS library_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        artist TEXT NOT NULL,
+        genre TEXT NOT NULL,
+        day TEXT NOT NULL,
+        delta INTEGER NOT NULL
+    )
+    ''')
+
+    def change(row, day, delta):
+        return f"""
+        INSERT INTO library_changes (artist, genre, day, delta)
+        VALUES (COALESCE({row}.artist, ''), COALESCE({row}.genre, ''), {day}, {delta});"""
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_changes_complete
+    AFTER UPDATE OF status ON downloaded_tracks
+    WHEN new.status = 'complete' AND old.status != 'complete' BEGIN
+        {change("new", "date('now', 'localtime')", 1)}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_changes_uncomplete
+    AFTER UPDATE OF status ON downloaded_tracks
+    WHEN old.status = 'complete' AND new.status != 'complete' BEGIN
+        {change("old", "date(old.completed_at)", -1)}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_changes_delete
+    AFTER DELETE ON downloaded_tracks
+    WHEN old.status = 'complete' BEGIN
+        {change("old", "date(old.completed_at)", -1)}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS library_changes_metadata
+    AFTER UPDATE OF artist, genre ON downloaded_tracks
+    WHEN old.status = 'complete' AND new.status = 'complete' BEGIN
+        {change("old", "date(old.completed_at)", -1)}
+        {change("new", "date(old.completed_at)", 1)}
+    END
+    ''')
+
+
+def _create_smart_playlists(cursor):
+    """
+    Умные плейлисты: правило отбора в JSON и готовый состав каждого плейлиста.
+    Триггеры отмечают изменившиеся скачанные треки в smart_playlist_dirty, и правила
+    проверяются только для них, а не для всей библиотеки.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS smart_playlists (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        rule TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        rebuilt_on TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS smart_playlist_tracks (
+        playlist_id INTEGER NOT NULL,
+        track_id INTEGER NOT NULL,
+        completed_at TEXT,
+        PRIMARY KEY (playlist_id, track_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_smart_playlist_order ON smart_playlist_tracks (playlist_id, completed_at DESC)"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_smart_playlist_track ON smart_playlist_tracks (track_id)")
+    cursor.execute("CREATE TABLE IF NOT EXISTS smart_playlist_dirty (track_id INTEGER PRIMARY KEY)")
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS smart_playlist_track_changed
+    AFTER UPDATE OF status, track_title, artist, album, genre, release_year, source, file_path, file_present
+    ON downloaded_tracks
+    WHEN old.status = 'complete' OR new.status = 'complete' BEGIN
+        INSERT OR IGNORE INTO smart_playlist_dirty (track_id) VALUES (new.id);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS smart_playlist_track_deleted
+    AFTER DELETE ON downloaded_tracks
+    WHEN old.status = 'complete' BEGIN
+        DELETE FROM smart_playlist_tracks WHERE track_id = old.id;
+    END
+    ''')
+
+    # Плейлисты по умолчанию; состав строится при первом обращении (rebuilt_on пуст)
+    cursor.executemany(
+        "INSERT OR IGNORE INTO smart_playlists (name, rule, created_at) VALUES (?, ?, datetime('now', 'localtime'))",
+        [
+            ("Любимые артисты",
+             '{"all": [{"field": "artist", "op": "top_artists", "value": 10}]}'),
+            ("Новинки любимых артистов",
+             '{"all": [{"field": "artist", "op": "top_artists", "value": 20}, '
+             '{"field": "release_year", "op": "recent_years", "value": 1}]}'),
+            ("Скачано за неделю",
+             '{"all": [{"field": "completed_at", "op": "last_days", "value": 7}]}'),
+        ]
+    )
+
+
+def _reset_content_hashes(cursor):
+    """
+    Хэш содержимого теперь считается только по аудиоданным, без тегов ID3:
+    старые хэши всего файла сбрасываются. Хэши треков досчитывает python -m download.dedup,
+    хэши file_index — сканер библиотеки по мере надобности.
+    """
+    cursor.execute("UPDATE downloaded_tracks SET content_hash = NULL WHERE content_hash IS NOT NULL")
+    cursor.execute("UPDATE file_index SET content_hash = NULL WHERE content_hash IS NOT NULL")
+
+
+def _add_transcoding_url(cursor):
+    """
+    Постоянная ссылка на получение потока (SoundCloud transcoding URL). Подписанная ссылка в url
+    истекает, пока трек ждёт в очереди, поэтому загрузчик получает свежую по transcoding_url.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(downloaded_tracks)")}
+    if "transcoding_url" not in columns:
+        cursor.execute("ALTER TABLE downloaded_tracks ADD COLUMN transcoding_url TEXT")
+
+
+# (версия, описание, функция) — строго по возрастанию версии, применённые миграции не меняются
+MIGRATIONS = [
+    (1, "базовая схема", _create_base_schema),
+    (2, "единые колонки url и error_message", _unify_track_columns),
+    (3, "индексы downloaded_tracks", _create_track_indexes),
+    (4, "кэш результатов поиска", _create_search_cache),
+    (5, "полнотекстовый индекс библиотеки", _create_library_index),
+    (6, "индекс порядка очереди загрузки", _create_queue_order_index),
+    (7, "приоритет треков в очереди", _add_track_priority),
+    (8, "повторы неудачных загрузок", _add_retry_columns),
+    (9, "хэш содержимого файлов", _add_content_hash),
+    (10, "индекс файлов библиотеки", _create_file_index),
+    (11, "обложки и отметка о тегах", _add_tagging_columns),
+    (12, "кэш ответов MusicBrainz", _create_musicbrainz_cache),
+    (13, "сводная статистика библиотеки", _create_library_stats),
+    (14, "журнал изменений библиотеки для рекомендаций", _create_library_changes),
+    (15, "умные плейлисты", _create_smart_playlists),
+    (16, "хэш содержимого без тегов ID3", _reset_content_hashes),
+    (17, "ссылка на получение потока", _add_transcoding_url),
+]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Применяет недостающие миграции. Каждая миграция выполняется в своей транзакции
+    вместе с обновлением user_version.
+
+    Возвращает итоговую версию схемы.
+    """
+    version = get_schema_version(conn)
+    for target, description, apply in MIGRATIONS:
+        if target <= version:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            apply(cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        version = target
+        print(f"Применена миграция {target}: {description}")
+    return version
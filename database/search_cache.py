@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from config import DB_PATH, SEARCH_CACHE_TTL, SEARCH_CACHE_MEMORY_ENTRIES, SEARCH_CACHE_MAX_BYTES
+from database.connection import get_connection_manager
+
+# Обращения к записям из памяти пишутся в accessed_at пачками: не реже раза в
+# ACCESS_FLUSH_INTERVAL секунд или по накоплении ACCESS_FLUSH_BATCH ключей
+ACCESS_FLUSH_BATCH = 32
+ACCESS_FLUSH_INTERVAL = 30
+
+
+def normalize_query(query):
+    """
+    Нормализует поисковый запрос: регистр и лишние пробелы не влияют на ключ кэша.
+    """
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    """
+    Кэш результатов поиска: LRU в памяти поверх таблицы search_cache в SQLite.
+    Актуальные записи отдаются вместо запроса к API, устаревшие — только в оффлайн-режиме.
+    Попадания в память тоже обновляют accessed_at (пачками), поэтому с диска вытесняются
+    действительно давно не использованные запросы.
+    """
+
+    def __init__(self, db_name=DB_PATH, ttl=SEARCH_CACHE_TTL,
+                 memory_entries=SEARCH_CACHE_MEMORY_ENTRIES, max_bytes=SEARCH_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()  # cache_key -> (results, created_at)
+        self._touched = {}  # cache_key -> время обращения, ещё не записанное в базу
+        self._touched_flushed = time.monotonic()
+        self._total_bytes = None  # Объём таблицы, считается один раз и дальше ведётся по изменениям
+        self._lock = threading.Lock()
+
+        # Каждый поток работает через своё подключение из общего пула.
+        # Таблица search_cache создаётся миграциями (database/migrations.py)
+        self.pool = get_connection_manager(db_name)
+
+    @property
+    def connection(self):
+        return self.pool.connection()
+
+    @staticmethod
+    def make_key(source, query, limit):
+        return f"{source}:{limit}:{normalize_query(query)}"
+
+    def get(self, source, query, limit, allow_stale=False):
+        """
+        Результаты из кэша или None.
+        allow_stale=True отдаёт и просроченные записи (нет сети).
+        """
+        key = self.make_key(source, query, limit)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._touched[key] = now
+                if (len(self._touched) >= ACCESS_FLUSH_BATCH
+                        or time.monotonic() - self._touched_flushed >= ACCESS_FLUSH_INTERVAL):
+                    self._flush_touched()
+                    self.connection.commit()
+            else:
+                row = self.connection.execute(
+                    "SELECT response, created_at FROM search_cache WHERE cache_key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                entry = (json.loads(row[0]), row[1])
+                self.connection.execute(
+                    "UPDATE search_cache SET accessed_at = ? WHERE cache_key = ?", (now, key)
+                )
+                self.connection.commit()
+                self._remember(key, entry)
+
+        results, created_at = entry
+        if not allow_stale and now - created_at > self.ttl:
+            return None
+        return results
+
+    def put(self, source, query, limit, results):
+        """
+        Сохраняет результаты поиска и вытесняет самые старые записи при превышении объёма.
+        """
+        key = self.make_key(source, query, limit)
+        payload = json.dumps(results, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._remember(key, (results, now))
+            self._touched.pop(key, None)
+            self._flush_touched()
+            total = self._table_bytes()
+            previous = self.connection.execute(
+                "SELECT size FROM search_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO search_cache (cache_key, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now)
+            )
+            self._total_bytes = total - (previous[0] if previous else 0) + len(payload)
+            self._evict()
+            self.connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            self.connection.execute("DELETE FROM search_cache")
+            self.connection.commit()
+            self._total_bytes = 0
+
+    def _remember(self, key, entry):
+        # Вызывается под self._lock
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        # Вызывается под self._lock, транзакцию завершает вызывающий
+        if self._touched:
+            self.connection.executemany(
+                "UPDATE search_cache SET accessed_at = ? WHERE cache_key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()]
+            )
+            self._touched.clear()
+        self._touched_flushed = time.monotonic()
+
+    def _table_bytes(self):
+        # Вызывается под self._lock
+        if self._total_bytes is None:
+            self._total_bytes = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM search_cache"
+            ).fetchone()[0]
+        return self._total_bytes
+
+    def _evict(self):
+        # Вызывается под self._lock: удаляет давно не использованные записи сверх max_bytes
+        total = self._table_bytes()
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute(
+            "SELECT cache_key, size FROM search_cache ORDER BY accessed_at"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+            self._memory.pop(key, None)
+        self.connection.executemany("DELETE FROM search_cache WHERE cache_key = ?", evicted)
+        self._total_bytes = total
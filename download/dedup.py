@@ -0,0 +1,151 @@
+import hashlib
+import os
+
+from config import DOWNLOAD_BUFFER_SIZE
+from database.db_manager import DatabaseManager
+
+# Алгоритм хэша содержимого: один и тот же во время скачивания и при проверке библиотеки
+HASH_ALGORITHM = "sha256"
+
+
+# Размер заголовка ID3v2 и тега ID3v1 в конце файла
+ID3V2_HEADER_SIZE = 10
+ID3V1_SIZE = 128
+
+
+class AudioHasher:
+    """
+    Хэш аудиоданных mp3 без тегов: заголовок ID3v2 в начале и тег ID3v1 в конце пропускаются,
+    поэтому запись тегов после скачивания не меняет хэш. Данные подаются по частям через update,
+    последние ID3V1_SIZE байт придерживаются, пока не станет ясно, что это не тег ID3v1.
+    """
+
+    def __init__(self):
+        self._hasher = hashlib.new(HASH_ALGORITHM)
+        self._header = bytearray()
+        self._skip = None
+        self._tail = bytearray()
+
+    def update(self, data):
+        data = memoryview(data)
+        if self._skip is None:
+            needed = ID3V2_HEADER_SIZE - len(self._header)
+            self._header += data[:needed]
+            data = data[needed:]
+            if len(self._header) < ID3V2_HEADER_SIZE:
+                return
+            self._skip = _id3v2_size(self._header)
+            if self._skip:
+                self._skip -= ID3V2_HEADER_SIZE
+            else:
+                self._feed(memoryview(self._header))
+        if self._skip:
+            skipped = min(self._skip, len(data))
+            self._skip -= skipped
+            data = data[skipped:]
+        self._feed(data)
+
+    def _feed(self, data):
+        if len(data) >= ID3V1_SIZE:
+            self._hasher.update(self._tail)
+            self._hasher.update(data[:-ID3V1_SIZE])
+            self._tail[:] = data[-ID3V1_SIZE:]
+            return
+        self._tail += data
+        extra = len(self._tail) - ID3V1_SIZE
+        if extra > 0:
+            self._hasher.update(self._tail[:extra])
+            del self._tail[:extra]
+
+    def hexdigest(self):
+        hasher = self._hasher.copy()
+        # Файл короче заголовка ID3v2: в хэш идёт всё как есть
+        tail = self._tail if self._skip is not None else self._header
+        if not (len(tail) == ID3V1_SIZE and tail.startswith(b"TAG")):
+            hasher.update(tail)
+        return hasher.hexdigest()
+
+
+def _id3v2_size(header):
+    """
+    Полный размер тега ID3v2 (с заголовком и футером) или 0, если файл начинается не с тега.
+    """
+    if header[:3] != b"ID3" or any(byte & 0x80 for byte in header[6:10]):
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | byte
+    footer = ID3V2_HEADER_SIZE if header[5] & 0x10 else 0
+    return ID3V2_HEADER_SIZE + size + footer
+
+
+def new_hasher():
+    return AudioHasher()
+
+
+def update_from_file(hasher, path, buffer=None):
+    """
+    Досчитывает хэш по содержимому файла (например, уже скачанной части при докачке).
+    """
+    buffer = buffer if buffer is not None else bytearray(DOWNLOAD_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as file:
+        while True:
+            read = file.readinto(buffer)
+            if not read:
+                break
+            hasher.update(view[:read])
+    return hasher
+
+
+def hash_file(path, buffer=None):
+    return update_from_file(new_hasher(), path, buffer).hexdigest()
+
+
+def dedup_report(db_manager):
+    """
+    Однократная проверка библиотеки на дубликаты по содержимому.
+    Для скачанных треков без хэша он досчитывается и сохраняется в базу.
+
+    Возвращает список групп дубликатов (content_hash, size, [пути]) и объём,
+    который освободится, если оставить по одному файлу из группы.
+    """
+    buffer = bytearray(DOWNLOAD_BUFFER_SIZE)
+    missing = db_manager.get_tracks_without_hash()
+    hashed = []
+    for track in missing:
+        path = track["file_path"]
+        if not (path and os.path.exists(path)):
+            continue
+        hashed.append((hash_file(path, buffer), track["id"]))
+    if hashed:
+        db_manager.set_content_hashes(hashed)
+        print(f"Посчитаны хэши для {len(hashed)} файлов")
+
+    groups = []
+    reclaimable = 0
+    for content_hash, paths in db_manager.get_duplicate_hash_groups():
+        # Несколько записей могут ссылаться на один файл — это уже не дубликат на диске
+        files = sorted({path for path in paths if path and os.path.exists(path)})
+        if len(files) < 2:
+            continue
+        size = os.path.getsize(files[0])
+        reclaimable += size * (len(files) - 1)
+        groups.append((content_hash, size, files))
+    return groups, reclaimable
+
+
+def print_dedup_report(groups, reclaimable):
+    if not groups:
+        print("Дубликатов в библиотеке не найдено")
+        return
+    for content_hash, size, files in groups:
+        print(f"{content_hash[:12]} · {size / (1024 * 1024):.1f} МБ · копий: {len(files)}")
+        for path in files:
+            print(f"    {path}")
+    print(f"Групп дубликатов: {len(groups)}, можно освободить {reclaimable / (1024 * 1024):.1f} МБ")
+
+
+if __name__ == "__main__":
+    # Отчёт по дубликатам: python -m download.dedup
+    print_dedup_report(*dedup_report(DatabaseManager()))
@@ -1,76 +1,429 @@
 import os
+import threading
+import time
+
 import requests
-import sqlite3
+import urllib3
+
+from config import (
+    DOWNLOAD_WORKERS,
+    DOWNLOAD_CONNECT_TIMEOUT,
+    DOWNLOAD_READ_TIMEOUT,
+    DOWNLOAD_BUFFER_SIZE,
+    PARTIAL_SUFFIX,
+    PROGRESS_EVENT_INTERVAL,
+    DAEMON_POLL_INTERVAL,
+)
+from api_clients.http_client import get_download_client
+from api_clients.soundcloud_client import StreamUrlResolver, get_stream_url, stream_url_expiry
+from download.scheduler import DownloadScheduler
+from download.watchdog import StallWatchdog, RetryPolicy
+from download.dedup import new_hasher, update_from_file, hash_file
+from download.events import EventChannel, DownloadEvent, STARTED, PROGRESS, FINISHED, FAILED, PAUSED
+from monitoring.metrics import get_metrics
 
 
 class TrackDownloader:
-    def __init__(self, db_manager, download_dir="downloads"):
+    def __init__(self, db_manager, download_dir="downloads", workers=DOWNLOAD_WORKERS):
         self.db_manager = db_manager
         self.download_dir = download_dir
         os.makedirs(self.download_dir, exist_ok=True)  # Создаём папку, если её нет
 
-    def download_track(self, track_id, title, artist, download_url):
+        self.worker_count = max(1, int(workers))
+        self._workers = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._local = threading.local()
+        # События для GUI: начало, прогресс, завершение и ошибки скачивания
+        self.events = EventChannel()
+        # Общий пул keep-alive соединений, по одному соединению на поток
+        self.http = get_download_client()
+        self.http.resize_pool(self.worker_count)
+        # Порядок выдачи треков, лимиты соединений на хост и общий предел скорости
+        self.scheduler = DownloadScheduler(db_manager)
+        # Неудачные загрузки повторяются с растущей задержкой, error — только после исчерпания повторов
+        self.retry_policy = RetryPolicy()
+        # Прерывает загрузки, скорость которых упала ниже минимальной
+        self.watchdog = StallWatchdog()
+        # Свежие ссылки на поток для треков, добавленных в очередь по transcoding URL
+        self.stream_resolver = StreamUrlResolver(get_stream_url)
+        # listener(track_id, file_path) вызывается после каждого скачанного трека (например, запись тегов)
+        self._completion_listeners = []
+        # Режим демона: при пустой очереди потоки не завершаются, а проверяют её раз в idle_poll секунд
+        self.idle_poll = None
+
+    def _buffer(self):
+        """
+        Буфер записи текущего потока: выделяется один раз и переиспользуется для всех треков.
+        """
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = bytearray(DOWNLOAD_BUFFER_SIZE)
+            self._local.buffer = buffer
+        return buffer
+
+    def target_path(self, title, artist):
+        """
+        Путь к итоговому файлу трека.
+        """
+        filename = f"{artist} - {title}.mp3".replace("/", "-")
+        return os.path.join(self.download_dir, filename)
+
+    def download_track(self, track_id, title, artist, download_url, stream=None):
         """
         Скачивание трека и обновление информации в БД.
+        Данные пишутся в .part файл, который дозагружается при повторной попытке
+        и переименовывается в итоговый только после проверки размера.
+        Если такое же содержимое уже есть в библиотеке, вторая копия не сохраняется:
+        трек ссылается на существующий файл.
+        Сетевые ошибки и зависания повторяются по retry_policy, статус error ставится
+        только после исчерпания повторов.
+
+        stream — пара (ID трека в источнике, transcoding URL): по ней ссылка на поток
+        получается заново, если сохранённая отсутствует, истекла или сервер ответил 403.
         """
-        try:
-            # Скачиваем файл
-            response = requests.get(download_url, stream=True)
+        db = self.db_manager
+        filepath = self.target_path(title, artist)
+        part_path = filepath + PARTIAL_SUFFIX
+        metrics = get_metrics()
+        with metrics.span("download.track", track_id=track_id) as span:
+            try:
+                if stream is not None and _stream_url_expired(download_url):
+                    download_url = self._refresh_stream_url(track_id, stream)
+                try:
+                    content_hash = self._fetch_to_part(download_url, part_path, track_id, title)
+                except requests.HTTPError as e:
+                    if stream is None or e.response is None or e.response.status_code != 403:
+                        raise
+                    # Подпись отозвана раньше указанного срока — одна попытка со свежей ссылкой
+                    self.stream_resolver.invalidate(stream[0])
+                    download_url = self._refresh_stream_url(track_id, stream)
+                    content_hash = self._fetch_to_part(download_url, part_path, track_id, title)
+                if content_hash is None:
+                    # Остановлено пользователем — .part остаётся для докачки
+                    db.requeue_track(track_id)
+                    span["outcome"] = "paused"
+                    self.events.publish(DownloadEvent(PAUSED, track_id, title=title))
+                    print(f"Скачивание '{title}' приостановлено")
+                    return
+
+                duplicate = db.find_by_content_hash(content_hash, exclude_id=track_id)
+                if duplicate is not None and duplicate["file_path"] and os.path.exists(duplicate["file_path"]):
+                    # Перезалив уже скачанной записи: храним один файл
+                    os.remove(part_path)
+                    filepath = duplicate["file_path"]
+                    print(f"Трек '{title}' совпадает с '{duplicate['track_title']}', используется {filepath}")
+                else:
+                    os.replace(part_path, filepath)
+
+                # Обновляем статус трека в базе
+                db.update_track_status(track_id, "complete", filepath, content_hash)
+                size = os.path.getsize(filepath)
+                span["outcome"] = "complete"
+                span["bytes"] = size
+                metrics.inc("download.complete")
+                self.events.publish(DownloadEvent(
+                    FINISHED, track_id, title=title, downloaded=size, total=size, file_path=filepath
+                ))
+                print(f"Трек '{title}' успешно скачан в {filepath}")
+            except Exception as e:
+                error_message = str(e)
+                retry_count = db.get_retry_count(track_id)
+                if self.retry_policy.should_retry(e, retry_count):
+                    # .part остаётся: повтор продолжит с места обрыва
+                    db.schedule_retry(track_id, error_message, self.retry_policy.delay(retry_count))
+                    span["outcome"] = "retry"
+                    span["error"] = error_message
+                    metrics.inc("download.retried")
+                    self.events.publish(DownloadEvent(PAUSED, track_id, title=title, error=error_message))
+                    print(f"Ошибка при скачивании трека {title} (повтор {retry_count + 1}): {error_message}")
+                    return
+                db.mark_error(track_id, error_message)
+                span["outcome"] = "failed"
+                span["error"] = error_message
+                metrics.inc("download.failed")
+                self.events.publish(DownloadEvent(FAILED, track_id, title=title, error=error_message))
+                print(f"Ошибка при скачивании трека {title}: {error_message}")
+                return
+
+        # Слушатели вызываются вне обработки ошибок скачивания: их сбой не должен менять статус скачанного трека
+        self._notify_completion(track_id, filepath)
+
+    def _notify_completion(self, track_id, filepath):
+        for listener in self._completion_listeners:
+            try:
+                listener(track_id, filepath)
+            except Exception as e:
+                print(f"Ошибка обработчика завершения скачивания для трека ID {track_id}: {e}")
+
+    def _refresh_stream_url(self, track_id, stream):
+        """
+        Получает ссылку на поток по transcoding URL и сохраняет её в базу для следующих попыток.
+        """
+        source_id, transcoding_url = stream
+        stream_url = self.stream_resolver.resolve(source_id, transcoding_url)
+        if not stream_url:
+            # Сетевая ошибка: трек уйдёт на повтор по retry_policy
+            raise IOError("Не удалось получить ссылку на поток")
+        self.db_manager.update_stream_url(track_id, stream_url)
+        get_metrics().inc("download.stream_refreshed")
+        return stream_url
+
+    def add_completion_listener(self, listener):
+        """
+        Подписка на завершение скачивания. Слушатель вызывается в потоке скачивания,
+        поэтому должен только ставить работу в свою очередь.
+        """
+        self._completion_listeners.append(listener)
+
+    def _fetch_to_part(self, download_url, part_path, track_id=None, title=None):
+        """
+        Докачивает файл в part_path, продолжая с уже скачанного байта через HTTP Range.
+        Хэш содержимого считается по ходу записи; при докачке сначала дочитывается уже скачанная часть.
+
+        Возвращает хэш содержимого или None, если скачивание прервано остановкой пула.
+        """
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+
+        response = self.http.get(
+            download_url,
+            headers=headers,
+            stream=True,
+            timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT)
+        )
+        with response:
+            if response.status_code == 416:
+                # Запрошенный диапазон за концом файла: .part уже скачан целиком
+                total = _content_range_total(response.headers.get("Content-Range"))
+                if total == offset:
+                    return hash_file(part_path, self._buffer())
+                os.remove(part_path)
+                raise IOError(f"Сервер отклонил докачку с байта {offset}, файл будет скачан заново")
             response.raise_for_status()
 
-            filename = f"{artist} - {title}.mp3".replace("/", "-")
-            filepath = os.path.join(self.download_dir, filename)
+            if offset and response.status_code != 206:
+                # Сервер не поддерживает Range — начинаем с нуля
+                print(f"Сервер не поддерживает докачку, скачиваем заново: {part_path}")
+                offset = 0
 
-            with open(filepath, "wb") as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    file.write(chunk)
+            expected_size = None
+            if response.status_code == 206:
+                expected_size = _content_range_total(response.headers.get("Content-Range"))
+            if expected_size is None and response.headers.get("Content-Length"):
+                expected_size = offset + int(response.headers["Content-Length"])
 
-            # Обновляем статус трека в базе
-            self.db_manager.update_track_status(track_id, "complete", filepath)
-            print(f"Трек '{title}' успешно скачан в {filepath}")
-        except Exception as e:
-            error_message = str(e)
-            self.db_manager.mark_error(track_id, error_message)
-            print(f"Ошибка при скачивании трека {title}: {error_message}")
+            buffer = self._buffer()
+            view = memoryview(buffer)
+            hasher = new_hasher()
+            if offset:
+                update_from_file(hasher, part_path, buffer)
 
-    def process_downloads(self):
+            downloaded = offset
+            self.events.publish(DownloadEvent(
+                STARTED, track_id, title=title, downloaded=downloaded, total=expected_size
+            ))
+            last_time = time.monotonic()
+            last_downloaded = downloaded
+            transfer = self.watchdog.watch(response, downloaded)
+
+            raw = response.raw
+            raw.decode_content = True
+            transfer_started = time.monotonic()
+            try:
+                with open(part_path, "ab" if offset else "wb", buffering=0) as file:
+                    while True:
+                        if self._stop_event.is_set():
+                            return None
+                        # Размер чтения зависит от лимита скорости, лимит можно поменять на ходу
+                        chunk = min(self.scheduler.chunk_size(len(buffer)), self.watchdog.max_chunk)
+                        read = raw.readinto(view[:chunk])
+                        if not read:
+                            break
+                        file.write(view[:read])
+                        hasher.update(view[:read])
+                        downloaded += read
+                        transfer.update(downloaded)
+                        self.scheduler.throttle(read)
+
+                        # Прогресс публикуется не чаще PROGRESS_EVENT_INTERVAL, чтобы не засыпать канал
+                        now = time.monotonic()
+                        if now - last_time >= PROGRESS_EVENT_INTERVAL:
+                            speed = (downloaded - last_downloaded) / (now - last_time)
+                            self.events.publish(DownloadEvent(
+                                PROGRESS, track_id, title=title, downloaded=downloaded,
+                                total=expected_size, speed=speed
+                            ))
+                            last_time = now
+                            last_downloaded = downloaded
+            except urllib3.exceptions.HTTPError as e:
+                # Обрыв соединения сторожем — это зависание, а не обычная сетевая ошибка
+                transfer.check()
+                # Обрыв или таймаут посреди тела: .part остаётся, повтор продолжит с этого байта
+                raise IOError(f"Соединение прервано на байте {downloaded}: {e}") from e
+            except Exception:
+                transfer.check()
+                raise
+            finally:
+                self.watchdog.unwatch(transfer)
+                # Учитываются байты этой попытки, в том числе оборванной; скорость — по чистому времени передачи
+                metrics = get_metrics()
+                metrics.inc("download.bytes", downloaded - offset)
+                elapsed = time.monotonic() - transfer_started
+                if downloaded > offset and elapsed > 0:
+                    metrics.observe("download.throughput_kbps", (downloaded - offset) / 1024 / elapsed, unit="КБ/с")
+            transfer.check()
+
+        actual_size = os.path.getsize(part_path)
+        if expected_size is not None and actual_size != expected_size:
+            if actual_size > expected_size:
+                os.remove(part_path)
+            raise IOError(f"Размер файла {actual_size} не совпадает с ожидаемым {expected_size}")
+        return hasher.hexdigest()
+
+    @property
+    def is_running(self):
+        with self._lock:
+            return bool(self._workers)
+
+    def set_worker_count(self, count):
         """
-        Обработка треков в статусе 'pending' в фоновом режиме.
+        Меняет количество потоков скачивания. Можно вызывать во время работы очереди:
+        недостающие потоки запускаются сразу, лишние завершаются после текущего трека.
         """
-        while True:
-            conn = self.db_manager.get_new_connection()
-            conn.row_factory = sqlite3.Row  # Позволяет обращаться к колонкам по имени
-            cursor = conn.cursor()
+        with self._lock:
+            self.worker_count = max(1, int(count))
+            self.http.resize_pool(self.worker_count)
+            if self._workers and not self._stop_event.is_set():
+                self._spawn_workers()
+        print(f"Количество потоков скачивания: {self.worker_count}")
 
-            # Получаем список полей таблицы для проверки структуры
-            cursor.execute("PRAGMA table_info(downloaded_tracks)")
-            columns = cursor.fetchall()
-            column_names = [column[1] for column in columns]
+    def start(self):
+        """
+        Запускает пул потоков скачивания и сразу возвращает управление.
+        """
+        with self._lock:
+            self._stop_event.clear()
+            self._spawn_workers()
 
-            # Определяем, какое имя колонки используется для URL
-            url_column = "url" if "url" in column_names else "download_url"
+    def stop(self):
+        """
+        Останавливает пул: текущие загрузки прерываются и возвращаются в очередь,
+        недокачанные .part файлы остаются для докачки.
+        """
+        self._stop_event.set()
 
-            # Загружаем список ожидающих треков
-            cursor.execute(f"SELECT * FROM downloaded_tracks WHERE status = 'pending' LIMIT 5")
-            pending_tracks = cursor.fetchall()
+    def join(self, timeout=None):
+        """
+        Ждёт завершения потоков скачивания после stop(), но не дольше timeout секунд на все потоки.
+        Возвращает True, если все потоки завершились.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(worker.is_alive() for worker in workers)
 
-            if not pending_tracks:
-                print("Очередь пуста. Ждём новых треков...")
-                break
+    def _spawn_workers(self):
+        # Вызывается под self._lock
+        while len(self._workers) < self.worker_count:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"download-worker-{len(self._workers) + 1}",
+                daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _worker_loop(self):
+        me = threading.current_thread()
+        try:
+            while not self._stop_event.is_set():
+                with self._lock:
+                    # Лишний поток после уменьшения количества потоков
+                    if len(self._workers) > self.worker_count:
+                        self._workers.remove(me)
+                        break
+
+                track = self.scheduler.acquire(self._stop_event)
+                if track is None:
+                    if self.idle_poll is None or self._stop_event.wait(self.idle_poll):
+                        break
+                    continue
 
-            for track in pending_tracks:
-                track_id = track["id"]
                 title = track["track_title"]
                 artist = track["artist"] or "Unknown Artist"
-                url = track[url_column]
+                url = track["url"]
+                stream = None
+                if track["transcoding_url"]:
+                    stream = (track["track_id"] or track["transcoding_url"], track["transcoding_url"])
+
+                print(f"[{me.name}] Начинаем скачивание: {title}")
+                try:
+                    self.download_track(track["id"], title, artist, url, stream)
+                finally:
+                    self.scheduler.release(track)
+        finally:
+            with self._lock:
+                if me in self._workers:
+                    self._workers.remove(me)
+            # Подключение потока возвращается в общий пул
+            self.db_manager.release_connection()
+
+    def process_downloads(self):
+        """
+        Обработка треков в статусе 'pending' пулом потоков.
+        Блокирует вызывающий поток, пока очередь не опустеет или пул не остановят.
+        """
+        self.start()
+        while True:
+            with self._lock:
+                workers = list(self._workers)
+            if not workers:
+                break
+            for worker in workers:
+                worker.join()
+        print("Очередь пуста. Ждём новых треков...")
+
+    def run_forever(self, poll_interval=DAEMON_POLL_INTERVAL):
+        """
+        Режим демона: потоки ждут новых треков (в том числе добавленных другим процессом)
+        вместо завершения на пустой очереди. Блокирует вызывающий поток до stop(),
+        затем дожидается завершения потоков — прерванные загрузки уже возвращены в очередь.
+        """
+        self.idle_poll = poll_interval
+        self.start()
+        try:
+            # Ожидание с таймаутом: обработчики сигналов выполняются в главном потоке между проверками
+            while not self._stop_event.wait(1.0):
+                pass
+            with self._lock:
+                workers = list(self._workers)
+            for worker in workers:
+                worker.join()
+        finally:
+            self.idle_poll = None
+        print("Скачивание остановлено.")
 
-                print(f"Начинаем скачивание: {title}")
 
-                # Устанавливаем статус "downloading"
-                cursor.execute("UPDATE downloaded_tracks SET status = 'downloading' WHERE id = ?", (track_id,))
-                conn.commit()
+def _content_range_total(content_range):
+    """
+    Полный размер файла из заголовка Content-Range ("bytes 100-199/1000" или "bytes */1000").
+    """
+    if not content_range or "/" not in content_range:
+        return None
+    total = content_range.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
 
-                # Скачиваем трек
-                self.download_track(track_id, title, artist, url)
 
-            conn.close()  # Закрываем соединение после обработки
\ No newline at end of file
+def _stream_url_expired(url):
+    """
+    Ссылки на поток нет или её подпись истечёт раньше, чем трек успеет скачаться.
+    """
+    if not url:
+        return True
+    expires_at = stream_url_expiry(url)
+    return expires_at is not None and expires_at - StreamUrlResolver.EXPIRY_MARGIN <= time.time()
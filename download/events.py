@@ -0,0 +1,56 @@
+import queue
+import time
+
+# Типы событий скачивания
+STARTED = "started"
+PROGRESS = "progress"
+FINISHED = "finished"
+FAILED = "failed"
+PAUSED = "paused"  # Скачивание остановлено пользователем, трек вернулся в очередь
+
+
+class DownloadEvent:
+    """
+    Событие скачивания одного трека.
+    """
+    __slots__ = ("kind", "track_id", "title", "downloaded", "total", "speed", "file_path", "error", "timestamp")
+
+    def __init__(self, kind, track_id, title=None, downloaded=0, total=None, speed=0.0,
+                 file_path=None, error=None):
+        self.kind = kind
+        self.track_id = track_id  # id строки в downloaded_tracks
+        self.title = title
+        self.downloaded = downloaded  # Байт скачано (с учётом докачки)
+        self.total = total  # Полный размер файла или None, если сервер его не сообщил
+        self.speed = speed  # Байт в секунду за последний интервал
+        self.file_path = file_path
+        self.error = error
+        self.timestamp = time.time()
+
+    def __repr__(self):
+        return f"DownloadEvent({self.kind}, track_id={self.track_id}, {self.downloaded}/{self.total})"
+
+
+class EventChannel:
+    """
+    Потокобезопасный канал событий: потоки скачивания публикуют, потребитель (GUI)
+    забирает накопившиеся события пачкой со своей частотой.
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+
+    def publish(self, event):
+        self._queue.put(event)
+
+    def drain(self, limit=1000):
+        """
+        Забирает до limit накопившихся событий, не блокируясь.
+        """
+        events = []
+        while len(events) < limit:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
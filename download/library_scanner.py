@@ -0,0 +1,218 @@
+import os
+import threading
+
+from config import LIBRARY_SCAN_INTERVAL, AUDIO_EXTENSIONS
+from database.connection import get_connection_manager
+from download.dedup import hash_file
+
+
+def normalize_path(path):
+    """
+    Ключ для сравнения путей: абсолютный, с единым регистром и разделителями (важно для Windows).
+    """
+    return os.path.normcase(os.path.abspath(path))
+
+
+class LibraryScanner:
+    """
+    Фоновый сканер библиотеки: сверяет базу с файлами в папках загрузок.
+
+    Проходы инкрементальные: папка, время изменения которой не поменялось, не перечитывается,
+    размер и время изменения файлов хранятся в таблице file_index. По итогам прохода пакетно
+    обновляется флаг file_present у треков, а файлы, перенесённые или добавленные заново вне
+    приложения, привязываются к своим трекам по имени или по хэшу содержимого.
+    """
+
+    def __init__(self, db_manager, directories=(), interval=LIBRARY_SCAN_INTERVAL):
+        self.db_manager = db_manager
+        self.directories = set(directories)
+        self.interval = interval
+        self.pool = get_connection_manager(db_manager.db_name)
+        # Кэш папок между проходами: ключ папки -> (mtime, {путь: (mtime, size)}, [подпапки])
+        self._dir_cache = {}
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def connection(self):
+        return self.pool.connection()
+
+    def add_directory(self, directory):
+        self.directories.add(directory)
+        self.request_scan()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="library-scanner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def join(self, timeout=None):
+        """
+        Ждёт завершения потока сканера после stop(). Возвращает True, если поток завершился.
+        """
+        if self._thread is None:
+            return True
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def request_scan(self):
+        """
+        Запускает внеочередной проход, не дожидаясь интервала.
+        """
+        self._wake.set()
+
+    def _run(self):
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self.scan_once()
+                except Exception as e:
+                    print(f"Ошибка сканирования библиотеки: {e}")
+                self._wake.wait(self.interval)
+                self._wake.clear()
+        finally:
+            self.db_manager.release_connection()
+
+    def scan_once(self):
+        """
+        Один проход сканера. Возвращает количество треков, у которых изменился файл или флаг наличия.
+        """
+        tracks = self.db_manager.get_library_files()
+        directories = set(self.directories)
+        directories.update(os.path.dirname(track["file_path"]) or "." for track in tracks)
+
+        present = {}  # ключ пути -> (путь, mtime, size)
+        visited = set()
+        for directory in directories:
+            self._scan_directory(directory, present, visited)
+
+        self._sync_file_index(present)
+
+        referenced = {normalize_path(track["file_path"]) for track in tracks}
+        # Файлы, на которые не ссылается ни один трек, — кандидаты для перенесённых треков
+        orphans = {key: entry for key, entry in present.items() if key not in referenced}
+
+        flags = []
+        relinks = []
+        for track in tracks:
+            is_present = normalize_path(track["file_path"]) in present
+            if not is_present:
+                match = self._find_moved_file(track, orphans)
+                if match is not None:
+                    relinks.append((match, track["id"]))
+                    continue
+            if bool(track["file_present"]) != is_present:
+                flags.append((int(is_present), track["id"]))
+
+        if flags or relinks:
+            self.db_manager.update_file_presence(flags, relinks)
+            print(f"Сканер библиотеки: наличие файлов изменилось у {len(flags)} треков, "
+                  f"найдено перенесённых файлов: {len(relinks)}")
+        return len(flags) + len(relinks)
+
+    def _scan_directory(self, directory, present, visited):
+        key = normalize_path(directory)
+        if key in visited:
+            return
+        visited.add(key)
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            # Папки больше нет — её файлы считаются отсутствующими
+            self._dir_cache.pop(key, None)
+            return
+
+        cached = self._dir_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            # Состав папки не менялся: файлы берём из кэша без обращения к диску
+            _, files, subdirs = cached
+        else:
+            files = {}
+            subdirs = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                            stat = entry.stat()
+                            files[entry.path] = (stat.st_mtime, stat.st_size)
+            except OSError as e:
+                print(f"Не удалось прочитать папку {directory}: {e}")
+                return
+            self._dir_cache[key] = (mtime, files, subdirs)
+
+        for path, (file_mtime, size) in files.items():
+            present[normalize_path(path)] = (path, file_mtime, size)
+        for subdir in subdirs:
+            self._scan_directory(subdir, present, visited)
+
+    def _sync_file_index(self, present):
+        """
+        Приводит file_index к найденным файлам: новые и изменённые записываются (хэш сбрасывается),
+        исчезнувшие удаляются.
+        """
+        indexed = {
+            row["path"]: (row["mtime"], row["size"])
+            for row in self.connection.execute("SELECT path, mtime, size FROM file_index")
+        }
+        upserts = [
+            (path, os.path.dirname(path), mtime, size)
+            for path, mtime, size in present.values()
+            if indexed.get(path) != (mtime, size)
+        ]
+        found = {path for path, _, _ in present.values()}
+        deletes = [(path,) for path in indexed if path not in found]
+        if not upserts and not deletes:
+            return
+        with self.connection:
+            self.connection.executemany(
+                """
+                INSERT INTO file_index (path, directory, mtime, size, content_hash) VALUES (?, ?, ?, ?, NULL)
+                ON CONFLICT(path) DO UPDATE SET
+                    mtime = excluded.mtime, size = excluded.size, content_hash = NULL
+                """,
+                upserts
+            )
+            self.connection.executemany("DELETE FROM file_index WHERE path = ?", deletes)
+
+    def _find_moved_file(self, track, orphans):
+        """
+        Ищет новое место файла трека среди непривязанных файлов: по имени файла, затем по хэшу.
+        Найденный файл убирается из orphans, чтобы не достаться двум трекам.
+        """
+        name = os.path.basename(track["file_path"]).lower()
+        for key, (path, _, _) in orphans.items():
+            if os.path.basename(path).lower() == name:
+                del orphans[key]
+                return path
+
+        if not track["content_hash"]:
+            return None
+        for key, (path, _, _) in orphans.items():
+            if self._file_hash(path) == track["content_hash"]:
+                del orphans[key]
+                return path
+        return None
+
+    def _file_hash(self, path):
+        """
+        Хэш файла из file_index; считается один раз, пока файл не изменится.
+        """
+        row = self.connection.execute("SELECT content_hash FROM file_index WHERE path = ?", (path,)).fetchone()
+        if row is not None and row["content_hash"]:
+            return row["content_hash"]
+        try:
+            content_hash = hash_file(path)
+        except OSError:
+            return None
+        self.connection.execute("UPDATE file_index SET content_hash = ? WHERE path = ?", (content_hash, path))
+        self.connection.commit()
+        return content_hash
@@ -0,0 +1,128 @@
+import threading
+from urllib.parse import urlparse
+
+from config import DOWNLOAD_PER_HOST_LIMIT, DOWNLOAD_BANDWIDTH_LIMIT
+from api_clients.http_client import TokenBucket
+
+
+class DownloadScheduler:
+    """
+    Планировщик очереди загрузок.
+
+    Выдаёт потокам треки по приоритету (внутри приоритета — в порядке добавления),
+    следит, чтобы к одному хосту было не больше per_host_limit соединений,
+    и ограничивает общую скорость всех потоков через общий TokenBucket.
+    Лимиты можно менять во время работы очереди.
+    """
+
+    # Минимальный размер чтения при ограничении скорости: меньше — слишком много системных вызовов
+    MIN_CHUNK = 16 * 1024
+
+    def __init__(self, db_manager, per_host_limit=DOWNLOAD_PER_HOST_LIMIT, bandwidth_limit=DOWNLOAD_BANDWIDTH_LIMIT):
+        self.db_manager = db_manager
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.bandwidth_limit = 0
+        self.bandwidth = TokenBucket(0)
+        self._active_hosts = {}  # ключ хоста -> количество активных загрузок
+        self._changed = threading.Condition()
+        self._generation = 0  # Растёт при освобождении хоста и смене лимита: ожидающие потоки не пропустят событие
+        self.set_bandwidth_limit(bandwidth_limit)
+
+    @staticmethod
+    def host_of(url):
+        return urlparse(url or "").netloc
+
+    @classmethod
+    def host_key(cls, row):
+        """
+        Ключ лимита соединений для строки очереди. Ссылку на поток для трека с transcoding_url
+        загрузчик получает только перед скачиванием, поэтому такие треки считаются по источнику:
+        потоки одного источника отдаёт один CDN. Остальные — по хосту ссылки на файл.
+        """
+        if row["transcoding_url"]:
+            return f"source:{row['source'] or cls.host_of(row['transcoding_url'])}"
+        return cls.host_of(row["url"])
+
+    def set_per_host_limit(self, limit):
+        with self._changed:
+            self.per_host_limit = max(1, int(limit))
+            self._generation += 1
+            self._changed.notify_all()
+        print(f"Соединений к одному хосту: {self.per_host_limit}")
+
+    def set_bandwidth_limit(self, bytes_per_second):
+        """
+        Общий предел скорости всех потоков, байт/с. 0 — без ограничения.
+        """
+        self.bandwidth_limit = max(0, int(bytes_per_second))
+        # Запас токенов — на секунду передачи, чтобы не было рывков после паузы
+        self.bandwidth.set_rate(self.bandwidth_limit, self.bandwidth_limit)
+        if self.bandwidth_limit:
+            print(f"Ограничение скорости загрузок: {self.bandwidth_limit // 1024} КБ/с")
+        else:
+            print("Ограничение скорости загрузок снято")
+
+    def acquire(self, stop_event, poll_interval=1.0):
+        """
+        Забирает следующий трек, хост которого не превышает лимит соединений.
+        Если все ожидающие треки упираются в лимит, ждёт освобождения хоста.
+
+        Возвращает строку трека или None, если очередь пуста или пул остановлен.
+
+        Запросы к базе идут без блокировки планировщика (SQLite может ждать блокировку до
+        DB_BUSY_TIMEOUT_MS), поэтому release() других потоков их не ждёт. Лимит хоста
+        перепроверяется под блокировкой: если хост успели занять, трек возвращается в очередь.
+        """
+        while not stop_event.is_set():
+            with self._changed:
+                generation = self._generation
+            track = self.db_manager.claim_next_track(accept=self._host_available)
+            if track is not None:
+                host = self.host_key(track)
+                with self._changed:
+                    if self._active_hosts.get(host, 0) < self.per_host_limit:
+                        self._active_hosts[host] = self._active_hosts.get(host, 0) + 1
+                        return track
+                self.db_manager.requeue_track(track["id"])
+            elif not self.db_manager.has_pending_tracks():
+                return None
+            with self._changed:
+                # Освобождение хоста после начала прохода тоже будит поток
+                self._changed.wait_for(
+                    lambda: self._generation != generation or stop_event.is_set(), poll_interval
+                )
+        return None
+
+    def release(self, track):
+        """
+        Освобождает слот хоста после завершения (или прерывания) загрузки трека.
+        """
+        host = self.host_key(track)
+        with self._changed:
+            count = self._active_hosts.get(host, 0) - 1
+            if count > 0:
+                self._active_hosts[host] = count
+            else:
+                self._active_hosts.pop(host, None)
+            self._generation += 1
+            self._changed.notify_all()
+
+    def _host_available(self, row):
+        # Вызывается без блокировки — это только подсказка, окончательно лимит проверяет acquire
+        return self._active_hosts.get(self.host_key(row), 0) < self.per_host_limit
+
+    def chunk_size(self, buffer_size):
+        """
+        Размер одного чтения: при ограничении скорости — не больше четверти секундной нормы,
+        чтобы поток не засыпал надолго и быстро реагировал на остановку.
+        """
+        if not self.bandwidth_limit:
+            return buffer_size
+        return max(self.MIN_CHUNK, min(buffer_size, self.bandwidth_limit // 4))
+
+    def throttle(self, nbytes):
+        """
+        Ждёт, пока общий лимит скорости позволит передать ещё nbytes байт.
+        """
+        if self.bandwidth_limit:
+            self.bandwidth.acquire(nbytes)
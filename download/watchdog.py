@@ -0,0 +1,147 @@
+import random
+import socket
+import threading
+import time
+
+import requests
+import urllib3
+
+from config import (
+    DOWNLOAD_STALL_MIN_RATE,
+    DOWNLOAD_STALL_WINDOW,
+    DOWNLOAD_MAX_RETRIES,
+    DOWNLOAD_RETRY_BASE,
+    DOWNLOAD_RETRY_MAX,
+)
+
+
+class DownloadStalled(IOError):
+    """
+    Загрузка идёт медленнее минимальной скорости дольше допустимого окна.
+    """
+
+
+class Transfer:
+    """
+    Состояние одной наблюдаемой загрузки. update() вызывается потоком скачивания после каждого чтения.
+    """
+
+    def __init__(self, response, downloaded):
+        self.response = response
+        self.downloaded = downloaded
+        self.window_start = time.monotonic()
+        self.window_bytes = downloaded
+        self.stalled = None  # Текст причины, если загрузка прервана сторожем
+
+    def update(self, downloaded):
+        self.downloaded = downloaded
+
+    def check(self):
+        """
+        Бросает DownloadStalled, если сторож прервал эту загрузку.
+        """
+        if self.stalled:
+            raise DownloadStalled(self.stalled)
+
+
+class StallWatchdog:
+    """
+    Сторож зависших загрузок: фоновый поток раз в секунду проверяет скорость всех активных загрузок.
+    Если за window секунд загрузка прошла меньше min_rate байт/с, её соединение закрывается —
+    это прерывает даже чтение, заблокированное на «капающем» сокете, которое таймаут чтения не ловит.
+    """
+
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self, min_rate=DOWNLOAD_STALL_MIN_RATE, window=DOWNLOAD_STALL_WINDOW):
+        self.min_rate = min_rate
+        self.window = window
+        self._transfers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def max_chunk(self):
+        """
+        Наибольший размер одного чтения: на минимальной скорости оно должно укладываться в полокна,
+        иначе сторож не увидит прогресса у медленной, но живой загрузки.
+        """
+        return max(16 * 1024, int(self.min_rate * self.window / 2))
+
+    def watch(self, response, downloaded=0):
+        transfer = Transfer(response, downloaded)
+        with self._lock:
+            self._transfers.add(transfer)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="download-watchdog", daemon=True)
+                self._thread.start()
+        return transfer
+
+    def unwatch(self, transfer):
+        with self._lock:
+            self._transfers.discard(transfer)
+
+    def _run(self):
+        while True:
+            time.sleep(self.CHECK_INTERVAL)
+            if not self.min_rate:
+                continue
+            now = time.monotonic()
+            with self._lock:
+                transfers = list(self._transfers)
+            for transfer in transfers:
+                elapsed = now - transfer.window_start
+                if elapsed < self.window:
+                    continue
+                rate = (transfer.downloaded - transfer.window_bytes) / elapsed
+                if rate >= self.min_rate:
+                    transfer.window_start = now
+                    transfer.window_bytes = transfer.downloaded
+                    continue
+                transfer.stalled = (
+                    f"Загрузка зависла: {rate / 1024:.1f} КБ/с за {elapsed:.0f} с "
+                    f"(минимум {self.min_rate / 1024:.0f} КБ/с)"
+                )
+                self.unwatch(transfer)
+                _abort(transfer.response)
+
+
+def _abort(response):
+    """
+    Обрывает соединение ответа из другого потока: заблокированное чтение сразу завершится ошибкой.
+    shutdown действует на само соединение, поэтому достаточно копии дескриптора сокета.
+    """
+    try:
+        with socket.fromfd(response.raw.fileno(), socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.shutdown(socket.SHUT_RDWR)
+    except (OSError, ValueError):
+        response.close()
+
+
+class RetryPolicy:
+    """
+    Политика повторов: какие ошибки стоит повторять и через сколько секунд.
+    """
+
+    def __init__(self, max_retries=DOWNLOAD_MAX_RETRIES, base=DOWNLOAD_RETRY_BASE, cap=DOWNLOAD_RETRY_MAX):
+        self.max_retries = max_retries
+        self.base = base
+        self.cap = cap
+
+    def should_retry(self, error, retry_count):
+        if retry_count >= self.max_retries:
+            return False
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            # Ответы 4xx (кроме таймаута и лимита запросов) повтор не исправит
+            status = error.response.status_code
+            return status >= 500 or status in (408, 429)
+        # Обрыв и таймаут посреди тела ответа приходят из urllib3 (ProtocolError, ReadTimeoutError) —
+        # raw.readinto не оборачивает их в исключения requests
+        return isinstance(error, (requests.RequestException, urllib3.exceptions.HTTPError, OSError))
+
+    def delay(self, retry_count):
+        """
+        Задержка перед повтором номер retry_count + 1: экспоненциальная, с разбросом ±25%.
+        """
+        delay = min(self.cap, self.base * 2 ** retry_count)
+        return delay * random.uniform(0.75, 1.25)
@@ -3,37 +3,96 @@ import customtkinter as ctk
 from tkinter import Menu, filedialog, messagebox
 import subprocess
 import os
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
 from database.db_manager import DatabaseManager
+from config import (
+    DOWNLOAD_WORKERS,
+    DOWNLOAD_WORKER_CHOICES,
+    DOWNLOAD_PER_HOST_LIMIT,
+    DOWNLOAD_PER_HOST_CHOICES,
+    DOWNLOAD_BANDWIDTH_LIMIT,
+    DOWNLOAD_BANDWIDTH_CHOICES,
+    GUI_EVENT_POLL_MS,
+)
+from download.events import STARTED, PROGRESS, FINISHED, FAILED, PAUSED
+from api_clients.soundcloud_client import StreamUrlResolver
+from api_clients.federated_search import FederatedSearch, MergedResults
+from api_clients.providers import ProviderPage
+from gui.virtual_list import VirtualList
+from gui.stats_window import StatsWindow
+from gui.metrics_panel import MetricsWindow
+from analytics.analyzer import LibraryAnalyzer
+from analytics.recommender import Recommender
+from playlists.smart_playlists import SmartPlaylists
+from monitoring.metrics import get_metrics
 
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("blue")
 
 
-class TrackItem(ctk.CTkFrame):
-    currently_playing = None
-    def __init__(self, master, title, stream_url=None, track_id=None):
-        super().__init__(master)
+def format_size(num_bytes):
+    """Размер в человекочитаемом виде: 512 КБ, 3.4 МБ"""
+    if num_bytes < 1024 * 1024:
+        return f"{num_bytes / 1024:.0f} КБ"
+    return f"{num_bytes / (1024 * 1024):.1f} МБ"
+
+
+@lru_cache(maxsize=None)
+def load_icon(name, size=20):
+    """Значок из папки pic: файл декодируется один раз, изображение общее для всех строк"""
+    return ctk.CTkImage(light_image=Image.open(f"pic/{name}-48.png"), size=(size, size))
+
+
+class SearchResult:
+    """Данные строки результатов поиска (отдельно от виджета — виджеты строк переиспользуются)"""
+
+    def __init__(self, title, stream_url=None, track_id=None, transcoding_url=None, resolver=None,
+                 is_local=False, metadata=None, downloadable=True):
         self.title = title
+        self.metadata = metadata or {}  # Название, артист, альбом и т.д. для очереди и тегов
+        self.is_local = is_local  # Трек из локальной библиотеки: только прослушивание
+        self.downloadable = downloadable and not is_local  # False — превью, в очередь не добавляется
         self.stream_url = stream_url
         self.track_id = track_id
-        self.configure(height=40)
+        self.transcoding_url = transcoding_url
+        self.resolver = resolver
         self.selected = False
-        self.ffplay_process = None
 
-        self.label = ctk.CTkLabel(self, text=title, anchor="w")
+    @property
+    def has_stream(self):
+        return bool(self.stream_url or (self.resolver and self.transcoding_url))
+
+    def stream_future(self):
+        """Future со ссылкой на стрим: ссылка получается лениво через общий резолвер"""
+        if self.resolver and self.transcoding_url:
+            return self.resolver.submit(self.track_id, self.transcoding_url)
+        future = Future()
+        future.set_result(self.stream_url)
+        return future
+
+
+class TrackItem(ctk.CTkFrame):
+    # Одновременно проигрывается один трек
+    player_process = None
+    playing_item = None
+
+    def __init__(self, master, view, height=40):
+        super().__init__(master, height=height)
+        self.pack_propagate(False)
+        self.view = view
+        self.item = None
+
+        self.label = ctk.CTkLabel(self, text="", anchor="w")
         self.label.pack(fill="both", expand=True, padx=5)
 
         # Кнопки — будут размещены поверх текста
         self.button_frame = ctk.CTkFrame(self, fg_color="transparent")
 
-        self.img_play = ctk.CTkImage(light_image=Image.open("pic/play-48.png"), size=(20, 20))
-        self.img_pause = ctk.CTkImage(light_image=Image.open("pic/pause-48.png"), size=(20, 20))
-        self.img_stop = ctk.CTkImage(light_image=Image.open("pic/stop-48.png"), size=(20, 20))
-        self.img_delete = ctk.CTkImage(light_image=Image.open("pic/delete-48.png"), size=(20, 20))
-
         self.listen_button = ctk.CTkButton(
             self.button_frame,
-            image=self.img_play,
+            image=load_icon("play"),
             text="",
             width=20,
             height=20,
@@ -43,7 +102,7 @@ class TrackItem(ctk.CTkFrame):
         )
         self.stop_button = ctk.CTkButton(
             self.button_frame,
-            image=self.img_stop,
+            image=load_icon("stop"),
             text="",
             width=20,
             height=20,
@@ -53,7 +112,7 @@ class TrackItem(ctk.CTkFrame):
         )
         self.delete_button = ctk.CTkButton(
             self.button_frame,
-            image=self.img_delete,
+            image=load_icon("delete"),
             text="",
             width=20,
             height=20,
@@ -72,6 +131,12 @@ class TrackItem(ctk.CTkFrame):
 
         self.bind_events()
 
+    def bind_item(self, item):
+        """Привязывает переиспользуемую строку к данным"""
+        self.item = item
+        self.label.configure(text=item.title)
+        self.update_selection_style()
+
     def bind_events(self):
         for widget in (self, self.label):
             widget.bind("<Enter>", self.on_hover, add="+")
@@ -81,17 +146,15 @@ class TrackItem(ctk.CTkFrame):
     def toggle_selection(self, event):
         ctrl = event.state & 0x0004
         if ctrl:
-            self.selected = not self.selected
+            self.item.selected = not self.item.selected
         else:
-            for widget in self.master.winfo_children():
-                if isinstance(widget, TrackItem):
-                    widget.selected = False
-                    widget.configure(fg_color="transparent")
-            self.selected = True
-        self.update_selection_style()
+            for item in self.view.items:
+                item.selected = False
+            self.item.selected = True
+        self.view.render()
 
     def update_selection_style(self):
-        self.configure(fg_color="#333955" if self.selected else "transparent")
+        self.configure(fg_color="#333955" if self.item.selected else "transparent")
 
     def on_hover(self, event=None):
         self.button_frame.lift()  # показать
@@ -103,40 +166,117 @@ class TrackItem(ctk.CTkFrame):
         self.fade_job = self.after(1000, self.button_frame.lower)
 
     def listen_track(self):
-        if not self.stream_url:
+        self.play_when_ready(self.item)
+
+    def play_when_ready(self, item):
+        future = item.stream_future()
+        if not future.done():
+            # Ссылка ещё получается в фоне — проверяем позже, не блокируя интерфейс
+            self.after(50, self.play_when_ready, item)
+            return
+        stream_url = future.result()
+        if not stream_url:
+            print(f"Не удалось получить поток для трека: {item.title}")
             return
-        if TrackItem.currently_playing and TrackItem.currently_playing is not self:
-            TrackItem.currently_playing.stop_track()
-        if self.ffplay_process and self.ffplay_process.poll() is None:
-            self.ffplay_process.terminate()
+        TrackItem.stop_playback()
 
         try:
             ffplay_path = os.path.abspath("ffmpeg/bin/ffplay.exe")
-            self.ffplay_process = subprocess.Popen([
-                ffplay_path, "-nodisp", "-autoexit", self.stream_url
+            TrackItem.player_process = subprocess.Popen([
+                ffplay_path, "-nodisp", "-autoexit", stream_url
             ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            TrackItem.currently_playing = self
-            print(f"▶ Воспроизведение: {self.title}")
+            TrackItem.playing_item = item
+            print(f"▶ Воспроизведение: {item.title}")
         except FileNotFoundError:
             print("❌ ffplay не найден.")
 
+    @staticmethod
+    def stop_playback():
+        process = TrackItem.player_process
+        if process and process.poll() is None:
+            process.terminate()
+            print(f"■ Остановлено: {TrackItem.playing_item.title}")
+        TrackItem.player_process = None
+        TrackItem.playing_item = None
+
     def stop_track(self):
-        if self.ffplay_process and self.ffplay_process.poll() is None:
-            self.ffplay_process.terminate()
-            print(f"■ Остановлено: {self.title}")
-        if TrackItem.currently_playing is self:
-            TrackItem.currently_playing = None
+        if TrackItem.playing_item is self.item:
+            TrackItem.stop_playback()
 
     def delete_track(self):
         self.stop_track()
-        print(f"✖ Удалено: {self.title}")
-        self.destroy()
+        print(f"✖ Удалено: {self.item.title}")
+        self.view.remove_item(self.item)
+
+
+class QueueRows:
+    """
+    Ленивая последовательность строк очереди загрузки: количество берётся из COUNT,
+    сами строки подгружаются из базы страницами только для видимой части списка.
+    """
+    PAGE_SIZE = 200
+    MAX_PAGES = 16
+
+    def __init__(self, db):
+        self.db = db
+        self._count = db.count_download_queue()
+        self._pages = OrderedDict()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        page_number, position = divmod(index, self.PAGE_SIZE)
+        page = self._pages.get(page_number)
+        if page is None:
+            page = self.db.get_download_queue(limit=self.PAGE_SIZE, offset=page_number * self.PAGE_SIZE)
+            self._pages[page_number] = page
+            if len(self._pages) > self.MAX_PAGES:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(page_number)
+        if position >= len(page):
+            # Очередь изменилась после подсчёта строк
+            raise IndexError(index)
+        return page[position]
+
 
 class MusicLoaderApp:
-    def __init__(self, root, search_tracks, get_stream_url):
+    SOURCE_ALL = "Все источники"
+    SOURCE_LIBRARY = "Библиотека (оффлайн)"
+    METADATA_FIELDS = ("title", "artist", "album", "genre", "release_year", "artwork_url", "source")
+
+    def __init__(self, root, providers, get_stream_url, downloader=None, tagger=None,
+                 metrics_sink=None, profiler=None):
         self.root = root
-        self.search_tracks = search_tracks
+        self.tagger = tagger
+        # Последние медленные операции для окна метрик и профилировщик (может быть уже запущен)
+        self.metrics_sink = metrics_sink
+        self.profiler = profiler
+        self.metrics_window = None
+        # Поиск идёт параллельно по всем источникам, результаты показываются по мере ответов
+        self.federated = FederatedSearch(providers)
+        self.search_run = None
+        self.search_merged = None
+        self.search_results = {}  # Ключ трека из MergedResults -> SearchResult
+        self.search_ranks = {}  # Источник -> сколько его треков уже получено (для ранга следующих страниц)
+        # Следующие страницы подгружаются при прокрутке из источника, который их поддерживает
+        self.search_pager = None
+        self.search_pager_provider = None
+        self.search_page_loading = False
         self.get_stream_url = get_stream_url
+        self.downloader = downloader
+        # Один менеджер на всё приложение: подключения выдаются пулом по потокам
+        self.db = downloader.db_manager if downloader else DatabaseManager()
+        # Общий с загрузчиком резолвер: ссылки, полученные для прослушивания, пригодятся при скачивании
+        self.stream_resolver = downloader.stream_resolver if downloader else StreamUrlResolver(get_stream_url)
+        # Живое состояние скачиваемых треков по событиям загрузчика: id строки -> статус и прогресс
+        self.live_tracks = {}
+        self.stats_window = None
+        self.recommender = None
+        self.smart_playlists = SmartPlaylists(self.db.db_name)
         self.root.title("DriveBeats: mp3 (pankov.it)")
         self.root.geometry("1100x700")
 
@@ -145,14 +285,23 @@ class MusicLoaderApp:
         self.create_menu()
         self.build_layout()
         self.refresh_queue()
+        self.root.after(GUI_EVENT_POLL_MS, self.poll_download_events)
 
     def create_menu(self):
         menubar = Menu(self.root)
 
         file_menu = Menu(menubar, tearoff=0)
+        file_menu.add_command(label="Статистика библиотеки", command=self.show_stats)
+        file_menu.add_command(label="Метрики производительности", command=self.show_metrics)
+        file_menu.add_command(label="Обновить теги библиотеки", command=self.retag_library)
+        file_menu.add_separator()
         file_menu.add_command(label="Выход", command=self.root.quit)
         menubar.add_cascade(label="Файл", menu=file_menu)
 
+        # Список плейлистов строится при каждом открытии меню
+        self.playlists_menu = Menu(menubar, tearoff=0, postcommand=self.fill_playlists_menu)
+        menubar.add_cascade(label="Плейлисты", menu=self.playlists_menu)
+
         settings_menu = Menu(menubar, tearoff=0)
         settings_menu.add_command(label="Настройки")
         menubar.add_cascade(label="Настройки", menu=settings_menu)
@@ -163,6 +312,71 @@ class MusicLoaderApp:
 
         self.root.config(menu=menubar)
 
+    def show_stats(self):
+        """Окно статистики: одно на приложение, повторный вызов поднимает уже открытое"""
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.refresh()
+            self.stats_window.load_recommendations()
+            self.stats_window.focus()
+            return
+        if self.recommender is None:
+            # Матрицы рекомендаций загружаются один раз и дальше обновляются по журналу изменений
+            self.recommender = Recommender(self.db.db_name)
+        self.stats_window = StatsWindow(
+            self.root, LibraryAnalyzer(self.db.db_name), self.recommender, on_query=self.search_for
+        )
+
+    def show_metrics(self):
+        """Окно метрик производительности: одно на приложение"""
+        if self.metrics_window is not None and self.metrics_window.winfo_exists():
+            self.metrics_window.focus()
+            return
+        self.metrics_window = MetricsWindow(self.root, sink=self.metrics_sink, profiler=self.profiler)
+        # Профилировщик, запущенный из окна, переживает его закрытие
+        self.profiler = self.metrics_window.profiler
+
+    def search_for(self, query):
+        """Онлайн-поиск по запросу из рекомендаций"""
+        self.query_entry.delete(0, "end")
+        self.query_entry.insert(0, query)
+        self.search_source.set(self.SOURCE_ALL)
+        self.perform_search()
+
+    def fill_playlists_menu(self):
+        self.playlists_menu.delete(0, "end")
+        playlists = self.smart_playlists.list_playlists()
+        if not playlists:
+            self.playlists_menu.add_command(label="Нет плейлистов", state="disabled")
+        for playlist in playlists:
+            self.playlists_menu.add_command(
+                label=f"Экспорт «{playlist['name']}»...",
+                command=lambda playlist=playlist: self.export_playlist(playlist)
+            )
+
+    def export_playlist(self, playlist):
+        """Сохраняет умный плейлист в файл M3U8 или M3U"""
+        path = filedialog.asksaveasfilename(
+            defaultextension=".m3u8",
+            initialfile=f"{playlist['name']}.m3u8",
+            filetypes=[("Плейлист M3U8 (UTF-8)", "*.m3u8"), ("Плейлист M3U", "*.m3u")]
+        )
+        if not path:
+            return
+        try:
+            count = self.smart_playlists.export(playlist["id"], path)
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить плейлист: {e}")
+            return
+        self.status_label.configure(text=f"Плейлист «{playlist['name']}» сохранён: {count} треков")
+
+    def retag_library(self):
+        """Перезаписывает ID3-теги всех скачанных треков в фоне"""
+        if self.tagger is None:
+            self.status_label.configure(text="Запись тегов недоступна")
+            return
+        count = self.tagger.retag_library()
+        self.status_label.configure(text=f"Обновление тегов запущено для {count} треков")
+
     def build_layout(self):
         main_frame = ctk.CTkFrame(self.root)
         main_frame.pack(fill="both", expand=True, padx=10, pady=10)
@@ -176,6 +390,12 @@ class MusicLoaderApp:
 
         ctk.CTkButton(top_panel, text="Найти", command=self.perform_search).pack(side="left", padx=5)
 
+        # Источник поиска: SoundCloud или оффлайн-поиск по скачанной библиотеке
+        source_names = [self.SOURCE_ALL] + [provider.label for provider in self.federated.providers]
+        self.search_source = ctk.CTkOptionMenu(top_panel, values=source_names + [self.SOURCE_LIBRARY])
+        self.search_source.set(self.SOURCE_ALL)
+        self.search_source.pack(side="left", padx=5)
+
         path_panel = ctk.CTkFrame(main_frame)
         path_panel.pack(fill="x", pady=5)
 
@@ -190,15 +410,18 @@ class MusicLoaderApp:
         left_frame.pack(side="left", fill="both", expand=True)
         ctk.CTkLabel(left_frame, text="Результаты поиска:").pack(anchor="w")
 
-        self.search_container = ctk.CTkScrollableFrame(left_frame)
-        self.search_container.pack(fill="both", expand=True, padx=5)
+        # Виртуализированный список: виджеты есть только у видимых строк
+        self.search_list = VirtualList(
+            left_frame, row_factory=TrackItem, on_scroll_end=self.load_next_search_page
+        )
+        self.search_list.pack(fill="both", expand=True, padx=5)
 
         center_controls = ctk.CTkFrame(middle_frame, width=80)
         center_controls.pack(side="left", fill="y")
         center_controls.pack_propagate(False)
 
-        self.img_right = ctk.CTkImage(light_image=Image.open("pic/right-48.png"), size=(24, 24))
-        self.img_d_right = ctk.CTkImage(light_image=Image.open("pic/double_right-48.png"), size=(24, 24))
+        self.img_right = load_icon("right", 24)
+        self.img_d_right = load_icon("double_right", 24)
 
         ctk.CTkLabel(center_controls, text="").pack(expand=True)
         ctk.CTkButton(
@@ -236,17 +459,64 @@ class MusicLoaderApp:
             command=self.refresh_queue
         ).pack(side="left", padx=2)
 
-        ctk.CTkButton(queue_control, text="Стоп").pack(side="left", padx=2)
-        ctk.CTkOptionMenu(queue_control, values=["1 поток", "2 потока", "4 потока"]).pack(side="left", padx=2)
+        ctk.CTkButton(
+            queue_control,
+            text="Стоп",
+            command=self.stop_download_queue
+        ).pack(side="left", padx=2)
+
+        worker_labels = [self.worker_count_label(count) for count in DOWNLOAD_WORKER_CHOICES]
+        self.workers_menu = ctk.CTkOptionMenu(
+            queue_control,
+            values=worker_labels,
+            command=self.change_worker_count
+        )
+        current_workers = self.downloader.worker_count if self.downloader else DOWNLOAD_WORKERS
+        self.workers_menu.set(self.worker_count_label(current_workers))
+        self.workers_menu.pack(side="left", padx=2)
         ctk.CTkButton(
             queue_control,
             text="Очистить очередь",
             command=self.clear_queue
         ).pack(side="left", padx=2)
 
-        ctk.CTkLabel(right_frame, text="Очередь загрузки:").pack(anchor="w")
-        self.queue_container = ctk.CTkScrollableFrame(right_frame)
-        self.queue_container.pack(fill="both", expand=True, padx=5)
+        # Лимиты планировщика: соединений на хост и общая скорость (меняются на ходу)
+        queue_limits = ctk.CTkFrame(right_frame, fg_color="transparent")
+        queue_limits.pack(fill="x", padx=5, pady=(0, 10))
+        ctk.CTkLabel(queue_limits, text="На хост:").pack(side="left", padx=2)
+        self.per_host_menu = ctk.CTkOptionMenu(
+            queue_limits,
+            values=[str(limit) for limit in DOWNLOAD_PER_HOST_CHOICES],
+            command=self.change_per_host_limit,
+            width=60
+        )
+        scheduler = self.downloader.scheduler if self.downloader else None
+        self.per_host_menu.set(str(scheduler.per_host_limit if scheduler else DOWNLOAD_PER_HOST_LIMIT))
+        self.per_host_menu.pack(side="left", padx=2)
+
+        ctk.CTkLabel(queue_limits, text="Скорость:").pack(side="left", padx=(10, 2))
+        self.bandwidth_menu = ctk.CTkOptionMenu(
+            queue_limits,
+            values=[self.bandwidth_label(limit) for limit in DOWNLOAD_BANDWIDTH_CHOICES],
+            command=self.change_bandwidth_limit
+        )
+        self.bandwidth_menu.set(self.bandwidth_label(
+            scheduler.bandwidth_limit if scheduler else DOWNLOAD_BANDWIDTH_LIMIT
+        ))
+        self.bandwidth_menu.pack(side="left", padx=2)
+
+        queue_header = ctk.CTkFrame(right_frame, fg_color="transparent")
+        queue_header.pack(fill="x")
+        ctk.CTkLabel(queue_header, text="Очередь загрузки:").pack(side="left")
+        # Суммарная скорость всех потоков скачивания
+        self.speed_label = ctk.CTkLabel(queue_header, text="")
+        self.speed_label.pack(side="right", padx=5)
+        self.queue_list = VirtualList(
+            right_frame,
+            row_factory=lambda parent, view, height: QueueItem(parent, view, height, app=self),
+            empty_text="Очередь загрузки пуста"
+        )
+        self.queue_list.pack(fill="both", expand=True, padx=5)
 
         self.status_label = ctk.CTkLabel(main_frame, text="")
         self.status_label.pack(pady=5)
@@ -258,97 +528,202 @@ class MusicLoaderApp:
 
     def perform_search(self):
         query = self.query_entry.get()
-        print(f"Поиск по SoundCloud: {query}")
-        for widget in self.search_container.winfo_children():
-            widget.destroy()
-
-        results = self.search_tracks(query)
-        if not results:
-            item = TrackItem(self.search_container, "Нет результатов")
-            item.pack(fill="x", pady=2, padx=5)
+        TrackItem.stop_playback()
+        self.search_list.set_empty_text("Нет результатов")
+        if self.search_pager is not None:
+            self.search_pager.close()
+            self.search_pager = None
+        if self.search_run is not None:
+            self.search_run.cancel()
+            self.search_run = None
+
+        source = self.search_source.get()
+        if source == self.SOURCE_LIBRARY:
+            self.search_library(query)
             return
 
-        for track in results:
-            user = track.get("user", {}).get("username", "?")
-            title = track.get("title", "Без названия")
-            full_title = f"{user} — {title}"
-            track_id = str(track.get("id", ""))
+        providers = [
+            provider for provider in self.federated.providers
+            if source == self.SOURCE_ALL or provider.label == source
+        ]
+        print(f"Поиск ({source}): {query}")
+
+        self.search_merged = MergedResults(self.federated.providers)
+        self.search_results = {}
+        self.search_ranks = {}
+        self.search_page_loading = False
+        self.search_list.set_empty_text("Поиск...")
+        self.search_list.set_items([])
+        self.search_list.scroll_to(0)
+        self.search_run = self.federated.search(query, providers)
+        self.poll_search(self.search_run)
+
+    def poll_search(self, run):
+        """Показывает ответы источников по мере их прихода, не блокируя окно"""
+        if run is not self.search_run:
+            # За это время начат новый поиск
+            return
+        for page in run.collect():
+            self.merge_search_page(page)
+            if page.more is not None and self.search_pager is None:
+                self.search_pager = page.more
+                self.search_pager_provider = page.provider
+        if not run.finished:
+            self.root.after(50, lambda: self.poll_search(run))
+            return
 
-            # Инициализация stream_url для каждого трека
-            stream_url = None
+        skipped = run.timed_out + run.failed
+        if skipped:
+            self.status_label.configure(text=f"Источники без ответа: {', '.join(skipped)}")
+        if self.search_pager is None:
+            self.search_list.set_empty_text("Нет результатов")
+        if not self.search_list.items:
+            # Пустой список не вызывает on_scroll_end
+            self.load_next_search_page()
+        else:
+            # Постраничный источник мог ответить, когда конец списка уже был показан
+            self.search_list.render()
+
+    def merge_search_page(self, page):
+        """Сливает страницу источника с уже показанными результатами и пересортировывает список"""
+        rank_offset = self.search_ranks.get(page.provider.name, 0)
+        self.search_ranks[page.provider.name] = rank_offset + len(page.hits)
+
+        pending_streams = []
+        for key in self.search_merged.add(page, rank_offset):
+            hit = self.search_merged.entries[key]["hit"]
+            item = self.make_search_result(hit)
+            previous = self.search_results.get(key)
+            if previous is not None:
+                item.selected = previous.selected
+            self.search_results[key] = item
+            if item.transcoding_url:
+                pending_streams.append((item.track_id, item.transcoding_url))
+
+        # Позиция прокрутки сохраняется: новые ответы не сбивают пользователя
+        self.search_list.set_items([self.search_results[key] for key in self.search_merged.ranked()])
+        # Ссылки получаем в фоне ограниченным пулом, к моменту прослушивания они уже в кэше
+        self.stream_resolver.prefetch(pending_streams)
+
+    def make_search_result(self, hit):
+        full_title = f"{hit['artist']} — {hit['title']}"
+        if self.search_source.get() == self.SOURCE_ALL:
+            provider = self.federated.provider(hit["source"])
+            label = provider.label if provider else hit["source"]
+            full_title += f" [{label}]" if hit["downloadable"] else f" [{label}, превью]"
+        metadata = {field: hit.get(field) for field in self.METADATA_FIELDS}
+        if hit.get("transcoding_url"):
+            # Ссылка на стрим будет получена лениво — строка отображается сразу
+            return SearchResult(
+                full_title,
+                track_id=hit["track_id"],
+                transcoding_url=hit["transcoding_url"],
+                resolver=self.stream_resolver,
+                metadata=metadata,
+                downloadable=hit["downloadable"]
+            )
+        return SearchResult(
+            full_title,
+            stream_url=hit.get("stream_url"),
+            track_id=hit["track_id"],
+            metadata=metadata,
+            downloadable=hit["downloadable"]
+        )
 
-            for transcoding in track.get("media", {}).get("transcodings", []):
-                if "progressive" in transcoding.get("format", {}).get("protocol", ""):
-                    try:
-                        stream_url = self.get_stream_url(transcoding.get("url"))
-                        break
-                    except Exception as e:
-                        print(f"Ошибка получения ссылки на стрим: {e}")
-                        continue
+    def load_next_search_page(self):
+        pager = self.search_pager
+        if pager is None or not pager.has_more or self.search_page_loading:
+            return
+        self.search_page_loading = True
+        self.append_search_page(pager)
 
-            # Проверим, что stream_url получен
-            if stream_url is None:
-                print(f"Не удалось получить поток для трека: {full_title}")
-                continue
+    def append_search_page(self, pager):
+        """Дописывает следующую страницу источника, когда она загрузится, не блокируя окно"""
+        if pager is not self.search_pager:
+            # За это время начат новый поиск
+            return
+        if not pager.ready:
+            self.root.after(50, lambda: self.append_search_page(pager))
+            return
 
-            # Создаем элемент только если поток успешно получен
-            item = TrackItem(self.search_container, full_title, stream_url=stream_url, track_id=track_id)
-            item.pack(fill="x", pady=2, padx=5)
+        self.search_page_loading = False
+        provider = self.search_pager_provider
+        hits = provider.convert(pager.take())
+        if not pager.has_more:
+            self.search_list.set_empty_text("Нет результатов")
+        # Показанный конец списка сам запросит следующую страницу через on_scroll_end
+        self.merge_search_page(ProviderPage(provider, hits))
+
+        if not self.search_list.items:
+            # Пустой список не вызывает on_scroll_end: вся страница отфильтрована, берём следующую
+            self.load_next_search_page()
+
+    def search_library(self, query):
+        """Оффлайн-поиск по скачанным трекам"""
+        print(f"Поиск по библиотеке: {query}")
+        items = []
+        for track in self.db.search_library(query):
+            full_title = f"{track['artist'] or 'Unknown Artist'} — {track['track_title']}"
+            items.append(SearchResult(
+                full_title,
+                stream_url=track["file_path"],
+                track_id=track["track_id"],
+                is_local=True
+            ))
+        self.search_list.set_items(items)
+        self.search_list.scroll_to(0)
 
     def add_selected(self):
-        db = DatabaseManager()
-        added_count = 0
-        duplicate_count = 0
-        requeued_count = 0
-        error_count = 0
-
-        for widget in self.search_container.winfo_children():
-            if isinstance(widget, TrackItem) and widget.selected and widget.stream_url:
-                # Добавляем в базу данных как новую запись
-                success, status = db.add_track(widget.title, "Unknown Artist", widget.stream_url, widget.track_id)
-
-                if success and status == "added":
-                    added_count += 1
-                elif success and status == "requeued":
-                    requeued_count += 1
-                elif status == "duplicate":
-                    duplicate_count += 1
-                else:
-                    error_count += 1
-
-        status_message = f"Добавлено: {added_count}"
-        if requeued_count > 0:
-            status_message += f", Восстановлено: {requeued_count}"
-        if duplicate_count > 0:
-            status_message += f", Пропущено: {duplicate_count}"
-        if error_count > 0:
-            status_message += f", Ошибок: {error_count}"
-
-        print(status_message)
-        self.status_label.configure(text=status_message)
-        self.refresh_queue()
+        items = [
+            item for item in self.search_list.items
+            if item.selected and item.has_stream and item.downloadable
+        ]
+        self.enqueue_items(items)
 
     def add_all(self):
         print("Добавление всех треков в очередь загрузки")
-        db = DatabaseManager()
+        items = [
+            item for item in self.search_list.items
+            if item.has_stream and item.downloadable
+        ]
+        self.enqueue_items(items)
+
+    def enqueue_items(self, items):
+        """
+        Добавляет треки из результатов поиска в очередь загрузки, не дожидаясь ссылок на стрим:
+        в очередь пишется transcoding URL, свежую ссылку загрузчик получает перед скачиванием
+        """
+        db = self.db
         added_count = 0
         duplicate_count = 0
         requeued_count = 0
         error_count = 0
 
-        for widget in self.search_container.winfo_children():
-            if isinstance(widget, TrackItem) and widget.stream_url:
-                # Добавляем в базу данных как новую запись
-                success, status = db.add_track(widget.title, "Unknown Artist", widget.stream_url, widget.track_id)
-
-                if success and status == "added":
-                    added_count += 1
-                elif success and status == "requeued":
-                    requeued_count += 1
-                elif status == "duplicate":
-                    duplicate_count += 1
-                else:
-                    error_count += 1
+        tracks = []
+        for item in items:
+            stream_url = item.stream_url
+            if item.transcoding_url:
+                # Уже полученная для прослушивания ссылка берётся из кэша без ожидания
+                stream_url = self.stream_resolver.cached(item.track_id)
+            tracks.append(dict(
+                item.metadata,
+                title=item.metadata.get("title", item.title),
+                artist=item.metadata.get("artist", "Unknown Artist"),
+                download_url=stream_url,
+                transcoding_url=item.transcoding_url,
+                track_id=item.track_id,
+            ))
+
+        # Весь пакет добавляется одной транзакцией
+        for success, status in db.add_tracks(tracks):
+            if success and status == "added":
+                added_count += 1
+            elif success and status == "requeued":
+                requeued_count += 1
+            elif status == "duplicate":
+                duplicate_count += 1
+            else:
+                error_count += 1
 
         status_message = f"Добавлено: {added_count}"
         if requeued_count > 0:
@@ -364,37 +739,97 @@ class MusicLoaderApp:
 
     def refresh_queue(self):
         """Обновляет список треков в очереди загрузки"""
-        # Очистка существующих элементов
-        for widget in self.queue_container.winfo_children():
-            widget.destroy()
-
-        # Получение треков из базы данных
-        db = DatabaseManager()
-        tracks = db.get_download_queue()
-
-        if not tracks:
-            no_tracks_label = ctk.CTkLabel(self.queue_container, text="Очередь загрузки пуста")
-            no_tracks_label.pack(pady=10)
-            return
-
-        # Создание элементов для каждого трека
-        for track in tracks:
-            queue_item = QueueItem(
-                self.queue_container,
-                db_id=track["id"],
-                title=track["track_title"],
-                artist=track["artist"] or "Unknown Artist",
-                status=track["status"],
-                file_path=track["file_path"],
-                stream_url=track["url"],
-                download_date=track["download_date"]
+        # Строки читаются из базы лениво, виджеты видимых строк переиспользуются.
+        # Свежий снимок из базы заменяет накопленное живое состояние
+        self.live_tracks = {
+            track_id: state for track_id, state in self.live_tracks.items()
+            if state["status"] == "downloading"
+        }
+        with get_metrics().span("gui.refresh_queue"):
+            self.queue_list.set_items(QueueRows(self.db))
+
+    def poll_download_events(self):
+        """
+        Забирает события загрузчика с фиксированной частотой и обновляет только затронутые строки,
+        без перечитывания очереди из базы.
+        """
+        if self.downloader is not None:
+            with get_metrics().span("gui.poll_events"):
+                self.apply_download_events()
+
+        self.root.after(GUI_EVENT_POLL_MS, self.poll_download_events)
+
+    def apply_download_events(self):
+        """Обновляет живое состояние треков по событиям загрузчика и перерисовывает затронутые строки"""
+        changed = set()
+        for event in self.downloader.events.drain():
+            state = self.live_tracks.setdefault(
+                event.track_id, {"status": None, "downloaded": 0, "total": None, "speed": 0.0}
             )
-            queue_item.pack(fill="x", pady=2, padx=5)
+            if event.kind in (STARTED, PROGRESS):
+                state.update(status="downloading", downloaded=event.downloaded, total=event.total,
+                             speed=event.speed)
+            elif event.kind == FINISHED:
+                state.update(status="complete", downloaded=event.downloaded, total=event.total,
+                             speed=0.0, file_path=event.file_path)
+            elif event.kind == FAILED:
+                state.update(status="error", speed=0.0)
+            elif event.kind == PAUSED:
+                # PAUSED с ошибкой — трек отложен на автоматический повтор
+                state.update(status="pending", speed=0.0, retrying=bool(event.error))
+            changed.add(event.track_id)
+
+        if changed:
+            self.queue_list.refresh_visible(lambda track: track["id"] in changed)
+            self.update_speed_label()
+
+    def update_speed_label(self):
+        active = [state for state in self.live_tracks.values() if state["status"] == "downloading"]
+        if not active:
+            self.speed_label.configure(text="")
+            return
+        speed = sum(state["speed"] for state in active)
+        self.speed_label.configure(text=f"Активных: {len(active)} · {format_size(speed)}/с")
+
+    @staticmethod
+    def worker_count_label(count):
+        """Подпись для переключателя потоков: 1 поток, 2 потока, 5 потоков"""
+        if count % 10 == 1 and count % 100 != 11:
+            return f"{count} поток"
+        if count % 10 in (2, 3, 4) and count % 100 not in (12, 13, 14):
+            return f"{count} потока"
+        return f"{count} потоков"
+
+    def change_worker_count(self, value):
+        """Меняет количество потоков скачивания, в том числе во время работы очереди"""
+        count = int(value.split()[0])
+        if self.downloader:
+            self.downloader.set_worker_count(count)
+        self.status_label.configure(text=f"Потоков скачивания: {count}")
+
+    @staticmethod
+    def bandwidth_label(limit):
+        """Подпись для переключателя скорости: Без ограничения, 256 КБ/с, 1.0 МБ/с"""
+        return f"{format_size(limit)}/с" if limit else "Без ограничения"
+
+    def change_per_host_limit(self, value):
+        """Меняет количество одновременных соединений к одному хосту"""
+        if self.downloader:
+            self.downloader.scheduler.set_per_host_limit(int(value))
+        self.status_label.configure(text=f"Соединений к одному хосту: {value}")
+
+    def change_bandwidth_limit(self, value):
+        """Меняет общий предел скорости загрузок, в том числе во время работы очереди"""
+        limit = next(
+            (choice for choice in DOWNLOAD_BANDWIDTH_CHOICES if self.bandwidth_label(choice) == value), 0
+        )
+        if self.downloader:
+            self.downloader.scheduler.set_bandwidth_limit(limit)
+        self.status_label.configure(text=f"Скорость загрузок: {value}")
 
     def start_download_queue(self):
         """Запускает процесс загрузки треков из очереди"""
         from download.downloader import TrackDownloader
-        import threading
 
         # Получаем путь сохранения из интерфейса
         download_dir = self.save_path.get()
@@ -402,124 +837,123 @@ class MusicLoaderApp:
             self.status_label.configure(text="Ошибка: укажите папку для сохранения")
             return
 
-        # Создаем загрузчик и запускаем в отдельном потоке
-        db = DatabaseManager()
-        downloader = TrackDownloader(db, download_dir=download_dir)
+        workers = int(self.workers_menu.get().split()[0])
+        if self.downloader is None:
+            self.downloader = TrackDownloader(self.db, download_dir=download_dir, workers=workers)
+            self.downloader.stream_resolver = self.stream_resolver
+            if self.tagger is not None:
+                self.downloader.add_completion_listener(self.tagger.on_download_finished)
+            self.change_per_host_limit(self.per_host_menu.get())
+            self.change_bandwidth_limit(self.bandwidth_menu.get())
+        else:
+            os.makedirs(download_dir, exist_ok=True)
+            self.downloader.download_dir = download_dir
+            self.downloader.set_worker_count(workers)
 
-        # Запускаем загрузку в отдельном потоке
-        download_thread = threading.Thread(target=downloader.process_downloads)
-        download_thread.daemon = True  # Поток завершится при закрытии приложения
-        download_thread.start()
+        # Пул потоков работает в фоне и завершится при закрытии приложения
+        self.downloader.start()
 
         self.status_label.configure(text="Загрузка треков запущена")
 
-        # Обновляем очередь через 2 секунды, чтобы показать прогресс
-        self.root.after(2000, self.refresh_queue)
+    def stop_download_queue(self):
+        """
+        Останавливает загрузку сразу: текущие треки прерываются посреди файла и возвращаются в очередь,
+        недокачанные .part файлы продолжатся с того же места при следующем запуске
+        """
+        if self.downloader:
+            self.downloader.stop()
+        self.status_label.configure(text="Загрузка остановлена")
+        self.refresh_queue()
 
     def clear_queue(self):
         """Очищает очередь загрузки"""
         if messagebox.askyesno("Очистить очередь", "Удалить все треки из очереди загрузки?"):
-            db = DatabaseManager()
-            db.connection.execute("DELETE FROM downloaded_tracks WHERE status != 'complete'")
-            db.connection.commit()
+            self.db.clear_queue()
             print("Очередь загрузки очищена")
             self.status_label.configure(text="Очередь загрузки очищена")
             self.refresh_queue()
 
 class QueueItem(ctk.CTkFrame):
-    def __init__(self, master, db_id, title, artist, status, file_path, stream_url=None, download_date=None):
-        super().__init__(master)
-        self.db_id = db_id
-        self.title = title
-        self.artist = artist
-        self.status = status
-        self.file_path = file_path
-        self.stream_url = stream_url
-        self.download_date = download_date
-        self.configure(height=40)
-
-        # Создаем цветовую схему для различных статусов
-        status_colors = {
-            "pending": ("#FFD700", "#333333"),  # Золотой фон, темный текст
-            "downloading": ("#4CAF50", "#FFFFFF"),  # Зеленый фон, белый текст
-            "complete": ("#333333", "#FFFFFF"),  # Темный фон, белый текст
-            "error": ("#F44336", "#FFFFFF")  # Красный фон, белый текст
-        }
-
-        # Применяем цвет в зависимости от статуса
-        bg_color, text_color = status_colors.get(status, ("#333333", "#FFFFFF"))
+    # Цветовая схема для различных статусов
+    STATUS_COLORS = {
+        "pending": ("#FFD700", "#333333"),  # Золотой фон, темный текст
+        "downloading": ("#4CAF50", "#FFFFFF"),  # Зеленый фон, белый текст
+        "complete": ("#333333", "#FFFFFF"),  # Темный фон, белый текст
+        "error": ("#F44336", "#FFFFFF")  # Красный фон, белый текст
+    }
+
+    STATUS_DISPLAY = {
+        "pending": "⌛ Ожидание",
+        "downloading": "⬇️ Загрузка...",
+        "complete": "✅ Завершено",
+        "error": "❌ Ошибка"
+    }
+
+    def __init__(self, master, view, height=40, app=None):
+        super().__init__(master, height=height)
+        self.pack_propagate(False)
+        self.view = view
+        self.app = app
+        self.db = app.db
+        self.item = None
+        self.db_id = None
+        self.title = ""
+        self.status = None
+        self.file_path = None
 
         # Рамка для названия трека
         self.info_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.info_frame.pack(fill="both", expand=True, side="left")
 
         # Название трека
-        self.label = ctk.CTkLabel(
-            self.info_frame,
-            text=title,
-            anchor="w",
-            text_color=text_color
-        )
+        self.label = ctk.CTkLabel(self.info_frame, text="", anchor="w")
         self.label.pack(fill="x", expand=True, padx=5)
 
         # Статус
-        status_display = {
-            "pending": "⌛ Ожидание",
-            "downloading": "⬇️ Загрузка...",
-            "complete": "✅ Завершено",
-            "error": "❌ Ошибка"
-        }
-
-        self.status_label = ctk.CTkLabel(
-            self,
-            text=status_display.get(status, status),
-            width=100,
-            anchor="e",
-            text_color=text_color
-        )
+        self.status_label = ctk.CTkLabel(self, text="", width=100, anchor="e")
         self.status_label.pack(side="right", padx=5)
 
         # Кнопки действий
         self.button_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.button_frame.pack(side="right", padx=5)
 
-        # Значки для кнопок
-        self.img_play = ctk.CTkImage(light_image=Image.open("pic/play-48.png"), size=(20, 20))
-        self.img_retry = ctk.CTkImage(light_image=Image.open("pic/retry-48.png"), size=(20, 20))
-        self.img_delete = ctk.CTkImage(light_image=Image.open("pic/delete-48.png"), size=(20, 20))
+        # Прогресс скачивания — показывается только у загружаемых треков
+        self.progress_bar = ctk.CTkProgressBar(self, width=120)
+        self.progress_bar.set(0)
 
-        # При ошибке показываем кнопку повтора
-        if status == "error":
-            self.retry_button = ctk.CTkButton(
-                self.button_frame,
-                image=self.img_retry,
-                text="",
-                width=20,
-                height=20,
-                fg_color="transparent",
-                hover_color="#365D1D",
-                command=self.retry_download
-            )
-            self.retry_button.pack(side="left", padx=2)
-
-        # Если файл уже скачан, показываем кнопку воспроизведения
-        if status == "complete" and file_path and os.path.exists(file_path):
-            self.play_button = ctk.CTkButton(
-                self.button_frame,
-                image=self.img_play,
-                text="",
-                width=20,
-                height=20,
-                fg_color="transparent",
-                hover_color="#365D1D",
-                command=self.play_local_file
-            )
-            self.play_button.pack(side="left", padx=2)
-
-        # Кнопка удаления для всех статусов
+        self.next_button = ctk.CTkButton(
+            self.button_frame,
+            image=load_icon("arrow"),
+            text="",
+            width=20,
+            height=20,
+            fg_color="transparent",
+            hover_color="#365D1D",
+            command=self.download_next
+        )
+        self.retry_button = ctk.CTkButton(
+            self.button_frame,
+            image=load_icon("retry"),
+            text="",
+            width=20,
+            height=20,
+            fg_color="transparent",
+            hover_color="#365D1D",
+            command=self.retry_download
+        )
+        self.play_button = ctk.CTkButton(
+            self.button_frame,
+            image=load_icon("play"),
+            text="",
+            width=20,
+            height=20,
+            fg_color="transparent",
+            hover_color="#365D1D",
+            command=self.play_local_file
+        )
         self.delete_button = ctk.CTkButton(
             self.button_frame,
-            image=self.img_delete,
+            image=load_icon("delete"),
             text="",
             width=20,
             height=20,
@@ -527,19 +961,76 @@ class QueueItem(ctk.CTkFrame):
             hover_color="#E38445",
             command=self.delete_from_queue
         )
+
+    def bind_item(self, track):
+        """Привязывает переиспользуемую строку к треку из очереди"""
+        self.item = track
+        self.db_id = track["id"]
+        self.title = track["track_title"]
+        self.status = track["status"]
+        self.file_path = track["file_path"]
+
+        # Живое состояние из событий загрузчика новее снимка из базы
+        live = self.app.live_tracks.get(self.db_id)
+        if live is not None:
+            self.status = live["status"]
+            self.file_path = live.get("file_path") or self.file_path
+
+        # Применяем цвет в зависимости от статуса
+        bg_color, text_color = self.STATUS_COLORS.get(self.status, ("#333333", "#FFFFFF"))
+        status_text = self.STATUS_DISPLAY.get(self.status, self.status)
+        artist = track["artist"]
+        display_title = f"{artist} — {self.title}" if artist and artist != "Unknown Artist" else self.title
+        self.label.configure(text=display_title, text_color=text_color)
+
+        if self.status == "downloading" and live is not None:
+            total = live["total"]
+            if total:
+                self.progress_bar.set(min(1.0, live["downloaded"] / total))
+                status_text = f"⬇️ {live['downloaded'] * 100 // total}%"
+            else:
+                self.progress_bar.set(0)
+                status_text = f"⬇️ {format_size(live['downloaded'])}"
+            self.progress_bar.pack(side="right", padx=5, after=self.button_frame)
+        else:
+            self.progress_bar.pack_forget()
+            if self.status == "pending" and track["priority"] > 0:
+                status_text = "⏫ Следующий"
+            elif self.status == "pending" and (track["retry_count"] or (live and live.get("retrying"))):
+                status_text = "🔁 Повтор"
+        self.status_label.configure(text=status_text, text_color=text_color)
+
+        for button in (self.next_button, self.retry_button, self.play_button, self.delete_button):
+            button.pack_forget()
+
+        # Ожидающий трек можно поставить первым в очереди
+        if self.status == "pending":
+            self.next_button.pack(side="left", padx=2)
+
+        # При ошибке показываем кнопку повтора
+        if self.status == "error":
+            self.retry_button.pack(side="left", padx=2)
+
+        # Если файл уже скачан, показываем кнопку воспроизведения.
+        # Наличие файла отслеживает фоновый сканер библиотеки — диск здесь не трогаем
+        file_present = track["file_present"] or (live is not None and live.get("file_path"))
+        if self.status == "complete" and self.file_path and file_present:
+            self.play_button.pack(side="left", padx=2)
+
+        # Кнопка удаления для всех статусов
         self.delete_button.pack(side="left", padx=2)
 
+    def download_next(self):
+        """Ставит трек первым в очереди загрузки"""
+        self.db.prioritize_track(self.db_id)
+        print(f"Трек '{self.title}' будет скачан следующим")
+        self.app.refresh_queue()
+
     def retry_download(self):
         """Повторная попытка загрузки трека с ошибкой"""
-        db = DatabaseManager()
-        db.connection.execute(
-            "UPDATE downloaded_tracks SET status = 'pending' WHERE id = ?",
-            (self.db_id,)
-        )
-        db.connection.commit()
+        self.db.retry_track(self.db_id)
         print(f"Трек '{self.title}' возвращен в очередь загрузки")
-        # Уведомляем родительское окно о необходимости обновить список
-        self.master.master.master.master.refresh_queue()  # Обращение к главному окну через предков
+        self.app.refresh_queue()
 
     def play_local_file(self):
         """Воспроизведение локального файла"""
@@ -557,18 +1048,19 @@ class QueueItem(ctk.CTkFrame):
 
     def delete_from_queue(self):
         """Удаление трека из очереди загрузки"""
-        if messagebox.askyesno("Удаление трека", f"Удалить трек '{self.title}' из очереди загрузки?"):
-            db = DatabaseManager()
-            db.connection.execute("DELETE FROM downloaded_tracks WHERE id = ?", (self.db_id,))
-            db.connection.commit()
-            print(f"✖ Удалено из очереди: {self.title}")
-            self.destroy()
-            # Если файл существует и был скачан, спрашиваем о его удалении
-            if self.status == "complete" and self.file_path and os.path.exists(self.file_path):
+        title, status, file_path = self.title, self.status, self.file_path
+        if messagebox.askyesno("Удаление трека", f"Удалить трек '{title}' из очереди загрузки?"):
+            self.db.delete_track(self.db_id)
+            print(f"✖ Удалено из очереди: {title}")
+            self.app.refresh_queue()
+            # Если файл существует и был скачан, спрашиваем о его удалении.
+            # Файл может быть общим с дубликатами этого трека — тогда его не трогаем
+            if (status == "complete" and file_path and os.path.exists(file_path)
+                    and not self.db.count_tracks_with_file(file_path)):
                 if messagebox.askyesno("Удаление файла", "Также удалить файл с диска?"):
                     try:
-                        os.remove(self.file_path)
-                        print(f"Файл удален: {self.file_path}")
+                        os.remove(file_path)
+                        print(f"Файл удален: {file_path}")
                     except Exception as e:
                         print(f"Ошибка удаления файла: {e}")
 
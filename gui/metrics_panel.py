@@ -0,0 +1,85 @@
+import time
+
+import customtkinter as ctk
+
+from monitoring.metrics import get_metrics
+from monitoring.profiler import SamplingProfiler
+
+
+class MetricsWindow(ctk.CTkToplevel):
+    """
+    Окно метрик производительности: задержки операций и скорость скачивания (p50/p95/max), счётчики
+    и последние медленные операции. Обновляется раз в секунду, пока открыто.
+    Кнопка профилировщика включает сбор стеков и по остановке сохраняет результат в файл.
+    """
+
+    REFRESH_MS = 1000
+    SPAN_LIMIT = 30
+
+    def __init__(self, master, metrics=None, sink=None, profiler=None):
+        super().__init__(master)
+        self.metrics = metrics or get_metrics()
+        self.sink = sink
+        self.profiler = profiler or SamplingProfiler()
+        self.title("Метрики производительности")
+        self.geometry("900x560")
+
+        top_panel = ctk.CTkFrame(self)
+        top_panel.pack(fill="x", padx=10, pady=10)
+        self.profiler_button = ctk.CTkButton(top_panel, text="", command=self.toggle_profiler)
+        self.profiler_button.pack(side="left", padx=5)
+        self.profiler_label = ctk.CTkLabel(top_panel, text="")
+        self.profiler_label.pack(side="left", padx=10)
+        self.update_profiler_button()
+
+        self.text = ctk.CTkTextbox(self, font=("Courier New", 12), wrap="none")
+        self.text.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+        self.refresh()
+
+    def refresh(self):
+        if not self.winfo_exists():
+            return
+        snapshot = self.metrics.snapshot()
+        lines = [f"Время работы: {snapshot['uptime']:.0f} с", "",
+                 f"{'Операция':<36}{'кол-во':>9}{'p50':>11}{'p95':>11}{'max':>11}  единицы"]
+        for name, summary in snapshot["histograms"].items():
+            if summary["count"]:
+                lines.append(f"{name:<36}{summary['count']:>9}{summary['p50']:>11.1f}"
+                             f"{summary['p95']:>11.1f}{summary['max']:>11.1f}  {summary['unit']}")
+
+        lines += ["", "Счётчики:"]
+        lines += [f"  {name:<40}{value:>12}" for name, value in snapshot["counters"].items()]
+
+        if self.sink is not None:
+            lines += ["", f"Медленные операции и ошибки (последние {self.SPAN_LIMIT}):"]
+            for record in list(self.sink.spans)[-self.SPAN_LIMIT:][::-1]:
+                moment = time.strftime("%H:%M:%S", time.localtime(record["ts"]))
+                details = ", ".join(
+                    f"{key}={value}" for key, value in record.items() if key not in ("name", "duration_ms", "ts")
+                )
+                lines.append(f"  {moment} {record['name']} {record['duration_ms']:.0f} мс {details}")
+
+        # Позиция прокрутки сохраняется, чтобы обновление не сбрасывало просмотр
+        position = self.text.yview()[0]
+        self.text.configure(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.insert("1.0", "\n".join(lines))
+        self.text.configure(state="disabled")
+        self.text.yview_moveto(position)
+        self.after(self.REFRESH_MS, self.refresh)
+
+    def toggle_profiler(self):
+        if self.profiler.running:
+            path = self.profiler.stop()
+            self.profiler_label.configure(text=f"Профиль сохранён: {path}")
+        else:
+            self.profiler.start()
+            self.profiler_label.configure(text="Идёт сбор стеков...")
+        self.update_profiler_button()
+
+    def update_profiler_button(self):
+        running = self.profiler.running
+        self.profiler_button.configure(text="Остановить профилировщик" if running else "Запустить профилировщик")
+        if running and not self.profiler_label.cget("text"):
+            self.profiler_label.configure(text="Идёт сбор стеков...")
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import customtkinter as ctk
+
+from analytics.analyzer import LibraryAnalyzer, window_start
+
+
+class StatsWindow(ctk.CTkToplevel):
+    """
+    Окно статистики библиотеки: топ артистов и жанров, треки по годам выпуска.
+    Данные читаются из сводных таблиц, поэтому окно открывается сразу при любом размере библиотеки.
+    Рекомендации считаются в фоне и появляются, когда готовы; клик по запросу запускает поиск.
+    """
+
+    # Матрицы рекомендаций обновляются в одном фоновом потоке
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recommender")
+
+    # Название периода -> количество последних дней (None — за всё время)
+    PERIODS = {
+        "За всё время": None,
+        "За год": 365,
+        "За 30 дней": 30,
+        "За 7 дней": 7,
+    }
+    TOP_LIMIT = 15
+    QUERY_LIMIT = 12
+    UNKNOWN = "Неизвестно"
+
+    def __init__(self, master, analyzer=None, recommender=None, on_query=None):
+        super().__init__(master)
+        self.analyzer = analyzer or LibraryAnalyzer()
+        self.recommender = recommender
+        self.on_query = on_query
+        self.title("Статистика библиотеки")
+        self.geometry("960x520")
+
+        top_panel = ctk.CTkFrame(self)
+        top_panel.pack(fill="x", padx=10, pady=10)
+        self.period = ctk.CTkOptionMenu(top_panel, values=list(self.PERIODS), command=lambda value: self.refresh())
+        self.period.set("За всё время")
+        self.period.pack(side="left", padx=5)
+        self.total_label = ctk.CTkLabel(top_panel, text="")
+        self.total_label.pack(side="left", padx=10)
+
+        columns = ctk.CTkFrame(self, fg_color="transparent")
+        columns.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        self.columns = {}
+        for key, title in (("artist", "Артисты"), ("genre", "Жанры"), ("year", "Годы выпуска")):
+            frame = ctk.CTkScrollableFrame(columns, label_text=title)
+            frame.pack(side="left", fill="both", expand=True, padx=5)
+            self.columns[key] = frame
+        self.queries_frame = None
+        if self.recommender is not None:
+            self.queries_frame = ctk.CTkScrollableFrame(columns, label_text="Что поискать")
+            self.queries_frame.pack(side="left", fill="both", expand=True, padx=5)
+
+        self.refresh()
+        self.load_recommendations()
+
+    def refresh(self):
+        days = self.PERIODS[self.period.get()]
+        since = window_start(days) if days else None
+
+        self.total_label.configure(text=f"Скачано треков: {self.analyzer.total_tracks(since)}")
+        self.fill_column("artist", self.analyzer.top_artists(self.TOP_LIMIT, since))
+        self.fill_column("genre", self.analyzer.top_genres(self.TOP_LIMIT, since))
+        self.fill_column("year", self.analyzer.by_year(since))
+
+    def fill_column(self, key, rows):
+        frame = self.columns[key]
+        for widget in frame.winfo_children():
+            widget.destroy()
+        if not rows:
+            ctk.CTkLabel(frame, text="Нет данных").pack(anchor="w")
+            return
+        for value, tracks in rows:
+            row = ctk.CTkFrame(frame, fg_color="transparent")
+            row.pack(fill="x")
+            ctk.CTkLabel(row, text=str(value) if value is not None else self.UNKNOWN, anchor="w").pack(
+                side="left", fill="x", expand=True
+            )
+            ctk.CTkLabel(row, text=str(tracks)).pack(side="right")
+
+    def load_recommendations(self):
+        if self.queries_frame is None:
+            return
+        for widget in self.queries_frame.winfo_children():
+            widget.destroy()
+        ctk.CTkLabel(self.queries_frame, text="Подбор...").pack(anchor="w")
+        future = self._executor.submit(self.recommender.recommend_queries, self.QUERY_LIMIT)
+        self.after(100, lambda: self.show_recommendations(future))
+
+    def show_recommendations(self, future):
+        if not self.winfo_exists():
+            return
+        if not future.done():
+            self.after(100, lambda: self.show_recommendations(future))
+            return
+        for widget in self.queries_frame.winfo_children():
+            widget.destroy()
+        try:
+            queries = future.result()
+        except Exception as e:
+            print(f"Ошибка подбора рекомендаций: {e}")
+            queries = []
+        if not queries:
+            ctk.CTkLabel(self.queries_frame, text="Нет данных").pack(anchor="w")
+            return
+        for query in queries:
+            ctk.CTkButton(
+                self.queries_frame, text=query, anchor="w", fg_color="transparent",
+                command=lambda value=query: self.on_query(value) if self.on_query else None
+            ).pack(fill="x", pady=1)
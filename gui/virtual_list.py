@@ -0,0 +1,160 @@
+import math
+import tkinter
+import customtkinter as ctk
+
+
+class VirtualList(ctk.CTkFrame):
+    """
+    Список с виртуализацией строк.
+
+    Виджеты создаются только для видимых строк и переиспользуются при прокрутке:
+    строка получает новые данные через bind_item(item). Поэтому стоимость обновления
+    не зависит от длины списка. Данные — любая последовательность (len и индекс),
+    в том числе ленивая, которая подгружает строки из базы страницами.
+    """
+
+    def __init__(self, master, row_factory, row_height=44, empty_text="", on_scroll_end=None, **kwargs):
+        super().__init__(master, **kwargs)
+        # row_factory(parent, view, height) -> виджет строки с методом bind_item(item)
+        self.row_factory = row_factory
+        # on_scroll_end() вызывается, когда показана последняя строка — для подгрузки данных
+        self.on_scroll_end = on_scroll_end
+        self.row_height = row_height
+        self.items = []
+        self.first = 0  # Индекс первой видимой строки
+        self.rows = []  # Пул виджетов строк
+        self.visible_rows = 0
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.body = ctk.CTkFrame(self, fg_color="transparent")
+        self.body.pack(side="left", fill="both", expand=True)
+        self.body.bind("<Configure>", self._on_resize)
+
+        self.empty_label = ctk.CTkLabel(self.body, text=empty_text)
+        self._bind_wheel(self.body)
+
+    def set_items(self, items):
+        """
+        Заменяет данные списка. Позиция прокрутки сохраняется, насколько это возможно.
+        """
+        self.items = items
+        self._clamp_first()
+        self.render()
+
+    def append_items(self, items):
+        """
+        Дописывает строки в конец списка (подгрузка следующей страницы).
+        """
+        self.items.extend(items)
+        self.render()
+
+    def set_empty_text(self, text):
+        self.empty_label.configure(text=text)
+
+    def refresh_item(self, item):
+        """
+        Перерисовывает строку с этим элементом, если она сейчас видна.
+        """
+        for row in self.rows[:self.visible_rows]:
+            if getattr(row, "item", None) is item:
+                row.bind_item(item)
+
+    def refresh_visible(self, predicate):
+        """
+        Перерисовывает видимые строки, данные которых удовлетворяют predicate(item).
+        """
+        for row in self.rows[:self.visible_rows]:
+            item = getattr(row, "item", None)
+            if item is not None and row.winfo_ismapped() and predicate(item):
+                row.bind_item(item)
+
+    def remove_item(self, item):
+        self.items.remove(item)
+        self._clamp_first()
+        self.render()
+
+    def scroll_to(self, index):
+        self.first = index
+        self._clamp_first()
+        self.render()
+
+    def render(self):
+        """
+        Привязывает видимые строки к данным. Новых виджетов не создаёт, если размер окна не менялся.
+        """
+        total = len(self.items)
+        if not total:
+            for row in self.rows:
+                row.place_forget()
+            self.empty_label.place(relx=0.5, y=10, anchor="n")
+            self.scrollbar.set(0.0, 1.0)
+            return
+        self.empty_label.place_forget()
+
+        for position, row in enumerate(self.rows):
+            index = self.first + position
+            item = None
+            if position < self.visible_rows and index < total:
+                try:
+                    item = self.items[index]
+                except IndexError:
+                    # Ленивые данные могли уменьшиться после подсчёта строк
+                    item = None
+            if item is not None:
+                row.bind_item(item)
+                row.place(x=0, y=position * self.row_height, relwidth=1.0)
+            else:
+                row.place_forget()
+
+        end = min(total, self.first + self.visible_rows)
+        self.scrollbar.set(self.first / total, end / total)
+
+        if end >= total and self.on_scroll_end is not None:
+            self.on_scroll_end()
+
+    def _on_resize(self, event):
+        # event.height в реальных пикселях, row_height — до масштабирования CTk
+        visible_rows = max(1, math.ceil(event.height / self._apply_widget_scaling(self.row_height)))
+        if visible_rows == self.visible_rows:
+            return
+        self.visible_rows = visible_rows
+        while len(self.rows) < visible_rows:
+            row = self.row_factory(self.body, self, self.row_height - 4)
+            self._bind_wheel(row)
+            self.rows.append(row)
+        self._clamp_first()
+        self.render()
+
+    def _clamp_first(self):
+        max_first = max(0, len(self.items) - self.visible_rows)
+        self.first = min(max(0, self.first), max_first)
+
+    def _on_scrollbar(self, action, value, units=None):
+        if action == "moveto":
+            self.first = int(float(value) * len(self.items))
+        elif action == "scroll":
+            step = self.visible_rows if units == "pages" else 1
+            self.first += int(value) * step
+        self._clamp_first()
+        self.render()
+
+    def _on_wheel(self, event):
+        if event.num == 4:
+            delta = -1
+        elif event.num == 5:
+            delta = 1
+        else:
+            delta = -1 if event.delta > 0 else 1
+        self._on_scrollbar("scroll", delta * 3, "units")
+        return "break"
+
+    def _bind_wheel(self, widget):
+        # Колесо мыши должно прокручивать список, над какой бы строкой ни был курсор.
+        # Привязка идёт к самим tk-виджетам: у составных CTk-виджетов bind() перенаправляется
+        # на внутренний canvas, и событие срабатывало бы дважды
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            tkinter.Misc.bind(widget, sequence, self._on_wheel, "+")
+        for child in widget.winfo_children():
+            self._bind_wheel(child)
@@ -1,30 +1,65 @@
 from database.base_init import initialize_database
 import customtkinter as ctk
 from gui.gui import MusicLoaderApp
-from api_clients.soundcloud_client import search_tracks, get_stream_url  # Исправлен импорт
-from threading import Thread
+from api_clients.soundcloud_client import get_stream_url
+from api_clients.federated_search import build_providers
 from database.db_manager import DatabaseManager
+from database.connection import close_all_connections
 from download.downloader import TrackDownloader
+from download.library_scanner import LibraryScanner
+from tagging.id3_editor import TaggingPipeline
+from api_clients.musicbrainz_client import get_musicbrainz_client
+from monitoring.metrics import configure_metrics, get_metrics
+from monitoring.profiler import profiler_from_env
+from config import SHUTDOWN_JOIN_TIMEOUT
 
 
 def main():
+    # Метрики пишутся в журнал с ротацией и файл JSON lines, профилировщик — только по DRIVEBEATS_PROFILE=1
+    metrics_sink = configure_metrics()
+    profiler = profiler_from_env()
+
     # Инициализация базы данных
     initialize_database()
 
     # Запускаем фоновый процесс для скачивания треков
     db = DatabaseManager()
+    # Треки, прерванные прошлым запуском, продолжат скачиваться с места остановки
+    db.requeue_interrupted()
     downloader = TrackDownloader(db)
+    # Теги пишутся в своём пуле потоков по завершении каждой загрузки,
+    # недостающие метаданные дополняются из MusicBrainz
+    tagger = TaggingPipeline(db, metadata=get_musicbrainz_client())
+    downloader.add_completion_listener(tagger.on_download_finished)
 
-    download_thread = Thread(target=downloader.process_downloads, daemon=True)
-    download_thread.start()
+    downloader.start()
     print("Фоновый процесс скачивания треков запущен.")
 
+    # Сверка базы с файлами на диске: флаг file_present вместо проверки файлов в GUI
+    scanner = LibraryScanner(db, directories=[downloader.download_dir])
+    scanner.start()
+
     # Запуск GUI
     root = ctk.CTk()  # Создаём окно
-    app = MusicLoaderApp(root, search_tracks, get_stream_url)
+    app = MusicLoaderApp(root, build_providers(), get_stream_url, downloader=downloader, tagger=tagger,
+                         metrics_sink=metrics_sink, profiler=profiler)
     print("Приложение GUI запущено.")
     root.mainloop()
 
+    # Окно закрыто: останавливаем загрузки и сканер, ждём их потоки и только потом закрываем подключения к базе
+    downloader.stop()
+    scanner.stop()
+    if not downloader.join(SHUTDOWN_JOIN_TIMEOUT):
+        print(f"Потоки скачивания не завершились за {SHUTDOWN_JOIN_TIMEOUT} с")
+    if not scanner.join(SHUTDOWN_JOIN_TIMEOUT):
+        print(f"Сканер библиотеки не завершился за {SHUTDOWN_JOIN_TIMEOUT} с")
+    # Запись тегов: очередь дописывается не дольше SHUTDOWN_JOIN_TIMEOUT, остальное — при следующем обновлении тегов
+    tagger.shutdown(SHUTDOWN_JOIN_TIMEOUT)
+    close_all_connections()
+    if app.profiler is not None and app.profiler.running:
+        app.profiler.stop()
+    get_metrics().shutdown()
+
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,358 @@
+import bisect
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+from config import (
+    METRICS_ENABLED,
+    METRICS_FLUSH_INTERVAL,
+    METRICS_SLOW_SPAN_MS,
+    METRICS_LOG_PATH,
+    METRICS_LOG_MAX_BYTES,
+    METRICS_LOG_BACKUPS,
+    METRICS_JSONL_PATH,
+)
+
+# Границы корзин гистограмм: от 0.05 до ~6.7 млн, каждая следующая вдвое больше —
+# хватает и для задержек в мс (до ~1.8 ч), и для скорости скачивания в КБ/с
+HISTOGRAM_BOUNDS = tuple(0.05 * 2 ** i for i in range(28))
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """
+    Распределение значений по корзинам с удвоением границ: память постоянная,
+    квантили приближённые (верхняя граница корзины), count/sum/min/max — точные.
+    unit — единица измерения значений для вывода в журнал и панель.
+    """
+
+    def __init__(self, bounds=HISTOGRAM_BOUNDS, unit="мс"):
+        self.bounds = bounds
+        self.unit = unit
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, fraction):
+        with self._lock:
+            if not self.count:
+                return None
+            target = fraction * self.count
+            seen = 0
+            for index, bucket in enumerate(self.buckets):
+                seen += bucket
+                if seen >= target:
+                    return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+            return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0, "unit": self.unit}
+        return {
+            "count": self.count,
+            "unit": self.unit,
+            "sum": round(self.total, 3),
+            "min": round(self.min, 3),
+            "max": round(self.max, 3),
+            "p50": round(self.quantile(0.5), 3),
+            "p95": round(self.quantile(0.95), 3),
+        }
+
+
+class Metrics:
+    """
+    Реестр метрик: счётчики, гистограммы и интервалы (span) вокруг операций.
+
+    Каждый span попадает в гистограмму своего имени (длительность в мс) и счётчик ошибок.
+    Гистограммы observe хранят единицу измерения, заданную при первом замере (по умолчанию мс).
+    Медленные (дольше slow_span_ms) и упавшие операции отдаются приёмникам по отдельности,
+    сводка всех метрик — раз в flush_interval секунд. Приёмники подключаются через add_sink.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, slow_span_ms=METRICS_SLOW_SPAN_MS):
+        self.enabled = enabled
+        self.slow_span_ms = slow_span_ms
+        self.started_at = time.time()
+        self._counters = {}
+        self._histograms = {}
+        self._sinks = []
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop_event = threading.Event()
+
+    def counter(self, name):
+        counter = self._counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(name, Counter())
+        return counter
+
+    def histogram(self, name, unit="мс"):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(unit=unit))
+        return histogram
+
+    def inc(self, name, amount=1):
+        if self.enabled:
+            self.counter(name).inc(amount)
+
+    def observe(self, name, value, unit="мс"):
+        if self.enabled:
+            self.histogram(name, unit).observe(value)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Замер операции: with metrics.span("download.track", track_id=1) as span: ...
+        В span (словарь) можно дописывать атрибуты по ходу операции — они попадут в журнал.
+        """
+        if not self.enabled:
+            yield attributes
+            return
+        started = time.perf_counter()
+        try:
+            yield attributes
+        except Exception as e:
+            attributes["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            self.histogram(name).observe(duration_ms)
+            if "error" in attributes:
+                self.counter(f"{name}.errors").inc()
+            if duration_ms >= self.slow_span_ms or "error" in attributes:
+                self._emit_span(dict(attributes, name=name, duration_ms=round(duration_ms, 3), ts=time.time()))
+
+    def timed(self, name):
+        """
+        Декоратор: каждый вызов функции — span с именем name.
+        """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+        return {
+            "ts": time.time(),
+            "uptime": round(time.time() - self.started_at, 1),
+            "counters": {name: counter.value for name, counter in sorted(counters.items())},
+            "histograms": {name: histogram.summary() for name, histogram in sorted(histograms.items())},
+        }
+
+    def add_sink(self, sink):
+        with self._lock:
+            self._sinks.append(sink)
+
+    def remove_sink(self, sink):
+        with self._lock:
+            if sink in self._sinks:
+                self._sinks.remove(sink)
+
+    def flush(self):
+        snapshot = self.snapshot()
+        for sink in self._sinks_copy():
+            try:
+                sink.on_snapshot(snapshot)
+            except Exception as e:
+                print(f"Ошибка записи метрик в {type(sink).__name__}: {e}")
+
+    def start(self, interval=METRICS_FLUSH_INTERVAL):
+        """
+        Запускает фоновый сброс сводки в приёмники.
+        """
+        if self._flusher is not None:
+            return
+        self._stop_event.clear()
+        self._flusher = threading.Thread(target=self._run, args=(interval,), name="metrics", daemon=True)
+        self._flusher.start()
+
+    def shutdown(self):
+        """
+        Последний сброс сводки и закрытие приёмников (при выходе из приложения).
+        """
+        self._stop_event.set()
+        self._flusher = None
+        self.flush()
+        for sink in self._sinks_copy():
+            sink.close()
+
+    def _run(self, interval):
+        while not self._stop_event.wait(interval):
+            self.flush()
+
+    def _emit_span(self, record):
+        for sink in self._sinks_copy():
+            try:
+                sink.on_span(record)
+            except Exception as e:
+                print(f"Ошибка записи метрик в {type(sink).__name__}: {e}")
+
+    def _sinks_copy(self):
+        with self._lock:
+            return list(self._sinks)
+
+
+class Sink:
+    """
+    Приёмник метрик: отдельные медленные операции (on_span) и периодическая сводка (on_snapshot).
+    """
+
+    def on_span(self, record):
+        pass
+
+    def on_snapshot(self, snapshot):
+        pass
+
+    def close(self):
+        pass
+
+
+class LogSink(Sink):
+    """
+    Текстовый журнал с ротацией по размеру: медленные операции и краткая сводка гистограмм.
+    """
+
+    def __init__(self, path=METRICS_LOG_PATH, max_bytes=METRICS_LOG_MAX_BYTES, backups=METRICS_LOG_BACKUPS):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+        )
+        self.handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        self.logger = logging.getLogger(f"drivebeats.metrics.{id(self)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+
+    def on_span(self, record):
+        details = ", ".join(
+            f"{key}={value}" for key, value in record.items() if key not in ("name", "duration_ms", "ts")
+        )
+        level = logging.ERROR if "error" in record else logging.WARNING
+        self.logger.log(level, "%s %.1f мс %s", record["name"], record["duration_ms"], details)
+
+    def on_snapshot(self, snapshot):
+        for name, summary in snapshot["histograms"].items():
+            if summary["count"]:
+                unit = summary["unit"]
+                self.logger.info(
+                    "%s: n=%d p50=%.1f %s p95=%.1f %s max=%.1f %s",
+                    name, summary["count"], summary["p50"], unit, summary["p95"], unit, summary["max"], unit
+                )
+        if snapshot["counters"]:
+            self.logger.info(
+                "Счётчики: %s", ", ".join(f"{name}={value}" for name, value in snapshot["counters"].items())
+            )
+
+    def close(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+
+class JsonLinesSink(Sink):
+    """
+    Файл метрик JSON lines: строка на каждую сводку ({"type": "snapshot"}) и медленную операцию ({"type": "span"}).
+    Удобен для сравнения сессий и разбора скриптами.
+    """
+
+    def __init__(self, path=METRICS_JSONL_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def on_span(self, record):
+        self._write(dict(record, type="span"))
+
+    def on_snapshot(self, snapshot):
+        self._write(dict(snapshot, type="snapshot"))
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class MemorySink(Sink):
+    """
+    Последние медленные операции в памяти — для панели статистики в приложении.
+    """
+
+    def __init__(self, max_spans=200):
+        self.spans = deque(maxlen=max_spans)
+
+    def on_span(self, record):
+        self.spans.append(record)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """
+    Общий реестр метрик приложения.
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+def configure_metrics(log_path=METRICS_LOG_PATH, jsonl_path=METRICS_JSONL_PATH):
+    """
+    Подключает журнал с ротацией, файл JSON lines и приёмник для панели, запускает сброс сводки.
+    Возвращает MemorySink для панели статистики.
+    """
+    metrics = get_metrics()
+    memory = MemorySink()
+    metrics.add_sink(memory)
+    if metrics.enabled:
+        try:
+            metrics.add_sink(LogSink(log_path))
+            metrics.add_sink(JsonLinesSink(jsonl_path))
+        except OSError as e:
+            print(f"Не удалось открыть файлы метрик: {e}")
+        metrics.start()
+    return memory
@@ -0,0 +1,84 @@
+import os
+import sys
+import threading
+from collections import Counter
+
+from config import PROFILER_INTERVAL, PROFILER_OUTPUT_PATH
+
+# Переменная окружения, включающая профилировщик при запуске
+PROFILE_ENV = "DRIVEBEATS_PROFILE"
+
+
+class SamplingProfiler:
+    """
+    Статистический профилировщик: раз в interval секунд снимает стеки всех потоков.
+    Почти не замедляет приложение, поэтому его можно включать в обычной сессии.
+
+    Результат — collapsed stacks («поток;функция;функция количество»), его читают
+    flamegraph.pl, speedscope и подобные инструменты.
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL, output_path=PROFILER_OUTPUT_PATH):
+        self.interval = interval
+        self.output_path = output_path
+        self.samples = Counter()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.samples.clear()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        print(f"Профилировщик запущен (интервал {self.interval * 1000:.0f} мс)")
+
+    def stop(self):
+        """
+        Останавливает сбор и записывает результат. Возвращает путь к файлу или None.
+        """
+        if self._thread is None:
+            return None
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        return self.write()
+
+    def write(self):
+        os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+        with open(self.output_path, "w", encoding="utf-8") as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+        print(f"Профиль сохранён: {self.output_path} ({sum(self.samples.values())} снимков)")
+        return self.output_path
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+
+def profiler_from_env():
+    """
+    Профилировщик, запущенный при DRIVEBEATS_PROFILE=1, или None.
+    """
+    if os.environ.get(PROFILE_ENV) not in ("1", "true", "yes"):
+        return None
+    profiler = SamplingProfiler()
+    profiler.start()
+    return profiler
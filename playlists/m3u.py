@@ -0,0 +1,45 @@
+import locale
+import os
+
+
+def _entry_path(file_path, base_dir):
+    if base_dir is None:
+        return file_path
+    try:
+        return os.path.relpath(file_path, base_dir)
+    except ValueError:
+        # Другой диск в Windows — относительный путь невозможен
+        return file_path
+
+
+def write_m3u(tracks, path, relative=True):
+    """
+    Записывает плейлист в формате M3U (расширенный, с #EXTINF).
+
+    tracks — итерируемые строки с полями track_title, artist, duration, file_path
+    (например, курсор SmartPlaylists.tracks()): строки пишутся в файл по одной,
+    весь список в памяти не собирается. Файл .m3u8 пишется в UTF-8, .m3u — в системной
+    кодировке, которую ожидают старые плееры. Возвращает количество записанных треков.
+    """
+    if path.lower().endswith(".m3u8"):
+        encoding = "utf-8"
+    else:
+        encoding = locale.getpreferredencoding(False)
+    base_dir = os.path.dirname(os.path.abspath(path)) if relative else None
+
+    count = 0
+    temp_path = path + ".part"
+    # errors="replace": символы, которых нет в кодировке .m3u, не должны прерывать экспорт
+    with open(temp_path, "w", encoding=encoding, errors="replace", newline="\n") as file:
+        file.write("#EXTM3U\n")
+        for track in tracks:
+            if not track["file_path"]:
+                continue
+            duration = track["duration"] if track["duration"] else -1
+            title = f"{track['artist'] or 'Unknown Artist'} - {track['track_title']}"
+            file.write(f"#EXTINF:{duration},{title}\n")
+            file.write(_entry_path(track["file_path"], base_dir) + "\n")
+            count += 1
+    os.replace(temp_path, path)
+    print(f"Плейлист сохранён: {path} ({count} треков)")
+    return count
@@ -0,0 +1,256 @@
+import datetime
+import json
+import threading
+
+from config import DB_PATH
+from database.connection import get_connection_manager
+from playlists.m3u import write_m3u
+
+# Поля правила -> колонки downloaded_tracks
+RULE_FIELDS = {
+    "title": "track_title",
+    "artist": "artist",
+    "album": "album",
+    "genre": "genre",
+    "release_year": "release_year",
+    "source": "source",
+    "duration": "duration",
+    "completed_at": "completed_at",
+    "download_date": "download_date",
+}
+
+_COMPARISONS = {"=", "!=", "<", "<=", ">", ">="}
+
+# Операции, результат которых зависит от текущей даты или от всей библиотеки:
+# такие плейлисты дополнительно пересобираются целиком раз в день
+_VOLATILE_OPS = {"last_days", "recent_years", "top_artists"}
+
+# Трек попадает в плейлисты, только если он скачан и файл на месте
+_TRACK_AVAILABLE_SQL = "t.status = 'complete' AND t.file_present = 1"
+
+
+def _compile_condition(condition, params):
+    field = condition.get("field")
+    op = condition.get("op", "=")
+    value = condition.get("value")
+    column = RULE_FIELDS.get(field)
+    if column is None:
+        raise ValueError(f"Неизвестное поле правила: {field}")
+    column = f"t.{column}"
+
+    if op in _COMPARISONS:
+        params.append(value)
+        return f"{column} {op} ?"
+    if op == "contains":
+        escaped = str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{escaped}%")
+        return f"{column} LIKE ? ESCAPE '\\'"
+    if op == "in":
+        values = list(value or [])
+        if not values:
+            return "0"
+        params.extend(values)
+        return f"{column} IN ({', '.join('?' * len(values))})"
+    if op == "last_days":
+        params.append(f"-{int(value)} days")
+        return f"{column} >= datetime('now', 'localtime', ?)"
+    if op == "recent_years":
+        params.append(int(value))
+        return f"{column} >= CAST(strftime('%Y', 'now', 'localtime') AS INTEGER) - ?"
+    if op == "top_artists":
+        if field != "artist":
+            raise ValueError("Операция top_artists применима только к полю artist")
+        # Любимые артисты — лидеры сводной статистики библиотеки
+        params.append(int(value))
+        return (f"{column} IN (SELECT value FROM library_stats WHERE dimension = 'artist' AND value != '' "
+                f"ORDER BY tracks DESC LIMIT ?)")
+    raise ValueError(f"Неизвестная операция правила: {op}")
+
+
+def compile_rule(rule, params=None):
+    """
+    Правило плейлиста (словарь из JSON) -> (условие SQL над псевдонимом t, параметры).
+
+    Правило — условие {"field", "op", "value"} или группа {"all": [...]}, {"any": [...]}, {"not": правило}.
+    Операции: =, !=, <, <=, >, >=, contains, in, last_days (дата за последние N дней),
+    recent_years (год не раньше текущего минус N), top_artists (артист среди N самых частых).
+    """
+    if params is None:
+        params = []
+    if not isinstance(rule, dict):
+        raise ValueError("Правило плейлиста должно быть объектом")
+    if "all" in rule or "any" in rule:
+        joiner = " AND " if "all" in rule else " OR "
+        parts = [compile_rule(item, params)[0] for item in rule.get("all", rule.get("any"))]
+        if not parts:
+            return ("1" if "all" in rule else "0"), params
+        return "(" + joiner.join(parts) + ")", params
+    if "not" in rule:
+        return f"NOT {compile_rule(rule['not'], params)[0]}", params
+    return f"({_compile_condition(rule, params)})", params
+
+
+def is_volatile(rule):
+    """
+    True, если состав плейлиста меняется со временем сам по себе, без изменения треков.
+    """
+    if "all" in rule or "any" in rule:
+        return any(is_volatile(item) for item in rule.get("all", rule.get("any")))
+    if "not" in rule:
+        return is_volatile(rule["not"])
+    return rule.get("op") in _VOLATILE_OPS
+
+
+class SmartPlaylists:
+    """
+    Умные плейлисты: правило отбора хранится в smart_playlists, готовый состав — в smart_playlist_tracks.
+
+    Триггеры базы отмечают в smart_playlist_dirty треки, которые скачались, получили теги,
+    пропали с диска или изменились иначе; удалённые треки убираются из плейлистов сразу.
+    sync() проверяет правила только для отмеченных треков, поэтому обновление стоит
+    пропорционально числу изменений, а не размеру библиотеки. Чтение плейлиста — один
+    проход по индексу (playlist_id, completed_at).
+    """
+
+    def __init__(self, db_name=DB_PATH):
+        self.pool = get_connection_manager(db_name)
+        self._lock = threading.Lock()
+        self._compiled = {}  # (id, правило) -> (SQL, параметры, volatile)
+
+    @property
+    def connection(self):
+        return self.pool.connection()
+
+    def list_playlists(self):
+        return self.connection.execute("SELECT id, name, rule FROM smart_playlists ORDER BY name").fetchall()
+
+    def get_playlist(self, name):
+        return self.connection.execute(
+            "SELECT id, name, rule FROM smart_playlists WHERE name = ?", (name,)
+        ).fetchone()
+
+    def create_playlist(self, name, rule):
+        """
+        Создаёт плейлист и сразу строит его состав. Возвращает ID плейлиста.
+        """
+        rule_json = json.dumps(rule, ensure_ascii=False)
+        compile_rule(rule)  # Ошибка в правиле должна появиться до записи в базу
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cursor = self.connection.execute(
+            "INSERT INTO smart_playlists (name, rule, created_at) VALUES (?, ?, ?)", (name, rule_json, now)
+        )
+        self.connection.commit()
+        self.sync()
+        print(f"Создан умный плейлист «{name}»")
+        return cursor.lastrowid
+
+    def update_rule(self, playlist_id, rule):
+        compile_rule(rule)
+        self.connection.execute(
+            "UPDATE smart_playlists SET rule = ?, rebuilt_on = NULL WHERE id = ?",
+            (json.dumps(rule, ensure_ascii=False), playlist_id)
+        )
+        self.connection.commit()
+        self.sync()
+
+    def delete_playlist(self, playlist_id):
+        conn = self.connection
+        conn.execute("DELETE FROM smart_playlist_tracks WHERE playlist_id = ?", (playlist_id,))
+        conn.execute("DELETE FROM smart_playlists WHERE id = ?", (playlist_id,))
+        conn.commit()
+
+    def tracks(self, playlist_id, limit=-1, offset=0):
+        """
+        Треки плейлиста, новые сверху. Возвращает курсор: строки читаются по мере обхода.
+        """
+        self.sync()
+        return self.connection.execute("""
+            SELECT t.id, t.track_title, t.artist, t.album, t.genre, t.release_year, t.duration, t.file_path
+            FROM smart_playlist_tracks p
+            JOIN downloaded_tracks t ON t.id = p.track_id
+            WHERE p.playlist_id = ?
+            ORDER BY p.completed_at DESC
+            LIMIT ? OFFSET ?
+        """, (playlist_id, limit, offset))
+
+    def export(self, playlist_id, path, relative=True):
+        """
+        Экспорт в M3U/M3U8 (по расширению path). Треки читаются из базы потоком.
+        """
+        return write_m3u(self.tracks(playlist_id), path, relative)
+
+    def count(self, playlist_id):
+        self.sync()
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM smart_playlist_tracks WHERE playlist_id = ?", (playlist_id,)
+        ).fetchone()[0]
+
+    def sync(self):
+        """
+        Применяет накопившиеся изменения библиотеки ко всем плейлистам.
+        Новые плейлисты и плейлисты с правилами от даты пересобираются целиком (последние — раз в день).
+        """
+        today = datetime.date.today().isoformat()
+        with self._lock:
+            conn = self.connection
+            playlists = conn.execute("SELECT id, rule, rebuilt_on FROM smart_playlists").fetchall()
+            has_dirty = conn.execute("SELECT 1 FROM smart_playlist_dirty LIMIT 1").fetchone() is not None
+            stale = [
+                playlist for playlist in playlists
+                if playlist["rebuilt_on"] is None
+                or (playlist["rebuilt_on"] != today and self._compile(playlist)[2])
+            ]
+            if not has_dirty and not stale:
+                return
+
+            # Одна транзакция: после первой записи другие потоки не могут добавить отметки,
+            # поэтому очистка smart_playlist_dirty в конце не теряет изменений
+            try:
+                for playlist in stale:
+                    self._rebuild(playlist, today)
+                if has_dirty:
+                    self._apply_dirty(playlists, {playlist["id"] for playlist in stale})
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _apply_dirty(self, playlists, rebuilt):
+        conn = self.connection
+        conn.execute("""
+            DELETE FROM smart_playlist_tracks
+            WHERE track_id IN (SELECT track_id FROM smart_playlist_dirty)
+            AND playlist_id NOT IN (SELECT value FROM json_each(?))
+        """, (json.dumps(sorted(rebuilt)),))
+        for playlist in playlists:
+            if playlist["id"] in rebuilt:
+                continue
+            where, params, _ = self._compile(playlist)
+            # Правило проверяется только для отмеченных треков: поиск по первичному ключу
+            conn.execute(f"""
+                INSERT OR IGNORE INTO smart_playlist_tracks (playlist_id, track_id, completed_at)
+                SELECT ?, t.id, t.completed_at FROM downloaded_tracks t
+                WHERE t.id IN (SELECT track_id FROM smart_playlist_dirty)
+                AND {_TRACK_AVAILABLE_SQL} AND {where}
+            """, [playlist["id"], *params])
+        conn.execute("DELETE FROM smart_playlist_dirty")
+
+    def _rebuild(self, playlist, today):
+        conn = self.connection
+        where, params, _ = self._compile(playlist)
+        conn.execute("DELETE FROM smart_playlist_tracks WHERE playlist_id = ?", (playlist["id"],))
+        conn.execute(f"""
+            INSERT INTO smart_playlist_tracks (playlist_id, track_id, completed_at)
+            SELECT ?, t.id, t.completed_at FROM downloaded_tracks t
+            WHERE {_TRACK_AVAILABLE_SQL} AND {where}
+        """, [playlist["id"], *params])
+        conn.execute("UPDATE smart_playlists SET rebuilt_on = ? WHERE id = ?", (today, playlist["id"]))
+
+    def _compile(self, playlist):
+        key = (playlist["id"], playlist["rule"])
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            rule = json.loads(playlist["rule"])
+            where, params = compile_rule(rule)
+            compiled = self._compiled[key] = (where, params, is_volatile(rule))
+        return compiled
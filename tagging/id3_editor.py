@@ -0,0 +1,236 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from mutagen.id3 import ID3, ID3NoHeaderError, TIT2, TPE1, TALB, TDRC, TCON, APIC
+
+from config import TAGGING_WORKERS, COVER_CACHE_ENTRIES, COVER_CACHE_DIR, SHUTDOWN_JOIN_TIMEOUT
+from api_clients.http_client import get_download_client
+
+# Отметки о записанных тегах сохраняются в базу пачками такого размера
+TAG_BATCH_SIZE = 50
+
+_COVER_MIME = {".jpg": "image/jpeg", ".png": "image/png"}
+
+
+def write_tags(path, title=None, artist=None, album=None, year=None, genre=None, cover=None):
+    """
+    Записывает ID3-теги в mp3 файл одним сохранением.
+    cover — (данные, mime) обложки или None. Пустые значения не трогают уже имеющиеся теги.
+    """
+    try:
+        tags = ID3(path)
+    except ID3NoHeaderError:
+        tags = ID3()
+
+    for frame_class, value in ((TIT2, title), (TPE1, artist), (TALB, album), (TDRC, year), (TCON, genre)):
+        if value:
+            tags.setall(frame_class.__name__, [frame_class(encoding=3, text=str(value))])
+
+    if cover is not None:
+        data, mime = cover
+        tags.setall("APIC", [APIC(encoding=3, mime=mime, type=3, desc="Cover", data=data)])
+
+    # ID3v2.3 читают и старые плееры, и проводник Windows
+    tags.save(path, v2_version=3)
+
+
+class CoverCache:
+    """
+    Кэш обложек: память (LRU) → папка на диске → сеть.
+    Обложка альбома скачивается один раз, одновременные запросы одной обложки объединяются.
+    """
+
+    def __init__(self, cache_dir=COVER_CACHE_DIR, max_entries=COVER_CACHE_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._memory = OrderedDict()  # url -> (данные, mime)
+        self._pending = {}  # url -> Future
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """
+        Обложка (данные, mime) или None, если её не удалось получить.
+        """
+        if not url:
+            return None
+        with self._lock:
+            cover = self._memory.get(url)
+            if cover is not None:
+                self._memory.move_to_end(url)
+                return cover
+            future = self._pending.get(url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._pending[url] = future
+
+        if not owner:
+            return future.result()
+
+        cover = None
+        try:
+            cover = self._load(url)
+        except (requests.RequestException, OSError) as e:
+            print(f"Не удалось получить обложку {url}: {e}")
+        with self._lock:
+            self._pending.pop(url, None)
+            if cover is not None:
+                self._memory[url] = cover
+                while len(self._memory) > self.max_entries:
+                    self._memory.popitem(last=False)
+        future.set_result(cover)
+        return cover
+
+    def _load(self, url):
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        for ext, mime in _COVER_MIME.items():
+            path = os.path.join(self.cache_dir, name + ext)
+            if os.path.exists(path):
+                with open(path, "rb") as file:
+                    return file.read(), mime
+
+        response = get_download_client().get(url)
+        response.raise_for_status()
+        mime = response.headers.get("Content-Type", "image/jpeg").split(";")[0].strip()
+        ext = ".png" if mime == "image/png" else ".jpg"
+        data = response.content
+        with open(os.path.join(self.cache_dir, name + ext), "wb") as file:
+            file.write(data)
+        return data, _COVER_MIME[ext]
+
+
+class TaggingPipeline:
+    """
+    Запись ID3-тегов в отдельном пуле потоков, чтобы не задерживать скачивание.
+    Задания приходят от загрузчика по завершении скачивания (on_download_finished)
+    или пакетом при обновлении тегов всей библиотеки (retag_library).
+    Недостающие альбом, год, жанр и обложка берутся из metadata (MusicBrainzClient), если он передан.
+    """
+
+    def __init__(self, db_manager, workers=TAGGING_WORKERS, covers=None, metadata=None):
+        self.db_manager = db_manager
+        self.covers = covers or CoverCache()
+        self.metadata = metadata
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tagger")
+        self._lock = threading.Lock()
+        # Оповещает об изменении счётчиков заданий: join и shutdown ждут опустевшей очереди
+        self._changed = threading.Condition(self._lock)
+        self._jobs = 0  # Поставленные и ещё не завершённые задания
+        self._running = 0  # Задания, которые выполняются прямо сейчас
+        self._tagged = []  # ID треков, ещё не отмеченных в базе
+
+    def on_download_finished(self, track_id, file_path):
+        """
+        Слушатель загрузчика: только ставит задание в очередь и сразу возвращается.
+        """
+        self.submit(track_id, shared_file_ok=False)
+
+    def submit(self, track_id, shared_file_ok=True):
+        with self._lock:
+            self._jobs += 1
+        return self._executor.submit(self._run_job, track_id, shared_file_ok)
+
+    def retag_library(self, only_untagged=False):
+        """
+        Ставит в очередь запись тегов для всех скачанных треков. Возвращает количество треков.
+        """
+        track_ids = self.db_manager.get_tracks_for_tagging(only_untagged)
+        for track_id in track_ids:
+            self.submit(track_id)
+        print(f"Запись тегов запланирована для {len(track_ids)} треков")
+        return len(track_ids)
+
+    def join(self, timeout=None):
+        """
+        Ждёт выполнения всех поставленных заданий не дольше timeout секунд.
+        Возвращает True, если очередь опустела.
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self._jobs == 0, timeout)
+
+    def shutdown(self, timeout=SHUTDOWN_JOIN_TIMEOUT):
+        """
+        Останавливает пул перед закрытием подключений к базе: ждёт очередь не дольше timeout секунд,
+        оставшиеся задания отменяет и дожидается уже выполняющихся (столько же времени).
+        Отменённые треки остаются без tagged_at — их подхватит retag_library(only_untagged=True).
+
+        Возвращает True, если все задания выполнены.
+        """
+        drained = self.join(timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if not drained:
+            with self._changed:
+                remaining = self._jobs - self._running
+                finished = self._changed.wait_for(lambda: self._running == 0, timeout)
+            print(f"Запись тегов прервана: отложено заданий {remaining}"
+                  + ("" if finished else f", не завершилось за {timeout} с: {self._running}"))
+        self._flush()
+        return drained
+
+    def _run_job(self, track_id, shared_file_ok):
+        with self._lock:
+            self._running += 1
+        try:
+            if self._tag(track_id, shared_file_ok):
+                with self._lock:
+                    self._tagged.append(track_id)
+        except Exception as e:
+            print(f"Ошибка записи тегов для трека ID {track_id}: {e}")
+        finally:
+            try:
+                with self._lock:
+                    flush = len(self._tagged) >= TAG_BATCH_SIZE or self._jobs == 1
+                if flush:
+                    self._flush()
+            finally:
+                # Счётчики уменьшаются после записи отметок: join не вернётся раньше, чем они в базе
+                with self._changed:
+                    self._jobs -= 1
+                    self._running -= 1
+                    self._changed.notify_all()
+
+    def _flush(self):
+        with self._lock:
+            tagged, self._tagged = self._tagged, []
+        if tagged:
+            self.db_manager.mark_tagged(tagged)
+
+    def _tag(self, track_id, shared_file_ok):
+        track = self.db_manager.get_tag_metadata(track_id)
+        if track is None or not track["file_path"]:
+            return False
+        path = track["file_path"]
+        if not path.lower().endswith(".mp3"):
+            return False
+        if not shared_file_ok and self.db_manager.count_tracks_with_file(path) > 1:
+            # Файл общий с ранее скачанным дубликатом — его теги уже записаны
+            return False
+
+        album, year, genre, artwork_url = track["album"], track["release_year"], track["genre"], track["artwork_url"]
+        if self.metadata is not None and not (album and year and genre and artwork_url):
+            # Запросы к MusicBrainz идут через общую очередь с ограничением частоты и кэшем
+            info = self.metadata.lookup(track["artist"], track["track_title"]).result()
+            if info:
+                album = album or info["album"]
+                year = year or info["release_year"]
+                genre = genre or info["genre"]
+                artwork_url = artwork_url or info["artwork_url"]
+                self.db_manager.update_track_metadata(track_id, album, genre, year, artwork_url)
+
+        cover = self.covers.get(artwork_url)
+        write_tags(
+            path,
+            title=track["track_title"],
+            artist=track["artist"],
+            album=album,
+            year=year,
+            genre=genre,
+            cover=cover
+        )
+        print(f"Теги записаны: {track['artist']} — {track['track_title']}")
+        return True
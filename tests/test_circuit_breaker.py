@@ -0,0 +1,61 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from api_clients.http_client import HttpClient, CircuitBreaker
+
+
+class _ScriptedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        if status == 302:
+            self.send_header("Location", self.path)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class CircuitBreakerProbeTest(unittest.TestCase):
+    """
+    Пробный запрос полуоткрытого автомата всегда снимает отметку пробы:
+    ответ 429 или ошибка requests не оставляют хост закрытым навсегда.
+    """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _ScriptedHandler)
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.host = f"127.0.0.1:{self.server.server_address[1]}"
+        self.url = f"http://{self.host}/search"
+        self.client = HttpClient(max_retries=2, name="test")
+        # Автомат открыт после первого сбоя, пробный запрос разрешён сразу
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        self.client._breakers[self.host] = self.breaker
+        self.breaker.record_failure()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_probe_answered_429_is_retried(self):
+        self.server.statuses = [429, 200]
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_probe_failing_with_other_request_error_releases_host(self):
+        self.server.statuses = [302, 302, 302]
+        self.client.session.max_redirects = 1
+        with self.assertRaises(requests.TooManyRedirects):
+            self.client.get(self.url)
+        self.server.statuses = []
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
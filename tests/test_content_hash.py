@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.fake_soundcloud import FakeSoundCloudServer, FakeSoundCloudSettings
+from database.base_init import initialize_database
+from database.connection import close_all_connections
+from database.db_manager import DatabaseManager
+from download.dedup import hash_file
+from download.downloader import TrackDownloader
+from download.library_scanner import LibraryScanner
+from tagging.id3_editor import write_tags
+
+
+class TaggedFileRelinkTest(unittest.TestCase):
+    """
+    Хэш содержимого не зависит от тегов: помеченный и перенесённый файл сканер находит по хэшу.
+    """
+
+    TRACK_SIZE = 64 * 1024
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.temp_dir.name, "library.db")
+        initialize_database(db_path)
+        self.db = DatabaseManager(db_path)
+        self.server = FakeSoundCloudServer(FakeSoundCloudSettings(track_size=self.TRACK_SIZE))
+        self.server.__enter__()
+        self.download_dir = os.path.join(self.temp_dir.name, "downloads")
+        self.downloader = TrackDownloader(self.db, self.download_dir)
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        close_all_connections()
+        self.temp_dir.cleanup()
+
+    def _track_row(self, track_id):
+        return self.db.connection.execute(
+            "SELECT file_path, file_present, content_hash FROM downloaded_tracks WHERE id = ?", (track_id,)
+        ).fetchone()
+
+    def test_tagged_and_moved_file_is_relinked_by_hash(self):
+        url = f"{self.server.base_url}/audio/9.mp3"
+        self.db.add_track("Relink", "Tester", url, "test:9")
+        track = self.db.claim_next_track()
+        self.downloader.download_track(track["id"], "Relink", "Tester", url)
+        row = self._track_row(track["id"])
+        path, stored_hash = row["file_path"], row["content_hash"]
+
+        write_tags(path, title="Relink", artist="Tester", album="Album", genre="Test")
+        self.assertEqual(hash_file(path), stored_hash)
+
+        # Новое имя не совпадает со старым — найти файл можно только по хэшу
+        moved_dir = os.path.join(self.temp_dir.name, "moved")
+        os.makedirs(moved_dir)
+        moved_path = os.path.join(moved_dir, "renamed.mp3")
+        os.replace(path, moved_path)
+
+        scanner = LibraryScanner(self.db, [self.download_dir, moved_dir])
+        self.assertEqual(scanner.scan_once(), 1)
+        row = self._track_row(track["id"])
+        self.assertEqual(os.path.normcase(os.path.abspath(row["file_path"])), os.path.normcase(moved_path))
+        self.assertEqual(row["file_present"], 1)
+
+    def test_id3v1_tag_does_not_change_hash(self):
+        path = os.path.join(self.temp_dir.name, "plain.mp3")
+        audio = self.server.audio_bytes(3, self.TRACK_SIZE)
+        with open(path, "wb") as file:
+            file.write(audio)
+        plain_hash = hash_file(path)
+
+        with open(path, "ab") as file:
+            file.write(b"TAG" + b"\0" * 125)
+        write_tags(path, title="Tagged")
+        self.assertEqual(hash_file(path), plain_hash)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.fake_soundcloud import FakeSoundCloudServer, FakeSoundCloudSettings
+from database.base_init import initialize_database
+from database.connection import close_all_connections
+from database.db_manager import DatabaseManager
+from download.downloader import TrackDownloader
+from config import PARTIAL_SUFFIX
+
+
+class DownloadResumeTest(unittest.TestCase):
+    """
+    Обрыв соединения посреди файла: трек уходит на повтор, а повтор докачивает .part через Range.
+    Сбой слушателя завершения не меняет статус скачанного трека.
+    """
+
+    TRACK_SIZE = 256 * 1024
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.temp_dir.name, "library.db")
+        initialize_database(db_path)
+        self.db = DatabaseManager(db_path)
+        self.server = FakeSoundCloudServer(FakeSoundCloudSettings(track_size=self.TRACK_SIZE, drop_rate=1.0))
+        self.server.__enter__()
+        self.downloader = TrackDownloader(self.db, os.path.join(self.temp_dir.name, "downloads"))
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_dropped_connection_is_resumed_with_range(self):
+        url = f"{self.server.base_url}/audio/7.mp3"
+        self.db.add_track("Resume", "Tester", url, "test:7")
+        track = self.db.claim_next_track()
+        target = self.downloader.target_path("Resume", "Tester")
+
+        self.downloader.download_track(track["id"], "Resume", "Tester", url)
+
+        row = self.db.connection.execute(
+            "SELECT status, retry_count FROM downloaded_tracks WHERE id = ?", (track["id"],)
+        ).fetchone()
+        self.assertEqual(row["status"], "pending")
+        self.assertEqual(row["retry_count"], 1)
+        part_size = os.path.getsize(target + PARTIAL_SUFFIX)
+        self.assertTrue(0 < part_size < self.TRACK_SIZE)
+
+        self.server.settings.drop_rate = 0.0
+        self.downloader.download_track(track["id"], "Resume", "Tester", url)
+
+        self.assertEqual(self.server.range_headers, [None, f"bytes={part_size}-"])
+        status = self.db.connection.execute(
+            "SELECT status FROM downloaded_tracks WHERE id = ?", (track["id"],)
+        ).fetchone()["status"]
+        self.assertEqual(status, "complete")
+        with open(target, "rb") as file:
+            self.assertEqual(file.read(), self.server.audio_bytes(7, self.TRACK_SIZE))
+        self.assertFalse(os.path.exists(target + PARTIAL_SUFFIX))
+
+    def test_failing_listener_keeps_track_complete(self):
+        self.server.settings.drop_rate = 0.0
+        url = f"{self.server.base_url}/audio/8.mp3"
+        self.db.add_track("Listener", "Tester", url, "test:8")
+        track = self.db.claim_next_track()
+
+        def broken_listener(track_id, file_path):
+            raise RuntimeError("сбой слушателя")
+
+        called = []
+        self.downloader.add_completion_listener(broken_listener)
+        self.downloader.add_completion_listener(lambda track_id, file_path: called.append(track_id))
+        self.downloader.download_track(track["id"], "Listener", "Tester", url)
+
+        row = self.db.connection.execute(
+            "SELECT status, retry_count FROM downloaded_tracks WHERE id = ?", (track["id"],)
+        ).fetchone()
+        self.assertEqual((row["status"], row["retry_count"]), ("complete", 0))
+        self.assertEqual(called, [track["id"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
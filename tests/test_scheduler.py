@@ -0,0 +1,86 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from database.base_init import initialize_database
+from database.connection import close_all_connections
+from database.db_manager import DatabaseManager
+from download.scheduler import DownloadScheduler
+
+
+class DownloadSchedulerTest(unittest.TestCase):
+    """
+    Лимит соединений считается по хосту, который будет скачиваться: треки с transcoding_url
+    и без ссылки на файл группируются по источнику. Запросы к базе не держат блокировку планировщика.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.temp_dir.name, "library.db")
+        initialize_database(db_path)
+        self.db = DatabaseManager(db_path)
+        self.scheduler = DownloadScheduler(self.db, per_host_limit=1, bandwidth_limit=0)
+        self.stop = threading.Event()
+
+    def tearDown(self):
+        close_all_connections()
+        self.temp_dir.cleanup()
+
+    def _enqueue(self, number, source, download_url=None, transcoding_url=None):
+        self.db.add_tracks([{
+            "title": f"Track {number}",
+            "artist": "Tester",
+            "download_url": download_url,
+            "transcoding_url": transcoding_url,
+            "track_id": f"test:{number}",
+            "source": source,
+        }])
+
+    def test_transcoding_tracks_are_limited_by_source(self):
+        self._enqueue(1, "soundcloud", transcoding_url="https://api.example/media/1/stream")
+        self._enqueue(2, "soundcloud", transcoding_url="https://api.example/media/2/stream")
+        self._enqueue(3, "bandcamp", transcoding_url="https://api.other/media/3/stream")
+
+        first = self.scheduler.acquire(self.stop)
+        second = self.scheduler.acquire(self.stop)
+        self.assertEqual(first["track_id"], "test:1")
+        # Второй трек SoundCloud ждёт: источник занят, выдаётся трек другого источника
+        self.assertEqual(second["track_id"], "test:3")
+
+        self.scheduler.release(first)
+        third = self.scheduler.acquire(self.stop)
+        self.assertEqual(third["track_id"], "test:2")
+
+    def test_release_is_not_blocked_by_claim(self):
+        self._enqueue(1, "direct", download_url="https://cdn.example/1.mp3")
+        self._enqueue(2, "direct", download_url="https://cdn.example/2.mp3")
+        first = self.scheduler.acquire(self.stop)
+
+        claiming = threading.Event()
+        released = threading.Event()
+        claim_next_track = self.db.claim_next_track
+
+        def slow_claim(**kwargs):
+            # Имитация долгого ожидания блокировки SQLite
+            claiming.set()
+            released.wait(5)
+            return claim_next_track(**kwargs)
+
+        self.db.claim_next_track = slow_claim
+        result = {}
+        worker = threading.Thread(target=lambda: result.update(track=self.scheduler.acquire(self.stop)))
+        worker.start()
+        self.assertTrue(claiming.wait(5))
+
+        releaser = threading.Thread(target=self.scheduler.release, args=(first,))
+        releaser.start()
+        releaser.join(1)
+        self.assertFalse(releaser.is_alive())
+        released.set()
+        worker.join(5)
+        self.assertEqual(result["track"]["track_id"], "test:2")
+
+
+if __name__ == "__main__":
+    unittest.main()
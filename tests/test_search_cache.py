@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from database.base_init import initialize_database
+from database.connection import close_all_connections
+from database.search_cache import SearchCache
+
+
+class SearchCacheEvictionTest(unittest.TestCase):
+    """
+    С диска вытесняются давно не использованные запросы, даже если частые запросы
+    отдаются из памяти и до базы не доходят.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, "library.db")
+        initialize_database(self.db_path)
+
+    def tearDown(self):
+        close_all_connections()
+        self.temp_dir.cleanup()
+
+    def test_memory_hits_keep_query_on_disk(self):
+        results = ["x" * 100]
+        # На диске помещаются две записи, в памяти — обе
+        cache = SearchCache(self.db_path, memory_entries=2, max_bytes=250)
+        cache.put("test", "frequent", 10, results)
+        cache.put("test", "rare", 10, results)
+        self.assertEqual(cache.get("test", "frequent", 10), results)
+
+        cache.put("test", "new", 10, results)
+
+        # После перезапуска память пуста: остаться должны частый и новый запросы
+        restarted = SearchCache(self.db_path, memory_entries=2, max_bytes=250)
+        self.assertEqual(restarted.get("test", "frequent", 10), results)
+        self.assertIsNone(restarted.get("test", "rare", 10))
+        self.assertEqual(restarted.get("test", "new", 10), results)
+
+    def test_total_size_follows_replacements_and_eviction(self):
+        cache = SearchCache(self.db_path, memory_entries=4, max_bytes=250)
+        cache.put("test", "a", 10, ["x" * 100])
+        cache.put("test", "a", 10, ["x" * 50])
+        cache.put("test", "b", 10, ["x" * 100])
+        cache.put("test", "c", 10, ["x" * 100])
+        stored = cache.connection.execute("SELECT COALESCE(SUM(size), 0) FROM search_cache").fetchone()[0]
+        self.assertEqual(cache._total_bytes, stored)
+        self.assertLessEqual(stored, 250)
+
+
+if __name__ == "__main__":
+    unittest.main()
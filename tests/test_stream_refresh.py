@@ -0,0 +1,76 @@
+import os
+import tempfile
+import time
+import unittest
+
+from benchmarks.fake_soundcloud import FakeSoundCloudServer, FakeSoundCloudSettings
+from database.base_init import initialize_database
+from database.connection import close_all_connections
+from database.db_manager import DatabaseManager
+from download.downloader import TrackDownloader
+
+
+class StreamUrlRefreshTest(unittest.TestCase):
+    """
+    Трек в очереди хранит transcoding URL: загрузчик получает свежую ссылку на поток,
+    если сохранённой нет, она истекла или сервер отклонил её ответом 403.
+    """
+
+    TRACK_SIZE = 64 * 1024
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.temp_dir.name, "library.db")
+        initialize_database(db_path)
+        self.db = DatabaseManager(db_path)
+        self.server = FakeSoundCloudServer(FakeSoundCloudSettings(track_size=self.TRACK_SIZE))
+        self.server.__enter__()
+        self.downloader = TrackDownloader(self.db, os.path.join(self.temp_dir.name, "downloads"))
+
+    def tearDown(self):
+        self.downloader.stream_resolver.shutdown()
+        self.server.__exit__(None, None, None)
+        close_all_connections()
+        self.temp_dir.cleanup()
+
+    def _enqueue(self, number, download_url):
+        self.db.add_tracks([{
+            "title": f"Track {number}",
+            "artist": "Tester",
+            "download_url": download_url,
+            "transcoding_url": f"{self.server.base_url}/media/{number}/stream/progressive",
+            "track_id": f"test:{number}",
+        }])
+
+    def _track_row(self, number):
+        return self.db.connection.execute(
+            "SELECT status, url FROM downloaded_tracks WHERE track_id = ?", (f"test:{number}",)
+        ).fetchone()
+
+    def test_missing_and_expired_links_are_resolved_before_download(self):
+        self._enqueue(1, None)
+        self._enqueue(2, f"{self.server.base_url}/audio/2.mp3?Expires={int(time.time()) - 10}&Signature=old")
+
+        self.downloader.process_downloads()
+
+        for number in (1, 2):
+            row = self._track_row(number)
+            self.assertEqual(row["status"], "complete")
+            self.assertIn("Expires=", row["url"])
+            self.assertNotIn("Signature=old", row["url"])
+        # Истёкшая ссылка не запрашивалась: обе загрузки — с первой попытки по свежей ссылке
+        self.assertEqual(self.server.range_headers, [None, None])
+
+    def test_revoked_link_is_refreshed_after_403(self):
+        self.server.revoked_signatures.add("revoked")
+        self._enqueue(3, f"{self.server.base_url}/audio/3.mp3?Expires={int(time.time()) + 3600}&Signature=revoked")
+
+        self.downloader.process_downloads()
+
+        row = self._track_row(3)
+        self.assertEqual(row["status"], "complete")
+        self.assertNotIn("Signature=revoked", row["url"])
+
+
+if __name__ == "__main__":
+    unittest.main()
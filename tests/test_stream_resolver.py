@@ -0,0 +1,51 @@
+import threading
+import unittest
+
+from api_clients.soundcloud_client import StreamUrlResolver
+
+
+class StreamUrlResolverTest(unittest.TestCase):
+    """
+    Ссылки для загрузчика получаются раньше фоновой предвыборки, кэш ссылок ограничен.
+    """
+
+    def setUp(self):
+        self.order = []
+        self.gate = threading.Event()
+
+    def _resolve(self, transcoding_url):
+        if transcoding_url == "busy":
+            self.gate.wait(5)
+        self.order.append(transcoding_url)
+        return f"https://cdn.invalid/{transcoding_url}.mp3"
+
+    def test_submit_runs_before_queued_prefetch(self):
+        resolver = StreamUrlResolver(self._resolve, max_workers=1)
+        busy = resolver.submit("busy", "busy")
+        resolver.prefetch([(f"p{i}", f"p{i}") for i in range(5)])
+        bumped = resolver.submit("p3", "p3")
+        urgent = resolver.submit("now", "now")
+        self.gate.set()
+
+        self.assertEqual(urgent.result(5), "https://cdn.invalid/now.mp3")
+        self.assertEqual(bumped.result(5), "https://cdn.invalid/p3.mp3")
+        resolver.submit("p4", "p4").result(5)
+        busy.result(5)
+        self.assertEqual(self.order[:3], ["busy", "p3", "now"])
+        # Поднятое задание выполнено один раз
+        self.assertEqual(sorted(self.order), sorted(["busy", "now"] + [f"p{i}" for i in range(5)]))
+        resolver.shutdown()
+
+    def test_cache_is_bounded(self):
+        self.gate.set()
+        resolver = StreamUrlResolver(self._resolve, max_workers=1, max_entries=3)
+        for i in range(6):
+            resolver.resolve(f"t{i}", f"t{i}", timeout=5)
+        self.assertEqual(len(resolver._cache), 3)
+        self.assertIsNone(resolver.cached("t0"))
+        self.assertEqual(resolver.cached("t5"), "https://cdn.invalid/t5.mp3")
+        resolver.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import Future
+
+from database.base_init import initialize_database
+from database.connection import close_all_connections
+from database.db_manager import DatabaseManager
+from tagging.id3_editor import TaggingPipeline
+
+
+class _NoCovers:
+    def get(self, url):
+        return None
+
+
+class _SlowMetadata:
+    """
+    Заменяет MusicBrainz: каждый ответ приходит через delay секунд.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def lookup(self, artist, title):
+        time.sleep(self.delay)
+        future = Future()
+        future.set_result(None)
+        return future
+
+
+class TaggingShutdownTest(unittest.TestCase):
+    """
+    Остановка пула записи тегов: очередь дописывается с ограничением по времени,
+    отменённые задания подхватывает retag_library(only_untagged=True).
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.temp_dir.name, "library.db")
+        initialize_database(db_path)
+        self.db = DatabaseManager(db_path)
+        self.track_ids = []
+        for number in range(3):
+            path = os.path.join(self.temp_dir.name, f"track{number}.mp3")
+            with open(path, "wb") as file:
+                file.write(os.urandom(4096))
+            self.db.add_track(f"Track {number}", "Tester", f"http://example.invalid/{number}.mp3", f"test:{number}")
+            track = self.db.claim_next_track()
+            self.db.update_track_status(track["id"], "complete", path)
+            self.track_ids.append(track["id"])
+
+    def tearDown(self):
+        close_all_connections()
+        self.temp_dir.cleanup()
+
+    def _untagged(self):
+        return self.db.get_tracks_for_tagging(only_untagged=True)
+
+    def _pipeline(self, delay):
+        return TaggingPipeline(self.db, workers=1, covers=_NoCovers(), metadata=_SlowMetadata(delay))
+
+    def test_shutdown_waits_for_queued_jobs(self):
+        tagger = self._pipeline(0.05)
+        tagger.retag_library()
+        self.assertTrue(tagger.shutdown(timeout=5))
+        self.assertEqual(self._untagged(), [])
+
+    def test_cancelled_jobs_are_picked_up_by_next_run(self):
+        tagger = self._pipeline(0.3)
+        tagger.retag_library()
+        self.assertFalse(tagger.shutdown(timeout=0.25))
+        # Выполнявшееся задание закончилось и отмечено, остальные отменены без отметки
+        self.assertEqual(self._untagged(), self.track_ids[1:])
+
+        tagger = self._pipeline(0.0)
+        self.assertEqual(tagger.retag_library(only_untagged=True), 2)
+        self.assertTrue(tagger.shutdown(timeout=5))
+        self.assertEqual(self._untagged(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()